@@ -0,0 +1,86 @@
+# Stations per second of the batched gradient solve (gradient_linear_batch)
+# against the per-file gradient_linear loop on synthetic 2 and 3 level
+# stations. Both run on parsed data held in memory, the loop is timed on at
+# most 1000 stations. The batch rate includes building the Observations.
+# Usage: python benchmarks/bench_gradient_batch.py [number_of_stations ...]
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gradmap_calc import Observations, convert_CG5_units, gradient_linear, gradient_linear_batch
+
+# Levels (heights in cm, as in CG5 files) of 2 and 3 level stations
+LEVEL_HEIGHTS = {2: [25.0, 130.0], 3: [25.0, 75.0, 130.0]}
+
+
+class ParsedSurveys:
+    # Stands in for gradmap_cache.SurveyCache, parsed data of every
+    # (synthetic) file comes from memory
+    def __init__(self, surveys):
+        self.surveys = surveys
+
+    def parse(self, parse_function, input_file, header_lines=None):
+        return self.surveys[input_file], {}
+
+
+def synthetic_station(rng, number_of_levels, visits=8, readings_per_visit=5):
+    # parse_CG5 columns of one station: levels visited in turn, gradient
+    # around -300 μGal/m, quadratic drift and 5 μGal noise
+    levels = np.tile(np.arange(number_of_levels), visits)[:visits]
+    levels = np.repeat(levels, readings_per_visit)
+    height = np.array(LEVEL_HEIGHTS[number_of_levels])[levels] + rng.normal(0, 0.1, len(levels))
+
+    seconds = np.arange(len(levels)) * 70 + np.repeat(np.arange(visits) * 300, readings_per_visit)
+    datetime = np.datetime64('2023-07-18T08:00:00') + seconds.astype('timedelta64[s]')
+    datenum = datetime.astype(np.int64) / (24 * 3600)
+    days = seconds / 86400
+
+    gradient = rng.normal(-300, 20)
+    grav = (5e6 + gradient * (height - 21.1) / 100 + rng.normal(0, 300) * days + rng.normal(0, 500) * days**2
+            + rng.normal(0, 5, len(levels))) / 1000
+
+    return {'points': np.array([f'{level + 1}' for level in levels]), 'height': height, 'grav': grav,
+            'SD': rng.uniform(0.004, 0.008, len(levels)), 'datetime': datetime, 'datenum': datenum}, gradient
+
+
+def main(station_counts, loop_limit=1000):
+    rng = np.random.default_rng(0)
+    print(f'{"stations":>9} {"loop [stations/s]":>18} {"batch [stations/s]":>19} {"speedup":>8} {"max |Δ gradient|":>17} {"RMS error":>10}')
+
+    for number_of_stations in station_counts:
+        surveys = {}
+        truth = np.empty(number_of_stations)
+        for index in range(number_of_stations):
+            surveys[f'station_{index}'], truth[index] = synthetic_station(rng, 2 if index % 4 else 3)
+        cache = ParsedSurveys(surveys)
+        names = list(surveys)
+
+        # Per-file loop
+        looped = names[:loop_limit]
+        start = time.perf_counter()
+        loop_gradient = np.array([gradient_linear(name, None, None, 0, None, 1, 2, 5, cache=cache)['gradient']['average_gradient_num']
+                                  for name in looped])
+        loop_rate = len(looped) / (time.perf_counter() - start)
+
+        # Batched solve
+        start = time.perf_counter()
+        observations = []
+        for survey in surveys.values():
+            height, grav, ERR = convert_CG5_units(survey['height'], survey['grav'], survey['SD'])
+            observations.append(Observations(survey['points'], grav, ERR, height, survey['datenum'], survey['datetime']))
+        batch = gradient_linear_batch(observations, significance=2, SD00=5)
+        batch_rate = number_of_stations / (time.perf_counter() - start)
+
+        difference = np.max(np.abs(batch['gradient'][:len(looped)] - loop_gradient))
+        error = np.sqrt(np.mean((batch['gradient'] - truth)**2))
+
+        print(f'{number_of_stations:>9} {loop_rate:>18.0f} {batch_rate:>19.0f} {batch_rate / loop_rate:>8.1f} {difference:>17.2e} {error:>10.2f}')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10, 1000, 100000])
@@ -0,0 +1,66 @@
+# Network adjustment of synthetic campaigns: lines of stations measured twice
+# on different days, each line starts on the last station of the previous one
+# and is tied to a random earlier station.
+# Usage: python benchmarks/bench_network.py [number_of_stations ...]
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gradmap_calc import Observations
+from gradmap_network import network_adjustment
+
+
+def synthetic_campaign(number_of_stations, stations_per_loop=10, readings_per_visit=4, seed=0):
+    # Returns observations of all lines and the true gravity of the stations
+    rng = np.random.default_rng(seed)
+    true_gravity = np.concatenate([[0], rng.normal(0, 20000, number_of_stations - 1)])
+    names = np.array([f'{station:05d}' for station in range(number_of_stations)])
+
+    observations = []
+    first = 0
+    while first < number_of_stations - 1:
+        # Line of new stations measured twice in the same order, starting on
+        # the last station of the previous line and tied to a random station
+        # measured before
+        stations = np.arange(first, min(first + stations_per_loop, number_of_stations))
+        stations = np.append(stations, rng.integers(0, first + 1))
+        visits = np.concatenate([stations, stations])
+        station = np.repeat(visits, readings_per_visit)
+
+        minutes = np.arange(len(station)) * 2 + np.repeat(np.arange(len(visits)) * 15, readings_per_visit)
+        datenum = 19556 + len(observations) + minutes / 1440
+        drift = rng.normal(0, 200) * (datenum - datenum[0]) + rng.normal(0, 20) * (datenum - datenum[0])**2
+        ERR = rng.uniform(3, 8, len(station))
+
+        grav = 5e6 + true_gravity[station] + drift + rng.normal(0, 1, len(station)) * ERR
+        observations.append(Observations(names[station], grav, ERR, np.zeros(len(station)), datenum))
+        first = stations[-2]
+
+    return observations, names, true_gravity
+
+
+def main(station_counts):
+    print(f'{"stations":>9} {"files":>7} {"readings":>9} {"parameters":>11} {"time [s]":>9} {"max |error| [μGal]":>19} {"max |error|/SD":>15}')
+    for number_of_stations in station_counts:
+        observations, names, true_gravity = synthetic_campaign(number_of_stations)
+
+        start = time.perf_counter()
+        network = network_adjustment(observations)
+        elapsed = time.perf_counter() - start
+
+        # Fixed station 00000 has true gravity 0
+        order = np.argsort(network['points']['ID'])
+        error = np.abs(network['points']['gravity'][order] - true_gravity[np.argsort(names)])
+        normalized = error[1:] / network['points']['std'][order][1:]
+
+        print(f"{number_of_stations:>9} {len(observations):>7} {network['processing']['number_of_measurements']:>9} "
+              f"{network['processing']['number_of_parameters']:>11} {elapsed:>9.2f} {error.max():>19.1f} {normalized.max():>15.1f}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000])
@@ -0,0 +1,67 @@
+# Benchmark of the CG5 reader against the previous pandas regex/lambda path.
+# Usage: python benchmarks/bench_read_CG5.py [number_of_rows ...]
+
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gradmap_calc import read_CG5
+
+TESTFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'testfile.txt')
+HEADER_LINES = 34
+
+
+def read_CG5_legacy(input_file, header_lines):
+    # Previous implementation: regex delimiter, string concatenation of date
+    # and time and a row-wise timestamp conversion
+    filedata = pd.read_csv(input_file, header=header_lines, delimiter=r'\s+',
+                           names=['col1', 'points', 'height', 'grav', 'SD', 'tiltx', 'tilty', 'temp_corr', 'tide_corr', 'duration', 'rejected', 'time', 'dn', 'terrain_col', 'date'],
+                           dtype={'points': str, 'height': float, 'time': str})
+    filedata['datetime'] = pd.to_datetime(filedata['date'] + ' ' + filedata['time'], format='%Y/%m/%d %H:%M:%S')
+    filedata['datenum'] = filedata['datetime'].apply(lambda x: x.timestamp() / (24 * 3600))
+    return filedata
+
+
+def write_large_file(path, number_of_rows):
+    # Header of the test file followed by its data rows repeated
+    with open(TESTFILE) as file:
+        lines = file.read().splitlines()
+    header, rows = lines[:HEADER_LINES], [line for line in lines[HEADER_LINES:] if line.strip()]
+
+    with open(path, 'w') as file:
+        file.write('\n'.join(header) + '\n')
+        for i in range(number_of_rows):
+            file.write(rows[i % len(rows)] + '\n')
+
+
+def best_time(function, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(row_counts):
+    print(f'{"rows":>10} {"legacy [s]":>12} {"read_CG5 [s]":>14} {"speedup":>9} {"rows/s":>12}')
+    with tempfile.TemporaryDirectory() as directory:
+        for number_of_rows in row_counts:
+            path = os.path.join(directory, f'cg5_{number_of_rows}.txt')
+            write_large_file(path, number_of_rows)
+
+            # pandas header counts non-blank lines, the test file has two
+            # blank header lines
+            legacy = best_time(lambda: read_CG5_legacy(path, HEADER_LINES - 3))
+            new = best_time(lambda: read_CG5(path, HEADER_LINES, None, 0))
+
+            print(f'{number_of_rows:>10} {legacy:>12.4f} {new:>14.4f} {legacy / new:>8.1f}x {number_of_rows / new:>12.0f}')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
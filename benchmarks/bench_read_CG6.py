@@ -0,0 +1,95 @@
+# Parse throughput of the CG6 reader on synthetic continuous (1 Hz) surveys.
+# Usage: python benchmarks/bench_read_CG6.py [hours ...]
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gradmap_calc import read_CG6
+
+CG6_HEADER = """/\t\tCG-6 Survey
+/\tSurvey Name:\tbenchmark
+/\tInstrument Serial Number:\t0172
+/\tCreated:\t2023-07-18 12:00:00
+/\tOperator:\tgradmap
+/\tGcal1 [mGal]:\t8226.1107
+/\tGoff Factor [mGal]:\t9796.3269
+/\tGcal2 [mGal/V]:\t1.000000
+/\tGoff [ADU]:\t0.000000
+/\tX Scale [arc-sec/V]:\t66.99
+/\tY Scale [arc-sec/V]:\t66.87
+/\tX Offset [ADU]:\t0.0
+/\tY Offset [ADU]:\t0.0
+/\tTemperature Coefficient [mGal/mK]:\t0.1308
+/\tTemperature Scale [mK/V]:\t2.2500
+/\tDrift Rate [mGal/day]:\t0.1980
+/\tDrift Zero Time:\t2023-07-01 00:00:00
+/\tFirmware Version:\t1.3.0
+
+/Station\tDate\tTime\tCorrGrav\tLine\tStdDev\tStdErr\tRawGrav\tX\tY\tSensorTemp\tTideCorr\tTiltCorr\tTempCorr\tDriftCorr\tMeasurDur\tInstrHeight\tLatUser\tLonUser\tElevUser\tLatGPS\tLonGPS\tElevGPS\tCorrections[drift-temp-na-tide-tilt]
+"""
+
+
+def write_CG6_file(path, hours, rate=1.0, seed=0):
+    # Continuous survey alternating between two levels every 5 minutes,
+    # one reading per 1/rate seconds
+    rng = np.random.default_rng(seed)
+    number_of_rows = int(hours * 3600 * rate)
+    seconds = np.arange(number_of_rows) / rate
+
+    level = (seconds // 300).astype(int) % 2
+    datetime = np.datetime64('2023-07-18T12:00:00') + seconds.astype('timedelta64[s]')
+    dates = np.datetime_as_string(datetime, unit='D')
+    times = np.char.partition(np.datetime_as_string(datetime, unit='s'), 'T')[:, 2]
+
+    grav = 5081.3 - 0.3 * level + 0.002 * seconds / 3600 + rng.normal(0, 0.01, number_of_rows)
+    tide = 0.05 * np.sin(2 * np.pi * seconds / 44714)
+
+    columns = [np.where(level == 0, '963.0300293', '963.0310059'), dates, times,
+               np.char.mod('%.4f', grav), np.zeros(number_of_rows, dtype=int).astype(str),
+               np.char.mod('%.4f', rng.uniform(0.03, 0.06, number_of_rows)),
+               np.char.mod('%.4f', rng.uniform(0.004, 0.008, number_of_rows)),
+               np.char.mod('%.4f', grav + 0.01), np.char.mod('%.1f', rng.normal(0, 3, number_of_rows)),
+               np.char.mod('%.1f', rng.normal(0, 3, number_of_rows)), np.char.mod('%.5f', rng.normal(0, 0.0005, number_of_rows)),
+               np.char.mod('%.4f', tide), np.char.mod('%.4f', np.zeros(number_of_rows)), np.char.mod('%.4f', np.zeros(number_of_rows)),
+               np.char.mod('%.4f', np.zeros(number_of_rows)), np.full(number_of_rows, '1'),
+               np.where(level == 0, '0.2510', '1.1350'), np.full(number_of_rows, '48.2000'), np.full(number_of_rows, '17.1000'),
+               np.full(number_of_rows, '150.00'), np.full(number_of_rows, '48.2001'), np.full(number_of_rows, '17.1002'),
+               np.full(number_of_rows, '151.2'), np.full(number_of_rows, '11011')]
+
+    with open(path, 'w') as file:
+        file.write(CG6_HEADER)
+        file.write('\n'.join('\t'.join(row) for row in zip(*columns)) + '\n')
+
+    return number_of_rows
+
+
+def best_time(function, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(hours_list):
+    print(f'{"hours":>6} {"rows":>10} {"size [MB]":>10} {"read_CG6 [s]":>13} {"rows/s":>12} {"MB/s":>8}')
+    with tempfile.TemporaryDirectory() as directory:
+        for hours in hours_list:
+            path = os.path.join(directory, f'cg6_{hours}h.dat')
+            number_of_rows = write_CG6_file(path, hours)
+            size = os.path.getsize(path) / 1024**2
+
+            elapsed = best_time(lambda: read_CG6(path))
+
+            print(f'{hours:>6g} {number_of_rows:>10} {size:>10.1f} {elapsed:>13.4f} {number_of_rows / elapsed:>12.0f} {size / elapsed:>8.1f}')
+
+
+if __name__ == '__main__':
+    main([float(arg) for arg in sys.argv[1:]] or [1, 8, 24])
@@ -0,0 +1,52 @@
+# Shared fixtures of the benchmark suite: synthetic survey files written once
+# per session with known truth (gradmap_synthetic).
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gradmap_synthetic import gradient_setups, line_setups, synthetic_survey, write_CG5, write_CG6
+
+# Readings of the files timed across sizes (scaling curves)
+SIZES = [100, 1000, 10000, 100000]
+
+# Truth of the generated surveys
+GRADIENT = -320.0
+GRADIENT_QUADRATIC = 15.0
+LINE_GRAVITY = [0.0, 12000.0, -3500.0, 800.0, 25000.0]
+
+
+@pytest.fixture(scope='session')
+def survey_files(tmp_path_factory):
+    # Returns a function (kind, number_of_readings, instrument) -> (path,
+    # survey); kinds are 'gradient' (2 levels), 'function' (3 levels with a
+    # quadratic term) and 'line' (5 points there and back)
+    directory = tmp_path_factory.mktemp('surveys')
+    files = {}
+
+    def survey_file(kind, number_of_readings=1000, instrument='CG5'):
+        key = (kind, number_of_readings, instrument)
+        if key not in files:
+            readings_per_setup = 5
+            setups = max(number_of_readings // readings_per_setup, 4)
+            if kind == 'gradient':
+                survey = synthetic_survey(*gradient_setups((0.25, 1.30), setups), gradient=GRADIENT, noise=3,
+                                          readings_per_setup=readings_per_setup, reading_interval=5, setup_interval=30)
+            elif kind == 'function':
+                survey = synthetic_survey(*gradient_setups((0.25, 0.75, 1.30), setups), gradient=GRADIENT,
+                                          gradient_quadratic=GRADIENT_QUADRATIC, noise=3,
+                                          readings_per_setup=readings_per_setup, reading_interval=5, setup_interval=30)
+            else:
+                names, points, heights = line_setups(len(LINE_GRAVITY), repeats=max(setups // (len(LINE_GRAVITY) - 1), 2))
+                survey = synthetic_survey(names, points, heights, point_gravity=LINE_GRAVITY, noise=3,
+                                          readings_per_setup=readings_per_setup, reading_interval=5, setup_interval=30)
+
+            path = str(directory / f'{kind}_{number_of_readings}.{instrument.lower()}.txt')
+            (write_CG5 if instrument == 'CG5' else write_CG6)(path, survey)
+            files[key] = path, survey
+        return files[key]
+
+    return survey_file
@@ -0,0 +1,73 @@
+# Background batch jobs (GUI processing): results are polled without
+# blocking, every file ends done, failed or cancelled and the shared writer
+# gets the records of the processed files.
+# Usage: python -m pytest benchmarks/test_batch_job.py
+
+import time
+
+from gradmap_batch import BatchJob
+from gradmap_report import ResultWriter
+
+SETTINGS = {'header_lines': None, 'calibration_factor': None, 'SD_scale_information': 0, 'number_of_measured_levels': None,
+            'input_units_option': 1, 'significance': 2, 'SD00': 5}
+
+
+def wait(job, timeout=60):
+    results = []
+    deadline = time.perf_counter() + timeout
+    while not job.finished():
+        assert time.perf_counter() < deadline
+        results.extend(job.poll())
+        time.sleep(0.01)
+    return results
+
+
+def test_job_progress_and_report(survey_files, tmp_path):
+    paths = [survey_files('gradient', 1000)[0], str(tmp_path / 'missing.txt'), survey_files('function', 1000)[0]]
+    report = str(tmp_path / 'report.txt')
+
+    writer = ResultWriter(report, shared=True)
+    writer.start()
+    job = BatchJob(paths, 'linear', SETTINGS, max_workers=2, output_queue=writer.queue, record_options={'parts': writer.parts()})
+    job.start()
+    assert set(job.status()) <= {'queued', 'running'}
+
+    results = wait(job)
+    writer.close(lambda writer: [f'files: {writer.number_of_files}, failed: {writer.failed_files}'])
+
+    assert sorted(result['index'] for result in results) == [0, 1, 2]
+    assert job.status() == ['done', 'failed', 'done']
+    assert all(result['wall_time'] >= 0 for result in results)
+    assert open(report, encoding='utf-8').read().startswith('files: 3, failed: 1\n')
+
+
+def test_cancel_drops_queued_files(survey_files):
+    paths = [survey_files('gradient', 10000)[0]] * 8
+    job = BatchJob(paths, 'linear', SETTINGS, max_workers=1)
+    job.start()
+    job.cancel()
+
+    results = wait(job)
+    states = job.status()
+    assert len(results) == len(paths)
+    assert states.count('cancelled') > 0
+    assert set(states) <= {'done', 'cancelled'}
+
+
+def test_shutdown_waits_for_running_files(survey_files, tmp_path):
+    paths = [survey_files('gradient', 10000)[0]] * 8
+    report = str(tmp_path / 'report.txt')
+
+    writer = ResultWriter(report, shared=True)
+    writer.start()
+    job = BatchJob(paths, 'linear', SETTINGS, max_workers=1, output_queue=writer.queue, record_options={'parts': writer.parts()})
+    job.start()
+    results = job.shutdown()
+    writer.close()
+
+    # Nothing is left running, the report has every file that was processed
+    states = job.status()
+    assert job.finished()
+    assert len(results) == len(paths)
+    assert set(states) <= {'done', 'cancelled'}
+    assert writer.number_of_files == states.count('done')
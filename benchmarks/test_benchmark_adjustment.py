@@ -0,0 +1,71 @@
+# pytest-benchmark suite of the readers and adjustment routines on synthetic
+# files of SIZES readings. Timings of one routine form a benchmark group
+# (scaling curve), the peak traced memory of a call is kept in extra_info.
+# Usage: python -m pytest benchmarks/test_benchmark_adjustment.py --benchmark-save=baseline
+#        python -m pytest benchmarks/test_benchmark_adjustment.py --benchmark-compare --benchmark-compare-fail=mean:10%
+
+import tracemalloc
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from conftest import SIZES
+from gradmap_calc import gradient_function, gradient_linear, gravity_differences, read_CG5, read_CG6
+
+
+def peak_memory(function, *args, **kwargs):
+    # Peak memory (MB) allocated by one call, traced by tracemalloc
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1] / 1024**2
+    finally:
+        tracemalloc.stop()
+
+
+def run(benchmark, function, *args, **kwargs):
+    benchmark.extra_info['peak_memory_MB'] = peak_memory(function, *args, **kwargs)
+    return benchmark(function, *args, **kwargs)
+
+
+@pytest.mark.benchmark(group='read_CG5')
+@pytest.mark.parametrize('number_of_readings', SIZES)
+def test_read_CG5(benchmark, survey_files, number_of_readings):
+    path, survey = survey_files('gradient', number_of_readings)
+    filedata = run(benchmark, read_CG5, path)
+    assert len(filedata) == len(survey['grav'])
+
+
+@pytest.mark.benchmark(group='read_CG6')
+@pytest.mark.parametrize('number_of_readings', SIZES)
+def test_read_CG6(benchmark, survey_files, number_of_readings):
+    path, survey = survey_files('gradient', number_of_readings, 'CG6')
+    filedata = run(benchmark, read_CG6, path)
+    assert len(filedata) == len(survey['grav'])
+
+
+@pytest.mark.benchmark(group='gradient_linear')
+@pytest.mark.parametrize('number_of_readings', SIZES)
+def test_gradient_linear(benchmark, survey_files, number_of_readings):
+    path, survey = survey_files('gradient', number_of_readings)
+    output = run(benchmark, gradient_linear, path, None, None, 0, None, 1, 2, 5)
+    assert abs(output['gradient']['average_gradient_num'] - survey['truth']['gradient']) < 3 * output['gradient']['std_num'] + 1
+
+
+@pytest.mark.benchmark(group='gradient_function')
+@pytest.mark.parametrize('number_of_readings', SIZES)
+def test_gradient_function(benchmark, survey_files, number_of_readings):
+    path, survey = survey_files('function', number_of_readings)
+    output = run(benchmark, gradient_function, path, None, None, 0, 1, 2, 5)
+    parameters, std = output['gradient']['gradient_param'], output['gradient']['std']
+    assert abs(parameters[0] - survey['truth']['gradient']) < 3 * std[0] + 1
+
+
+@pytest.mark.benchmark(group='gravity_differences')
+@pytest.mark.parametrize('number_of_readings', SIZES)
+def test_gravity_differences(benchmark, survey_files, number_of_readings):
+    path, survey = survey_files('line', number_of_readings)
+    output = run(benchmark, gravity_differences, path, None, 2, 0, 'CG5', None)
+    truth = list(survey['truth']['point_gravity'].values())
+    assert abs(output['adjusted']['differences'][0] - (truth[1] - truth[0])) < 3 * output['adjusted']['std'][0] + 1
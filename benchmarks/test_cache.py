@@ -0,0 +1,121 @@
+# Survey cache: hits skip parsing, changed files are parsed again, the
+# running size stays exact, least recently used entries are evicted first
+# and only complete entries are ever visible.
+# Usage: python -m pytest benchmarks/test_cache.py
+
+import os
+import shutil
+
+import numpy as np
+
+from gradmap_cache import SurveyCache
+from gradmap_calc import parse_CG5
+
+calls = []
+
+
+def counting_parse(input_file, header_lines=None):
+    calls.append(input_file)
+    return parse_CG5(input_file, header_lines)
+
+
+def entry_of(cache, path):
+    return cache._entry_directory(counting_parse, path, None)
+
+
+def test_hit_skips_parsing(survey_files, tmp_path):
+    path, _ = survey_files('gradient', 1000)
+    cache = SurveyCache(tmp_path / 'cache')
+    calls.clear()
+
+    parsed, header = cache.parse(counting_parse, path)
+    cached, cached_header = cache.parse(counting_parse, path)
+
+    assert calls == [path]
+    assert cached_header == header
+    assert cached.keys() == parsed.keys()
+    for name in parsed:
+        np.testing.assert_array_equal(cached[name], parsed[name])
+
+
+def test_changed_file_is_parsed_again(survey_files, tmp_path):
+    source, _ = survey_files('gradient', 1000)
+    path = str(tmp_path / 'survey.txt')
+    shutil.copy(source, path)
+    cache = SurveyCache(tmp_path / 'cache')
+    calls.clear()
+
+    cache.parse(counting_parse, path)
+
+    # New mtime, same content: rehashed but still a hit
+    status = os.stat(path)
+    os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns + 10**9))
+    cache.parse(counting_parse, path)
+    assert len(calls) == 1
+
+    # New size: parsed again into a new entry
+    with open(path, 'a') as file:
+        file.write('/ appended comment\n')
+    cache.parse(counting_parse, path)
+    assert len(calls) == 2
+    assert len(os.listdir(tmp_path / 'cache' / 'entries')) == 2
+
+
+def test_running_size_matches_scan(survey_files, tmp_path):
+    cache = SurveyCache(tmp_path / 'cache')
+    for kind in ('gradient', 'function', 'line'):
+        cache.parse(counting_parse, survey_files(kind, 1000)[0])
+
+    assert cache._size == cache.size() > 0
+
+
+def test_least_recently_used_entry_is_evicted(survey_files, tmp_path):
+    # Copies of one survey that differ by a trailing comment only, entries of equal size
+    source, _ = survey_files('gradient', 1000)
+    first, second, third = paths = [str(tmp_path / f'survey_{number}.txt') for number in range(3)]
+    for number, path in enumerate(paths):
+        shutil.copy(source, path)
+        with open(path, 'a') as file:
+            file.write(f'/ copy {number}\n')
+
+    cache = SurveyCache(tmp_path / 'cache')
+    cache.parse(counting_parse, first)
+    cache.parse(counting_parse, second)
+
+    # The second file is the older entry once the first is used again
+    os.utime(entry_of(cache, first), (1000, 1000))
+    os.utime(entry_of(cache, second), (2000, 2000))
+    cache.parse(counting_parse, first)
+
+    cache.max_bytes = cache.size() + 1
+    cache.parse(counting_parse, third)
+
+    assert os.path.isdir(entry_of(cache, first))
+    assert not os.path.isdir(entry_of(cache, second))
+    assert os.path.isdir(entry_of(cache, third))
+    assert cache._size == cache.size() <= cache.max_bytes
+
+
+def test_only_complete_entries_are_used(survey_files, tmp_path):
+    path, _ = survey_files('gradient', 1000)
+    cache = SurveyCache(tmp_path / 'cache')
+    data, header = cache.parse(counting_parse, path)
+    entry = entry_of(cache, path)
+    entries = os.path.dirname(entry)
+
+    # Leftover of an interrupted store is not counted as an entry
+    os.mkdir(os.path.join(entries, '.tmpinterrupted'))
+    with open(os.path.join(entries, '.tmpinterrupted', 'grav.npy'), 'wb') as file:
+        file.write(b'\0' * 4096)
+    assert [entry for entry, _, _ in cache._entries()] == [entry]
+
+    # Storing an entry that exists already (parallel worker) leaves no temporary files
+    cache._store(entry, data, header)
+    assert sorted(os.listdir(entries)) == ['.tmpinterrupted', os.path.basename(entry)]
+
+    # A damaged entry is parsed again
+    os.remove(os.path.join(entry, 'grav.npy'))
+    calls.clear()
+    cache.parse(counting_parse, path)
+    assert calls == [path]
+    assert os.path.isfile(os.path.join(entry, 'grav.npy'))
@@ -0,0 +1,54 @@
+# Calibration factors of synthetic calibration line surveys are recovered
+# within their standard deviation.
+# Usage: python -m pytest benchmarks/test_calibration.py
+
+from gradmap_calc import read_survey
+from gradmap_calibration import calibrate_files, calibration_adjustment, calibration_block
+from gradmap_synthetic import line_setups, synthetic_survey, write_CG5
+
+# Calibration line points (μGal) and scale factors of the instruments
+LINE_GRAVITY = [0.0, 40000.0, 85000.0, 130000.0, 170000.0]
+SCALE = {'40983': 1.00042, '41021': 0.99971}
+
+
+def calibration_files(directory):
+    # Two surveys per instrument, readings divided by its scale factor
+    paths = []
+    for number, (serial_number, scale) in enumerate(SCALE.items()):
+        for repeat in range(2):
+            survey = synthetic_survey(*line_setups(len(LINE_GRAVITY), repeats=4), point_gravity=LINE_GRAVITY, noise=3,
+                                      seed=10 * number + repeat)
+            survey['grav'] = survey['grav'] / scale
+            paths.append(str(directory / f'{serial_number}_{repeat}.txt'))
+            write_CG5(paths[-1], survey, serial_number=serial_number)
+    return paths
+
+
+def check_scales(calibration):
+    instruments = calibration['instruments']
+    assert sorted(instruments['SN']) == sorted(SCALE)
+    for SN, scale, std in zip(instruments['SN'], instruments['calibration_factor'], instruments['std']):
+        assert 0 < std < 1e-4
+        assert abs(scale - SCALE[SN]) <= 3 * std
+
+
+def test_calibration_adjustment_recovers_scale(tmp_path):
+    paths = calibration_files(tmp_path)
+    reference_values = {str(1001 + index): value for index, value in enumerate(LINE_GRAVITY)}
+
+    blocks = [calibration_block(read_survey(path), reference_values) for path in paths]
+    calibration = calibration_adjustment(blocks, paths)
+
+    check_scales(calibration)
+    assert list(calibration['instruments']['number_of_files']) == [2, 2]
+
+
+def test_calibrate_files_with_reference_file(tmp_path):
+    paths = calibration_files(tmp_path)
+    reference_file = tmp_path / 'reference.csv'
+    reference_file.write_text('point,gravity\n' + ''.join(f'{1001 + index},{value}\n' for index, value in enumerate(LINE_GRAVITY)))
+
+    calibration = calibrate_files(paths, str(reference_file), max_workers=1)
+
+    check_scales(calibration)
+    assert [entry['filename'] for entry in calibration['files']] == paths
@@ -0,0 +1,49 @@
+# End to end runs of the command line interface: report, summary table and
+# JSON results of the test file, and a survey of four measured positions.
+# Usage: python -m pytest benchmarks/test_cli.py
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from gradmap_calc import gradient_linear
+from gradmap_cli import main
+from gradmap_synthetic import gradient_setups, synthetic_survey, write_CG5
+
+TESTFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'testfile.txt')
+
+
+def test_outputs_of_testfile(tmp_path):
+    report, summary, results = (str(tmp_path / name) for name in ('report.txt', 'summary.csv', 'results.json'))
+
+    assert main([TESTFILE, '-o', report, '-s', summary, '--json', results, '-j', '1', '-q']) == 0
+
+    lines = open(report, encoding='utf-8').read().splitlines()
+    assert lines[:2] == ['Summary', 'number of processed files: 1']
+    assert 'processing method: linear' in lines
+    assert any(line.startswith('processed file: ') and 'testfile.txt' in line for line in lines)
+    assert 'status: accepted' in lines
+    assert lines[lines.index('average height, gradient, standard deviation') + 1] == '0.646,-319.7,2.3'
+
+    table = pd.read_csv(summary)
+    assert list(table.columns) == ['Station ID', 'Gradient', 'Gradient SD']
+    np.testing.assert_allclose(table[['Gradient', 'Gradient SD']].to_numpy(), [[-319.6652, 2.2765]], atol=1e-4)
+
+    records = json.load(open(results, encoding='utf-8'))
+    assert len(records) == 1 and records[0]['error'] is None
+    gradient = records[0]['output']['gradient']
+    np.testing.assert_allclose([gradient['average_gradient_num'], gradient['std_num']], table.iloc[0, 1:].to_numpy(dtype=float))
+
+
+def test_four_measured_positions(tmp_path):
+    path = str(tmp_path / 'survey.txt')
+    write_CG5(path, synthetic_survey(*gradient_setups((0.10, 0.50, 0.90, 1.30), 12), noise=3, seed=1))
+    summary = str(tmp_path / 'summary.csv')
+
+    assert main([path, '--measured-positions', '4', '-o', str(tmp_path / 'report.txt'), '-s', summary, '-j', '1', '-q']) == 0
+
+    expected = gradient_linear(path, None, None, 0, 4, None, 2, 5)['gradient']
+    np.testing.assert_allclose(pd.read_csv(summary)[['Gradient', 'Gradient SD']].to_numpy(),
+                               [[expected['average_gradient_num'], expected['std_num']]])
@@ -0,0 +1,46 @@
+# The network adjustment of a single file reproduces gravity_differences and
+# selected elements of the inverse match the dense inverse.
+# Usage: python -m pytest benchmarks/test_network.py
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+from conftest import LINE_GRAVITY
+from gradmap_calc import gravity_differences, read_survey
+from gradmap_network import factorize, inverse_diagonal, network_adjustment, network_files
+
+
+def test_single_file_matches_gravity_differences(survey_files):
+    path, _ = survey_files('line', 1000)
+    differences = gravity_differences(path, None, 2, 0, 'CG5', None)
+    network = network_files([path])
+
+    points = network['points']
+    assert list(points['ID']) == [str(point) for point in differences['stationinfo']['points']]
+    np.testing.assert_allclose(points['gravity'][1:], differences['adjusted']['differences'], rtol=1e-9, atol=1e-6)
+    assert network['files'][0]['drift_polynomial_degree'] == int(differences['drift']['polynomial_degree'])
+
+    # Standard deviations differ by the degrees of freedom convention only
+    np.testing.assert_allclose(points['std'][1:] / network['processing']['RMSE'],
+                               np.asarray(differences['adjusted']['std']) / differences['processing']['RMSE'], rtol=1e-6)
+
+
+def test_network_recovers_point_gravity(survey_files):
+    path, _ = survey_files('line', 1000)
+    network = network_adjustment([read_survey(path)])
+
+    points = network['points']
+    assert np.all(np.abs(points['gravity'] - LINE_GRAVITY) <= 3 * points['std'] + 1)
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 256])
+def test_inverse_diagonal_matches_dense_inverse(block_size):
+    rng = np.random.default_rng(0)
+    A = sparse.random(200, 40, density=0.1, random_state=1, format='csr') + sparse.eye(200, 40)
+    N = (A.T @ A + sparse.eye(40)).tocsc()
+    columns = rng.choice(40, size=15, replace=False)
+
+    diagonal = inverse_diagonal(factorize(N), columns, block_size)
+
+    np.testing.assert_allclose(diagonal, np.diag(np.linalg.inv(N.toarray()))[columns], rtol=1e-10)
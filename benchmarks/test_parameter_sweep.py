@@ -0,0 +1,52 @@
+# Parameter sweeps give the results of direct runs with the same settings,
+# also for settings applied by rescaling (calibration factor, SD00).
+# Usage: python -m pytest benchmarks/test_parameter_sweep.py
+
+import numpy as np
+import pytest
+
+from gradmap_calc import gradient_linear, gravity_differences
+from gradmap_sweep import parameter_sweep
+
+SETTINGS = {'header_lines': None, 'SD_scale_information': 0, 'number_of_measured_levels': None, 'input_units_option': 1}
+
+
+def test_sweep_matches_direct_runs(survey_files):
+    paths = [survey_files('gradient', 1000)[0], survey_files('function', 1000)[0]]
+    grid = {'significance': [1, 3], 'SD00': [3, 8], 'calibration_factor': [None, 1.0005], 'max_iterations': [1, 3]}
+
+    table = parameter_sweep(paths, 'linear', grid, SETTINGS, max_workers=1)
+
+    assert len(table) == len(paths) * 16
+    assert table['error'].isna().all()
+    for row in table.itertuples():
+        calibration_factor = None if np.isnan(row.calibration_factor) else row.calibration_factor
+        output = gradient_linear(row.file, None, calibration_factor, 0, None, 1, row.significance, row.SD00,
+                                 max_iterations=row.max_iterations)
+        np.testing.assert_allclose([row.gradient, row.std, row.RMSE],
+                                   [output['gradient']['average_gradient_num'], output['gradient']['std_num'], output['processing']['RMSE']],
+                                   rtol=1e-7)
+        assert row.rejected_measurements == output['processing']['number_of_rejected_measurements']
+
+
+def test_sweep_over_drift_degree(survey_files):
+    path = survey_files('line', 1000)[0]
+    grid = {'drift_degree': [1, 2, 3]}
+
+    settings = {'header_lines': None, 'SD_scale_information': 0, 'significance': 2, 'instrument_type': 'CG5', 'calibration_factor': None}
+    table = parameter_sweep([path], 'differences', grid, settings, max_workers=1)
+
+    assert table['error'].isna().all()
+    for drift_degree, rows in table.groupby('drift_degree'):
+        output = gravity_differences(path, None, 2, 0, 'CG5', None, drift_degree=drift_degree)
+        np.testing.assert_allclose(rows['difference'], output['adjusted']['differences'], rtol=1e-7)
+        assert (rows['drift_polynomial_degree'] <= drift_degree).all()
+
+
+def test_sweep_rejects_drift_degree_without_drift(survey_files):
+    path = survey_files('gradient', 1000)[0]
+
+    with pytest.raises(ValueError, match='drift_degree'):
+        parameter_sweep([path], 'linear', {'drift_degree': [0, 1]}, SETTINGS, max_workers=1)
+    with pytest.raises(ValueError, match='drift_degree'):
+        gradient_linear(path, None, None, 0, None, 1, 2, 5, drift_degree=0)
@@ -0,0 +1,90 @@
+# Stage profiling: hooks are only active inside profiling(), the summary
+# splits the time over the stages and the records are exported as JSON or
+# CSV.
+# Usage: python -m pytest benchmarks/test_profile.py
+
+import json
+import os
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import gradmap_profile
+from gradmap_calc import gradient_linear
+from gradmap_profile import Profiler, profiling, stage
+
+TESTFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'testfile.txt')
+
+
+def test_hooks_removed_after_profiling():
+    with profiling() as profiler:
+        assert gradmap_profile._hooks == [profiler]
+        with stage('inside'):
+            pass
+    assert gradmap_profile._hooks == []
+    assert stage('outside') is gradmap_profile._NO_STAGE
+
+    with pytest.raises(RuntimeError):
+        with profiling(track_memory=True):
+            raise RuntimeError
+    assert gradmap_profile._hooks == []
+    assert not tracemalloc.is_tracing()
+
+    assert [record['stage'] for record in profiler.records] == ['inside']
+
+
+def test_summary_of_processing():
+    with profiling(file='testfile.txt') as profiler:
+        gradient_linear(TESTFILE, None, None, 0, None, 1, 2, 5)
+
+    records = profiler.to_frame()
+    assert {'parse', 'datetime', 'units', 'jacobi', 'normal_equations', 'solve'} <= set(records['stage'])
+    assert (records['file'] == 'testfile.txt').all()
+    assert list(records['sequence']) == list(range(len(records)))
+
+    summary = profiler.summary()
+    np.testing.assert_allclose(summary['share'].sum(), 1)
+    assert (summary['share'] >= 0).all()
+    assert list(summary['total_time']) == sorted(summary['total_time'], reverse=True)
+    assert summary['count'].sum() == len(records)
+
+
+def test_summary_shares_of_stages():
+    profiler = Profiler()
+    profiler.extend([{'stage': 'read', 'wall_time': 0.3}, {'stage': 'solve', 'wall_time': 0.5},
+                     {'stage': 'solve', 'wall_time': 0.2}])
+
+    summary = profiler.summary()
+    assert list(summary.index) == ['solve', 'read']
+    np.testing.assert_allclose(summary['share'], [0.7, 0.3])
+    np.testing.assert_allclose(summary['mean_time'], [0.35, 0.3])
+    assert Profiler().summary().empty
+
+
+def test_track_memory():
+    with profiling(track_memory=True) as profiler:
+        with stage('allocate'):
+            data = np.ones(1 << 20)
+    del data
+
+    record, = profiler.records
+    assert record['peak_bytes'] >= 8 << 20
+    assert 'max_peak_bytes' in profiler.summary()
+
+
+def test_export(tmp_path):
+    with profiling(file='testfile.txt') as profiler:
+        with stage('parse', bytes=100):
+            with stage('datetime', rows=10):
+                pass
+
+    profiler.export(str(tmp_path / 'profile.json'))
+    profiler.export(str(tmp_path / 'profile.csv'))
+
+    assert json.load(open(tmp_path / 'profile.json', encoding='utf-8')) == profiler.records
+    table = pd.read_csv(tmp_path / 'profile.csv')
+    assert list(table['stage']) == ['datetime', 'parse']
+    assert {'file', 'sequence', 'wall_time', 'bytes', 'rows'} <= set(table.columns)
+    np.testing.assert_allclose(table['wall_time'], [record['wall_time'] for record in profiler.records])
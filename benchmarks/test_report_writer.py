@@ -0,0 +1,37 @@
+# Buffered result writer: records from the queue are written once, in input
+# order, to the text report, the summary and JSON.
+# Usage: python -m pytest benchmarks/test_report_writer.py
+
+import io
+import json
+
+import pandas as pd
+
+from gradmap_batch import process_files
+from gradmap_report import ResultWriter, result_record, summary_table
+
+
+def test_writer_keeps_input_order(survey_files, tmp_path):
+    paths = [survey_files('gradient', 1000)[0], str(tmp_path / 'missing.txt'), survey_files('function', 1000)[0]]
+    settings = {'header_lines': None, 'calibration_factor': None, 'SD_scale_information': 0, 'number_of_measured_levels': None,
+                'input_units_option': 1, 'significance': 2, 'SD00': 5}
+    results = sorted(process_files(paths, 'linear', settings, max_workers=1),
+                     key=lambda result: result['index'])
+
+    report, summary, results_json = (str(tmp_path / name) for name in ('report.txt', 'summary.csv', 'results.json'))
+    with ResultWriter(report, summary, results_json) as writer:
+        for result in reversed(results):
+            writer.queue.put(result_record(result, 'linear'))
+        writer.close(lambda writer: [f'files: {writer.number_of_files}, failed: {writer.failed_files}'])
+
+    text = open(report, encoding='utf-8').read()
+    assert text.startswith('files: 3, failed: 1\n')
+    assert [line.split(': ', 1)[1] for line in text.splitlines() if line.startswith('processed file')][1] == paths[1]
+
+    expected = summary_table(results, 'linear')
+    pd.testing.assert_frame_equal(pd.read_csv(summary), pd.read_csv(io.StringIO(expected.to_csv(index=False))))
+
+    written = json.load(open(results_json, encoding='utf-8'))
+    assert [entry['filename'] for entry in written] == paths
+    assert written[0]['output']['gradient']['average_gradient_num'] == results[0]['output']['gradient']['average_gradient_num']
+    assert written[1]['error'] is not None
@@ -0,0 +1,29 @@
+# The streaming estimate after the last reading matches gradient_linear of
+# the complete file (surveys without rejected readings) for 2, 3 and 4
+# measured levels.
+# Usage: python -m pytest benchmarks/test_stream.py
+
+import numpy as np
+import pytest
+
+from gradmap_calc import gradient_linear
+from gradmap_stream import stream_gradient
+from gradmap_synthetic import gradient_setups, synthetic_survey, write_CG5
+
+
+@pytest.mark.parametrize('level_heights', [(0.25, 1.30), (0.25, 0.75, 1.30), (0.10, 0.50, 0.90, 1.30)])
+def test_final_estimate_matches_gradient_linear(tmp_path, level_heights):
+    path = str(tmp_path / 'survey.txt')
+    write_CG5(path, synthetic_survey(*gradient_setups(level_heights, 12), noise=3, seed=1))
+
+    batch = gradient_linear(path, None, None, 0, None, None, 3, 5)
+    with open(path, 'rb') as lines:
+        estimate = list(stream_gradient(lines, significance=3))[-1]
+
+    assert batch['processing']['number_of_rejected_measurements'] == 0
+    assert estimate['number_of_points'] == len(level_heights)
+    assert estimate['drift_degree'] == int(batch['drift']['polynomial_degree'])
+    np.testing.assert_allclose(estimate['gradient'], batch['gradient']['average_gradient_num'], rtol=1e-9)
+    np.testing.assert_allclose(estimate['std'], batch['gradient']['std_num'], rtol=1e-6)
+    np.testing.assert_allclose(estimate['RMSE'], batch['processing']['RMSE'], rtol=1e-6)
+    np.testing.assert_allclose(estimate['average_height'], batch['gradient']['average_height_num'], rtol=1e-12)
@@ -0,0 +1,148 @@
+# The adjustment routines recover the truth of synthetic surveys.
+# Usage: python -m pytest benchmarks/test_synthetic_truth.py
+
+import numpy as np
+import pytest
+
+from conftest import GRADIENT, GRADIENT_QUADRATIC, LINE_GRAVITY
+from gradmap_calc import gradient_function, gradient_linear, gradient_linear_batch, gravity_differences, read_CG5, read_CG6, read_survey
+from gradmap_synthetic import gradient_setups, line_setups, synthetic_survey, write_CG5
+
+
+@pytest.mark.parametrize('instrument', ['CG5', 'CG6'])
+def test_readers_return_synthetic_readings(survey_files, instrument):
+    path, survey = survey_files('gradient', 1000, instrument)
+    filedata = (read_CG5 if instrument == 'CG5' else read_CG6)(path)
+
+    assert len(filedata) == len(survey['grav'])
+    assert np.array_equal(filedata['points'].to_numpy(), survey['points'])
+    np.testing.assert_allclose(filedata['height'], survey['height'], atol=1e-4)
+    np.testing.assert_allclose(filedata['grav'] - 5e6, survey['grav'], atol=1)
+    assert np.array_equal(filedata['datetime'].to_numpy(), survey['datetime'])
+
+
+@pytest.mark.parametrize('instrument', ['CG5', 'CG6'])
+def test_readers_use_given_height_units(survey_files, instrument):
+    path, survey = survey_files('gradient', 1000, instrument)
+    read = read_CG5 if instrument == 'CG5' else read_CG6
+    detected = 1 if instrument == 'CG5' else 2
+
+    np.testing.assert_allclose(read(path, input_units_option=detected)['height'], survey['height'], atol=1e-4)
+    assert not np.allclose(read(path, input_units_option=3 - detected)['height'], survey['height'], atol=1e-2)
+    with pytest.raises(ValueError, match='input_units_option'):
+        read(path, input_units_option=3)
+
+
+@pytest.mark.parametrize('instrument', ['CG5', 'CG6'])
+def test_readers_keep_data_with_long_header(survey_files, instrument):
+    path, survey = survey_files('gradient', 1000, instrument)
+    read = read_CG5 if instrument == 'CG5' else read_CG6
+
+    # header_lines beyond the header of the file stops at the first data row
+    filedata = read(path, header_lines=200)
+    assert len(filedata) == len(survey['grav'])
+    assert filedata.attrs['header'] == read(path).attrs['header']
+
+
+@pytest.mark.parametrize('instrument', ['CG5', 'CG6'])
+def test_gradient_linear_recovers_gradient(survey_files, instrument):
+    path, _ = survey_files('gradient', 1000, instrument)
+    # Synthetic CG5 heights are in centimetres, CG6 heights in metres
+    output = gradient_linear(path, None, None, 0, None, 1 if instrument == 'CG5' else 2, 2, 5, instrument_type=instrument)
+
+    gradient = output['gradient']
+    assert abs(gradient['average_gradient_num'] - GRADIENT) < 3 * gradient['std_num'] + 1
+
+
+def test_gradient_function_recovers_polynomial(survey_files):
+    path, _ = survey_files('function', 1000)
+    output = gradient_function(path, None, None, 0, 1, 2, 5)
+
+    parameters = output['gradient']['gradient_param']
+    std = output['gradient']['std']
+    assert int(output['gradient']['polynomial_degree']) == 2
+    assert abs(parameters[0] - GRADIENT) < 3 * std[0] + 1
+    assert abs(parameters[1] - GRADIENT_QUADRATIC) < 3 * std[1] + 1
+
+
+def test_gravity_differences_recover_line(survey_files):
+    path, _ = survey_files('line', 1000)
+    output = gravity_differences(path, None, 2, 0, 'CG5', None)
+
+    truth = np.array(LINE_GRAVITY[1:]) - LINE_GRAVITY[0]
+    assert np.all(np.abs(output['adjusted']['differences'] - truth) < 3 * output['adjusted']['std'] + 1)
+
+
+def test_spikes_are_rejected(tmp_path):
+    survey = synthetic_survey(*gradient_setups((0.25, 1.30), 20), gradient=GRADIENT, noise=3,
+                              number_of_spikes=3, spike_size=200, seed=3)
+    path = str(tmp_path / 'spikes.txt')
+    write_CG5(path, survey)
+
+    output = gradient_linear(path, None, None, 0, None, 1, 2, 5, max_iterations=5)
+
+    rejected = np.flatnonzero(np.isin(output['time']['all_measurements'], output['time']['outliers']))
+    assert set(survey['truth']['spikes']) <= set(rejected)
+    assert abs(output['gradient']['average_gradient_num'] - GRADIENT) < 3 * output['gradient']['std_num'] + 1
+
+
+@pytest.mark.parametrize('robust', ['huber', 'tukey'])
+def test_robust_mode_downweights_spikes(tmp_path, robust):
+    survey = synthetic_survey(*gradient_setups((0.25, 1.30), 20), gradient=GRADIENT, noise=3,
+                              number_of_spikes=3, spike_size=200, seed=3)
+    path = str(tmp_path / 'spikes.txt')
+    write_CG5(path, survey)
+
+    output = gradient_linear(path, None, None, 0, None, 1, 2, 5, robust=robust)
+
+    downweighted = np.flatnonzero(np.isin(output['time']['all_measurements'], output['time']['outliers']))
+    assert set(survey['truth']['spikes']) <= set(downweighted)
+    assert np.all(output['processing']['robust_weights'][survey['truth']['spikes']] < 0.1)
+    assert abs(output['gradient']['average_gradient_num'] - GRADIENT) < 3 * output['gradient']['std_num'] + 1
+
+
+def test_tares_are_detected(tmp_path):
+    names, points, heights = line_setups(len(LINE_GRAVITY), repeats=3)
+    survey = synthetic_survey(names, points, heights, point_gravity=LINE_GRAVITY, noise=3, tares=[(1.0, 200)], seed=1)
+    path = str(tmp_path / 'tare.txt')
+    write_CG5(path, survey)
+
+    output = gravity_differences(path, None, 2, 0, 'CG5', None, detect_tares=True)
+
+    tares = output['drift']['tares']
+    assert len(tares['size']) == 1
+    assert abs(tares['size'][0] - 200) < 3 * tares['std'][0] + 1
+    truth = np.array(LINE_GRAVITY[1:]) - LINE_GRAVITY[0]
+    assert np.all(np.abs(output['adjusted']['differences'] - truth) < 3 * output['adjusted']['std'] + 1)
+
+
+@pytest.mark.parametrize('method', ['bootstrap', 'montecarlo'])
+def test_resampled_uncertainty_matches_propagation(survey_files, method):
+    path, _ = survey_files('gradient', 1000)
+    output = gradient_linear(path, None, None, 0, None, 1, 2, 5, uncertainty=method, replicates=4000, seed=0)
+
+    gradient = output['uncertainty']['gradient']
+    assert abs(gradient['std'] / output['gradient']['std_num'] - 1) < 0.15
+    assert gradient['lower'] < output['gradient']['average_gradient_num'] < gradient['upper']
+    assert gradient['lower'] - 1 < GRADIENT < gradient['upper'] + 1
+
+
+def test_gradient_linear_batch_matches_loop(tmp_path):
+    paths = []
+    for seed, levels in enumerate([(0.25, 1.30), (0.25, 0.75, 1.30), (0.20, 0.60, 1.00, 1.30)]):
+        paths.append(str(tmp_path / f'station_{seed}.txt'))
+        write_CG5(paths[-1], synthetic_survey(*gradient_setups(levels, 16), gradient=-300, noise=3, seed=seed))
+
+    batch = gradient_linear_batch([read_survey(path) for path in paths])
+
+    for index, path in enumerate(paths):
+        gradient = gradient_linear(path, None, None, 0, None, 1, 2, 5)['gradient']
+        np.testing.assert_allclose([batch['gradient'][index], batch['std'][index]],
+                                   [gradient['average_gradient_num'], gradient['std_num']], rtol=1e-8)
+
+
+def test_gradient_linear_reports_level_mismatch(survey_files):
+    path, _ = survey_files('function', 1000)
+
+    with pytest.raises(ValueError, match='3 points but 2 measured levels'):
+        gradient_linear(path, None, None, 0, 2, 1, 2, 5)
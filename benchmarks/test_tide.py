@@ -0,0 +1,50 @@
+# Computed (Longman) tide corrections reproduce the instrument tide of the
+# CG5 test file and swapping them in leaves the gradient unchanged.
+# Usage: python -m pytest benchmarks/test_tide.py
+
+import os
+
+import numpy as np
+import pytest
+
+from gradmap_calc import gradient_linear, parse_CG5, read_CG5, read_CG6
+from gradmap_synthetic import gradient_setups, synthetic_survey, write_CG6
+from gradmap_tide import longman_tide
+
+TESTFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'testfile.txt')
+
+
+def test_longman_reproduces_instrument_tide():
+    data, header = parse_CG5(TESTFILE)
+    utc = data['datetime'] + np.timedelta64(int(header['GMT DIFF.'] * 3600), 's')
+    tide = longman_tide(utc, header['LAT'], header['LONG'])
+
+    assert np.sqrt(np.mean((tide - data['tide_corr'] * 1000)**2)) < 1
+
+
+def test_computed_tide_keeps_gradient():
+    instrument = gradient_linear(TESTFILE, None, None, 0, None, 1, 2, 5)
+    computed = gradient_linear(TESTFILE, None, None, 0, None, 1, 2, 5, tide_model='longman')
+
+    assert abs(computed['gradient']['average_gradient_num'] - instrument['gradient']['average_gradient_num']) < 1
+
+
+def test_CG6_tide_flag(tmp_path):
+    path = str(tmp_path / 'survey.dat')
+    write_CG6(path, synthetic_survey(*gradient_setups()))
+    instrument = read_CG6(path)
+    computed = read_CG6(path, tide_model='longman')
+    tide = longman_tide(instrument['datetime'].to_numpy(), instrument['LatUser'].to_numpy(),
+                        instrument['LonUser'].to_numpy(), instrument['ElevUser'].to_numpy())
+
+    # Synthetic files flag the tide correction as applied (11011)
+    np.testing.assert_allclose(computed['grav'], instrument['grav'] - instrument['tide_corr'] * 1000 + tide, atol=1e-6)
+
+
+def test_CG5_without_coordinates(tmp_path):
+    path = tmp_path / 'survey.txt'
+    lines = open(TESTFILE).read().splitlines()
+    path.write_text('\n'.join(line for line in lines if not line.startswith(('/\tLAT', '/\tLONG'))) + '\n')
+
+    with pytest.raises(ValueError, match='LAT'):
+        read_CG5(str(path), tide_model='longman')
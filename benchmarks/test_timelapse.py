@@ -0,0 +1,76 @@
+# Time-lapse store: epochs are sorted by date from the index file without
+# loading their tables, an empty store has no changes and an unknown
+# baseline is reported.
+# Usage: python -m pytest benchmarks/test_timelapse.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gradmap_timelapse import CHANGE_COLUMNS, STORE_COLUMNS, TimeLapseStore, epoch_changes, main
+
+
+def epoch(name, date, differences):
+    return pd.DataFrame({'epoch': name, 'epoch_date': pd.Timestamp(date), 'reference': '1',
+                         'station': [str(station) for station in range(2, 2 + len(differences))],
+                         'difference': differences, 'std': 2.0, 'number_of_files': 1, 'files': f'{name}.txt'})[STORE_COLUMNS]
+
+
+def test_epochs_sorted_by_index(tmp_path, monkeypatch):
+    store = TimeLapseStore(tmp_path / 'store')
+    store.save_epoch(epoch('b-spring', '2024-04-02', [100.0, 250.0]))
+    store.save_epoch(epoch('a-autumn', '2024-10-15', [104.0, 245.0]))
+    store.save_epoch(epoch('c-winter', '2023-12-01', [98.0, 251.0]))
+
+    def load_epoch(epoch):
+        raise AssertionError(f'epoch {epoch!r} loaded')
+
+    monkeypatch.setattr(store, 'load_epoch', load_epoch)
+    assert store.epochs() == ['c-winter', 'b-spring', 'a-autumn']
+
+
+def test_epochs_missing_from_index(tmp_path):
+    store = TimeLapseStore(tmp_path / 'store')
+    store.save_epoch(epoch('2024-04', '2024-04-02', [100.0]))
+    store.save_epoch(epoch('2023-12', '2023-12-01', [98.0]))
+    (tmp_path / 'store' / 'epochs.json').unlink()
+
+    assert store.epochs() == ['2023-12', '2024-04']
+
+    store.remove_epoch('2023-12')
+    assert store.epochs() == ['2024-04']
+
+
+def test_changes_between_epochs(tmp_path):
+    store = TimeLapseStore(tmp_path / 'store')
+    store.save_epoch(epoch('2024-04', '2024-04-02', [100.0, 250.0]))
+    store.save_epoch(epoch('2023-12', '2023-12-01', [98.0, 251.0]))
+    store.save_epoch(epoch('2024-10', '2024-10-15', [104.0, 245.0]))
+
+    changes = epoch_changes(store.table())
+    assert list(changes['from_epoch']) == ['2023-12', '2024-04'] * 2
+    np.testing.assert_allclose(changes['change'], [2.0, 4.0, -1.0, -5.0])
+    np.testing.assert_allclose(changes['std'], np.sqrt(8))
+
+    changes = epoch_changes(store.table(), baseline='2023-12')
+    np.testing.assert_allclose(changes['change'], [2.0, 6.0, -1.0, -6.0])
+
+
+def test_empty_store(tmp_path):
+    store = TimeLapseStore(tmp_path / 'store')
+
+    assert store.epochs() == []
+    changes = epoch_changes(store.table())
+    assert changes.empty
+    assert list(changes.columns) == CHANGE_COLUMNS
+    assert main([str(tmp_path / 'store'), 'changes']) == 0
+
+
+def test_unknown_baseline(tmp_path, capsys):
+    store = TimeLapseStore(tmp_path / 'store')
+    store.save_epoch(epoch('2024-04', '2024-04-02', [100.0]))
+
+    with pytest.raises(ValueError, match='2020-01'):
+        epoch_changes(store.table(), baseline='2020-01')
+    assert main([str(tmp_path / 'store'), 'changes', '--baseline', '2020-01']) == 1
+    assert '2020-01' in capsys.readouterr().err
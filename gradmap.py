@@ -3,9 +3,29 @@
 @author: adam.novak@skgeodesy.sk
 """
 
+import os
+import time
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import font
+from tkinter import messagebox
+from tkinter import ttk
+
+from gradmap_batch import BatchJob
+from gradmap_report import ResultWriter, summary_header
+
+# Instrument menu -> instrument_type
+INSTRUMENTS = {"Scintrex CG5": "CG5", "CG6 Autograv": "CG6"}
+
+# Number of measured positions menu -> number_of_measured_levels, None lets
+# the processing count the levels in the file
+MEASURED_POSITIONS = {"2": 2, "3": 3, "4": 4, "from file": None}
+
+# Instrument specific precision SD00 in µGal, as the command line default
+SD00 = 5
+
+# Interval (ms) of polling the background job from the Tk main loop
+POLL_INTERVAL = 200
 
 class App(tk.Frame):
     def __init__(self, master=None):
@@ -15,7 +35,7 @@ class App(tk.Frame):
 
     def create_widgets(self):
         self.master.title("GradMap v1.0")
-        self.master.geometry('500x650')
+        self.master.geometry('500x850')
         self.master.resizable(True, True)
         
         custom_font = font.Font(family="Trebuchet MS", size=int(11.5))
@@ -25,7 +45,7 @@ class App(tk.Frame):
 
         # Input Data Panel
         p1 = tk.LabelFrame(self.master, text='Input Data', bg='#f0f0f0', relief=tk.GROOVE, borderwidth=2.5, font=custom_font_panel)
-        p1.place(relx=0.02, rely=0.01, relwidth=0.96, relheight=0.23)
+        p1.place(relx=0.02, rely=0.008, relwidth=0.96, relheight=0.176)
         
         button_choose_file = tk.Button(p1, text="Choose file(s)", bg='#e7e7e7', command=self.choose_input_files, font=custom_font)
         button_choose_file.place(relx=0.02, rely=0.05, relwidth=0.3, relheight=0.3)
@@ -50,7 +70,7 @@ class App(tk.Frame):
 
         # Processing Panel
         p2 = tk.LabelFrame(self.master, text='Processing method', bg='#f0f0f0', relief=tk.GROOVE, borderwidth=2, font=custom_font_panel)
-        p2.place(relx=0.02, rely=0.24, relwidth=0.96, relheight=0.5)
+        p2.place(relx=0.02, rely=0.184, relwidth=0.96, relheight=0.382)
         
         # Mode Selection Radio Buttons
         self.mode_var = tk.StringVar(value="Standard")
@@ -73,9 +93,57 @@ class App(tk.Frame):
         self.create_settings_widgets(p2, custom_font, custom_font_widgets)
         self.update_settings_visibility()  # Initial check
 
-        # Close Button
-        close_button = tk.Button(self.master, text='Close', bg='#e7e7e7', command=self.master.destroy, font=custom_font)
-        close_button.place(relx=0.6, rely=0.93, relwidth=0.19, relheight=0.05)
+        # Output Data Panel
+        p3 = tk.LabelFrame(self.master, text='Output data', bg='#f0f0f0', relief=tk.GROOVE, borderwidth=2, font=custom_font_panel)
+        p3.place(relx=0.02, rely=0.57, relwidth=0.96, relheight=0.12)
+
+        button_create_report = tk.Button(p3, text="Create report file", bg='#e7e7e7', command=self.create_report_file, font=custom_font)
+        button_create_report.place(relx=0.02, rely=0.03, relwidth=0.35, relheight=0.36)
+
+        self.show_report_path = tk.Label(p3, text="", bg='#f0f0f0', anchor="w", font=custom_font_display)
+        self.show_report_path.place(relx=0.4, rely=0.05, relwidth=0.58, relheight=0.3)
+
+        label_save_summary = tk.Label(p3, text="save summary in table", bg='#f0f0f0', anchor="w", font=custom_font)
+        label_save_summary.place(relx=0.02, rely=0.45, relwidth=0.5, relheight=0.25)
+
+        self.check_summary_var = tk.BooleanVar(value=True)
+        check_summary = tk.Checkbutton(p3, text='', variable=self.check_summary_var, bg='#f0f0f0')
+        check_summary.place(relx=0.77, rely=0.45, relwidth=0.09, relheight=0.25)
+
+        label_save_gravity_diff = tk.Label(p3, text="save gravity differences instead", bg='#f0f0f0', anchor="w", font=custom_font)
+        label_save_gravity_diff.place(relx=0.02, rely=0.72, relwidth=0.6, relheight=0.25)
+
+        self.check_gravity_dif_var = tk.BooleanVar(value=False)
+        check_gravity_dif = tk.Checkbutton(p3, text='', variable=self.check_gravity_dif_var, bg='#f0f0f0')
+        check_gravity_dif.place(relx=0.77, rely=0.72, relwidth=0.09, relheight=0.25)
+
+        # Progress Panel, files are processed in background worker processes
+        # while the window keeps responding
+        p4 = tk.LabelFrame(self.master, text='Progress', bg='#f0f0f0', relief=tk.GROOVE, borderwidth=2, font=custom_font_panel)
+        p4.place(relx=0.02, rely=0.695, relwidth=0.96, relheight=0.235)
+
+        self.progress_bar = ttk.Progressbar(p4, orient=tk.HORIZONTAL, mode='determinate')
+        self.progress_bar.place(relx=0.02, rely=0.02, relwidth=0.96, relheight=0.1)
+
+        self.show_progress = tk.Label(p4, text="", bg='#f0f0f0', anchor="w", font=custom_font_display)
+        self.show_progress.place(relx=0.02, rely=0.14, relwidth=0.96, relheight=0.12)
+
+        self.file_list = tk.Listbox(p4, font=custom_font_display, activestyle='none')
+        self.file_list.place(relx=0.02, rely=0.28, relwidth=0.92, relheight=0.7)
+        file_list_scroll = tk.Scrollbar(p4, orient=tk.VERTICAL, command=self.file_list.yview)
+        file_list_scroll.place(relx=0.94, rely=0.28, relwidth=0.04, relheight=0.7)
+        self.file_list.config(yscrollcommand=file_list_scroll.set)
+
+        # Process, Cancel and Close Buttons
+        self.process_button = tk.Button(self.master, text='Process', bg='#e7e7e7', command=self.start_processing, font=custom_font)
+        self.process_button.place(relx=0.02, rely=0.94, relwidth=0.19, relheight=0.045)
+
+        self.cancel_button = tk.Button(self.master, text='Cancel', bg='#e7e7e7', command=self.cancel_processing, font=custom_font, state=tk.DISABLED)
+        self.cancel_button.place(relx=0.23, rely=0.94, relwidth=0.19, relheight=0.045)
+
+        close_button = tk.Button(self.master, text='Close', bg='#e7e7e7', command=self.close, font=custom_font)
+        close_button.place(relx=0.6, rely=0.94, relwidth=0.19, relheight=0.045)
+        self.master.protocol("WM_DELETE_WINDOW", self.close)
 
 
     def create_settings_widgets(self, parent, custom_font, custom_font_widgets):
@@ -96,17 +164,20 @@ class App(tk.Frame):
         self.label_calibration_factor.place(relx=0.02, rely=0.8, relwidth=0.5, relheight=0.18)
 
         # Additional widgets for the settings
-        self.measured_positions_options = tk.OptionMenu(parent, tk.StringVar(value="2"), "2", "3", "from file")
+        self.measured_positions_var = tk.StringVar(value="2")
+        self.measured_positions_options = tk.OptionMenu(parent, self.measured_positions_var, "2", "3", "4", "from file")
         self.measured_positions_options.place(relx=0.72, rely=0.2, relwidth=0.12, relheight=0.15)
         
         self.entry_rejection_threshold = tk.Entry(parent, font=custom_font_widgets, justify='center')
         self.entry_rejection_threshold.insert(0,5)
         self.entry_rejection_threshold.place(relx=0.74, rely=0.29, relwidth=0.1, relheight=0.14)
 
-        self.gradient_format_options = tk.OptionMenu(parent, tk.StringVar(value="linear"), "linear", "function")
+        self.gradient_format_var = tk.StringVar(value="linear")
+        self.gradient_format_options = tk.OptionMenu(parent, self.gradient_format_var, "linear", "function")
         self.gradient_format_options.place(relx=0.72, rely=0.45, relwidth=0.16, relheight=0.15)
 
-        self.significance_level_options = tk.OptionMenu(parent, tk.StringVar(value="2-σ .."), "1-σ (68% confidence bounds)", "2-σ (95% confidence bounds)", "3-σ (99.7% confidence bounds)")
+        self.significance_level_var = tk.StringVar(value="2-σ ..")
+        self.significance_level_options = tk.OptionMenu(parent, self.significance_level_var, "1-σ (68% confidence bounds)", "2-σ (95% confidence bounds)", "3-σ (99.7% confidence bounds)")
         self.significance_level_options.place(relx=0.72, rely=0.62, relwidth=0.18, relheight=0.15)
 
         self.entry_calibration_factor = tk.Entry(parent, font=custom_font_widgets, justify='center')
@@ -169,8 +240,159 @@ class App(tk.Frame):
         if file_paths:
             file_paths_str = "\n".join(file_paths)
             self.show_local_path.config(text=file_paths_str)
-            self.input_file = file_paths[0]  # Store the first selected file for processing
-            
+            # All selected files are processed
+            self.input_files = list(file_paths)
+            self.input_file = file_paths[0]
+
+    def create_report_file(self):
+        self.report_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("txt file", "*.txt")])
+        if self.report_path:
+            self.show_report_path.config(text=self.report_path)
+
+    def processing_mode(self):
+        # Batch processing mode (gradmap_batch.PROCESSING_MODES) of the
+        # chosen method, None for methods not run from the GUI
+        if self.mode_var.get() == "Standard" or (self.mode_var.get() == "Gradient" and self.check_gravity_dif_var.get()):
+            return "differences"
+        if self.mode_var.get() == "Gradient":
+            return self.gradient_format_var.get()
+        return None
+
+    def processing_settings(self):
+        # Settings of the widgets, ValueError for invalid entries
+        header_lines = self.entry_header_lines.get().strip()
+        calibration_factor = self.entry_calibration_factor.get().strip()
+        return {
+            'header_lines': int(header_lines) if header_lines else None,
+            'instrument_type': INSTRUMENTS[self.instrument_var.get()],
+            'calibration_factor': float(calibration_factor) if calibration_factor else None,
+            'SD_scale_information': 0,
+            'number_of_measured_levels': MEASURED_POSITIONS[self.measured_positions_var.get()],
+            'input_units_option': None,
+            'significance': int(self.significance_level_var.get()[0]),
+            'SD00': SD00,
+        }
+
+    def start_processing(self):
+        # Submits the selected files to background workers, the results are
+        # collected by poll_processing from the Tk main loop
+        if getattr(self, 'job', None) is not None:
+            return
+        input_files = getattr(self, 'input_files', [])
+        if not input_files:
+            messagebox.showwarning("GradMap", "Choose the input file(s) first.")
+            return
+
+        mode = self.processing_mode()
+        if mode is None:
+            messagebox.showinfo("GradMap", f"{self.mode_var.get()} processing is run from the command line "
+                                           f"(python -m gradmap_{self.mode_var.get().replace('-', '').lower()}).")
+            return
+
+        try:
+            settings = self.processing_settings()
+            rejection_threshold = float(self.entry_rejection_threshold.get())
+        except ValueError as error:
+            messagebox.showerror("GradMap", f"Invalid setting: {error}")
+            return
+
+        # Report next to the first input file unless chosen, never over an
+        # input file
+        report_file = getattr(self, 'report_path', '') or os.path.join(os.path.dirname(input_files[0]), 'gradmap_report.txt')
+        if os.path.abspath(report_file) in map(os.path.abspath, input_files):
+            root, extension = os.path.splitext(report_file)
+            report_file = f'{root}_output{extension}'
+        summary_file = os.path.splitext(report_file)[0] + '_summary.csv' if self.check_summary_var.get() else None
+
+        self.writer = ResultWriter(report_file, summary_file, shared=True)
+        self.writer.start()
+        self.job = BatchJob(input_files, mode, settings, output_queue=self.writer.queue,
+                            record_options={'rejection_threshold': rejection_threshold, 'parts': self.writer.parts()})
+        self.job_settings = (mode, settings)
+        self.file_started = {}
+        self.file_times = {}
+        self.failed_files = []
+
+        self.file_list.delete(0, tk.END)
+        for input_file in self.job.file_list:
+            self.file_list.insert(tk.END, f"{os.path.basename(input_file)}: queued")
+        self.progress_bar.config(maximum=len(self.job.file_list), value=0)
+        self.process_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+
+        self.job.start()
+        self.after(POLL_INTERVAL, self.poll_processing)
+
+    def poll_processing(self):
+        # Shows the state and time of every file and the running time of
+        # the job, reschedules itself until all results are in
+        job = self.job
+        for result in job.poll():
+            if 'wall_time' in result:
+                self.file_times[result['index']] = result['wall_time']
+            if result['error'] is not None:
+                self.failed_files.append(f"{os.path.basename(result['filename'])}: {result['error'].strip().splitlines()[-1]}")
+        now = time.perf_counter()
+        states = job.status()
+        for index, (input_file, state) in enumerate(zip(job.file_list, states)):
+            if state == 'running':
+                started = self.file_started.setdefault(index, now)
+                text = f"running {now - started:.1f} s"
+            elif state in ('done', 'failed'):
+                text = f"{state} {self.file_times[index]:.1f} s" if index in self.file_times else state
+            else:
+                text = state
+            line = f"{os.path.basename(input_file)}: {text}"
+            if self.file_list.get(index) != line:
+                self.file_list.delete(index)
+                self.file_list.insert(index, line)
+
+        finished = sum(state in ('done', 'failed', 'cancelled') for state in states)
+        failed = states.count('failed')
+        self.progress_bar.config(value=finished)
+        self.show_progress.config(text=f"{finished}/{len(states)} files processed, {failed} failed, {job.elapsed():.1f} s"
+                                       + (" (cancelling, running files are finished)" if job.cancelled and not job.finished() else ""))
+
+        if job.finished():
+            self.finish_processing()
+        else:
+            self.after(POLL_INTERVAL, self.poll_processing)
+
+    def finish_processing(self):
+        job, writer = self.job, self.writer
+        self.close_report()
+        self.job = None
+        self.process_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+
+        states = job.status()
+        status = "cancelled" if job.cancelled else "finished"
+        self.show_progress.config(text=f"{status}: {states.count('done')}/{len(states)} files processed, "
+                                       f"{states.count('failed')} failed, {job.elapsed():.1f} s, report: {writer.report_file}")
+        if self.failed_files:
+            messagebox.showerror("GradMap", "Processing failed:\n" + "\n".join(self.failed_files))
+
+    def close_report(self):
+        # Header in front of the report once the file counts are final
+        mode, settings = self.job_settings
+        self.writer.close(lambda writer: summary_header(writer.number_of_files, writer.rejected_files, writer.failed_files, mode,
+                                                        settings['calibration_factor'], settings['SD00'], settings['significance']))
+
+    def cancel_processing(self):
+        # Files not started are dropped, running ones finish
+        if getattr(self, 'job', None) is not None:
+            self.job.cancel()
+            self.cancel_button.config(state=tk.DISABLED)
+
+    def close(self):
+        # A running job is cancelled and its running files are finished
+        # before the report is closed, the report keeps all finished files
+        if getattr(self, 'job', None) is not None:
+            self.job.shutdown()
+            self.close_report()
+        self.master.destroy()
+
+
 if __name__ == "__main__":
     root = tk.Tk()
     gradmap = App(master=root)
@@ -184,23 +406,6 @@ if __name__ == "__main__":
 
 
 
-    # def create_report_file(self):
-    #         self.report_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("txt file", "*.txt")])
-    #         if self.report_path:
-    #             self.show_report_path.config(text=self.report_path)
-    #             if hasattr(self, 'diff_result'):
-    #                 self.save_report(self.diff_result, self.report_path)
-    # function that handles clicking on 'vypocet' button
-    # def process_file(self):
-        
-    #     print("Starting file processing...")
-    #     self.store_selected_points()
-
-    #     # get input_file
-    #     input_file = self.input_file
-    #     instrument_type = self.instrument_var.get()
-    #     report_filename = self.report_path
-
         # Settings Panel in Processing
         # label_measured_positions = tk.Label(p2, text='number of measured positions', bg='#f0f0f0', anchor="w", font=custom_font)
         # label_measured_positions.place(relx=0.02, rely=0.1, relwidth=0.5, relheight= panel2textheight)
@@ -232,42 +437,3 @@ if __name__ == "__main__":
 
         # entry_calibration_factor = tk.Entry(p2, font=custom_font_widgets, justify='center')
         # entry_calibration_factor.place(relx=0.74, rely=0.81, relwidth=0.1, relheight= panel2textheight)
-
-        ## Panel 3
-        # p3 = tk.LabelFrame(self.master, text='Output data', bg='#f0f0f0', relief=tk.GROOVE, borderwidth=2, font=custom_font_panel)
-        # p3.place(relx=0.02, rely=0.64, relwidth=0.96, relheight=0.27)
-
-        # # Panel na vyber suboru
-        # button_create_report = tk.Button(p3, text="Create report file", bg='#e7e7e7', command=self.create_report_file, font=custom_font)
-        # button_create_report.place(relx=0.02, rely=0.05, relwidth=0.35, relheight=0.22)
-
-        # # Vypis nazvu vybraneho suboru
-        # self.show_report_path = tk.Label(p3, text="", bg='#f0f0f0', anchor="w", font=custom_font)
-        # self.show_report_path.place(relx= 0.45, rely=0.05, relwidth=0.45, relheight=0.15)
-
-        # # save graphic output label
-        # label_store_processing_figures = tk.Label(p3, text="store processing figures", bg='#f0f0f0', anchor="w", font=custom_font)
-        # label_store_processing_figures.place(relx= 0.02, rely=0.35, relwidth=0.4, relheight=0.15)
-
-        # # text for saving summary of all calculations in an excel table
-        # label_save_summary = tk.Label(p3, text="save summary in table", bg='#f0f0f0', anchor="w", font=custom_font)
-        # label_save_summary.place(relx= 0.02, rely=0.55, relwidth=0.38, relheight=0.15)
-
-        # # text for saving gravity differences instead of gradient for all calculations
-        # label_save_gravity_diff = tk.Label(p3, text="save gravity differences instead", bg='#f0f0f0', anchor="w", font=custom_font)
-        # label_save_gravity_diff.place(relx= 0.02, rely=0.75, relwidth=0.53, relheight=0.15)
-
-        # # button for saving graphic output
-        # self.check_graphics_var = tk.BooleanVar(value=False)
-        # check_graphics = tk.Checkbutton(p3, text='', variable=self.check_graphics_var, bg='#f0f0f0')
-        # check_graphics.place(relx= 0.77, rely=0.35, relwidth=0.09, relheight=0.15)
-
-        # # Button for saving a summary (table) of all calculated values
-        # self.check_summary_var = tk.BooleanVar(value=True)
-        # check_summary = tk.Checkbutton(p3, text='', variable=self.check_summary_var, bg='#f0f0f0')
-        # check_summary.place(relx=0.77, rely=0.55, relwidth=0.09, relheight=0.15)
-
-        # # button for saving gravity differences instead of gradient for all calculations
-        # self.check_gravity_dif_var = tk.BooleanVar(value=False)
-        # check_gravity_dif = tk.Checkbutton(p3, text='', variable=self.check_gravity_dif_var, bg='#f0f0f0')
-        # check_gravity_dif.place(relx= 0.77, rely=0.75, relwidth=0.09, relheight=0.15)
\ No newline at end of file
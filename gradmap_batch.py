@@ -0,0 +1,206 @@
+import contextlib
+import functools
+import glob
+import inspect
+import queue
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from gradmap_calc import gradient_linear, gradient_function, gravity_differences
+from gradmap_profile import profiling
+from gradmap_report import result_record
+
+
+# Processing modes available for batch runs
+PROCESSING_MODES = {
+    'linear': gradient_linear,
+    'function': gradient_function,
+    'differences': gravity_differences,
+}
+
+
+def collect_input_files(input_files):
+    # Accepts a glob pattern or a list of paths/patterns, keeps the given order
+    if isinstance(input_files, str):
+        input_files = [input_files]
+
+    file_list = []
+    for entry in input_files:
+        matches = sorted(glob.glob(entry)) if glob.has_magic(entry) else [entry]
+        file_list.extend(matches)
+
+    return file_list
+
+
+def processing_arguments(mode, settings):
+    # Keep only the settings the chosen routine accepts, so one processing
+    # configuration can be shared by all modes
+    parameters = inspect.signature(PROCESSING_MODES[mode]).parameters
+    return {key: value for key, value in settings.items() if key in parameters and key != 'input_file'}
+
+
+def process_file(input_file, mode, settings, profile=False, index=None, output_queue=None, record_options=None):
+    # Runs one file, failures are returned instead of raised. With profile
+    # the stage records of the file (gradmap_profile) are returned too.
+    # With output_queue the serialized result (gradmap_report.result_record,
+    # record_options are its keyword arguments) is put to the queue here in
+    # the worker. 'wall_time' is the processing time of the file.
+    start = time.perf_counter()
+    with profiling(file=input_file) if profile else contextlib.nullcontext() as profiler:
+        try:
+            output = PROCESSING_MODES[mode](input_file, **processing_arguments(mode, settings))
+            error = None
+        except Exception:
+            output = None
+            error = traceback.format_exc()
+
+    result = {'filename': input_file, 'output': output, 'error': error, 'index': index, 'wall_time': time.perf_counter() - start}
+    if output_queue is not None:
+        output_queue.put(result_record(result, mode, **(record_options or {})))
+    if profile:
+        result['profile'] = profiler.records
+    return result
+
+
+def process_files(input_files, mode, settings, max_workers=None, profile=False, output_queue=None, record_options=None):
+    # Processes files in a process pool and yields the result of each file
+    # as soon as it finishes (not in input order). Every result carries
+    # its position in the input list under 'index' and with profile the
+    # stage records of its worker under 'profile'. output_queue receives
+    # the serialized results (see process_file), it has to be a manager
+    # queue (gradmap_report.ResultWriter(shared=True)) for a process pool.
+    if mode not in PROCESSING_MODES:
+        raise ValueError(f'Unknown processing mode {mode!r}, use one of {sorted(PROCESSING_MODES)}')
+
+    file_list = collect_input_files(input_files)
+
+    # Serial processing, useful for debugging and single files
+    if max_workers == 1 or len(file_list) <= 1:
+        for index, input_file in enumerate(file_list):
+            yield process_file(input_file, mode, settings, profile, index, output_queue, record_options)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(process_file, input_file, mode, settings, profile, index, output_queue, record_options): index
+                   for index, input_file in enumerate(file_list)}
+
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception:
+                # Worker process died (e.g. out of memory)
+                result = {'filename': file_list[index], 'output': None, 'error': traceback.format_exc(), 'profile': [], 'index': index}
+                if output_queue is not None:
+                    output_queue.put(result_record(result, mode, **(record_options or {})))
+            yield result
+
+
+class BatchJob:
+    # Files processed in a background process pool for callers that must not
+    # block (the GUI main loop). start() returns at once, finished results
+    # (as from process_file, cancelled files with 'cancelled') are put to
+    # self.results by the pool and collected without blocking by poll().
+    # status() gives the state of every file. cancel() drops the files not
+    # started yet, files already running in a worker are finished.
+    # shutdown() cancels as well and waits for the running files.
+    #     job = BatchJob(files, 'linear', settings)
+    #     job.start()
+    #     while not job.finished():
+    #         for result in job.poll():
+    #             ...
+    def __init__(self, input_files, mode, settings, max_workers=None, output_queue=None, record_options=None):
+        if mode not in PROCESSING_MODES:
+            raise ValueError(f'Unknown processing mode {mode!r}, use one of {sorted(PROCESSING_MODES)}')
+        self.file_list = collect_input_files(input_files)
+        self.mode = mode
+        self.settings = settings
+        self.max_workers = max_workers
+        self.output_queue = output_queue
+        self.record_options = record_options
+        self.results = queue.Queue()
+        self.start_time = None
+        self.end_time = None
+        self.cancelled = False
+        self._executor = None
+        self._futures = []
+        self._states = ['queued'] * len(self.file_list)
+        self._remaining = len(self.file_list)
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        if not self.file_list:
+            self.end_time = self.start_time
+            return
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        for index, input_file in enumerate(self.file_list):
+            future = self._executor.submit(process_file, input_file, self.mode, self.settings, False, index,
+                                           self.output_queue, self.record_options)
+            future.add_done_callback(functools.partial(self._finished, index))
+            self._futures.append(future)
+
+    def _finished(self, index, future):
+        # Runs in a thread of the pool
+        if future.cancelled():
+            result = {'filename': self.file_list[index], 'output': None, 'error': None, 'index': index, 'cancelled': True}
+        else:
+            try:
+                result = future.result()
+            except Exception:
+                # Worker process died (e.g. out of memory)
+                result = {'filename': self.file_list[index], 'output': None, 'error': traceback.format_exc(), 'index': index}
+                if self.output_queue is not None:
+                    self.output_queue.put(result_record(result, self.mode, **(self.record_options or {})))
+        self.results.put(result)
+
+    def poll(self):
+        # Results finished since the last call, never blocks
+        finished = []
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if result.get('cancelled'):
+                state = 'cancelled'
+            else:
+                state = 'done' if result['error'] is None else 'failed'
+            self._states[result['index']] = state
+            self._remaining -= 1
+            finished.append(result)
+        if self._remaining == 0 and self.end_time is None:
+            self.end_time = time.perf_counter()
+            # Workers exit, nothing is left to process
+            self._executor.shutdown(wait=False)
+        return finished
+
+    def status(self):
+        # 'queued', 'running', 'done', 'failed' or 'cancelled' of every file,
+        # files are running once a worker took them (as seen by the pool)
+        running = [future.running() for future in self._futures] or [False] * len(self._states)
+        return ['running' if state == 'queued' and is_running else state for state, is_running in zip(self._states, running)]
+
+    def elapsed(self):
+        # Seconds since start, up to the last result once all are collected
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    def finished(self):
+        # All results collected by poll()
+        return self.start_time is not None and self._remaining == 0
+
+    def cancel(self):
+        self.cancelled = True
+        for future in self._futures:
+            future.cancel()
+
+    def shutdown(self):
+        # Cancels the files not started and shuts the pool down, blocks until
+        # the running files are finished and the workers exited. Returns the
+        # results not collected by poll() yet, all files are finished after.
+        self.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        return self.poll()
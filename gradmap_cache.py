@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+
+class SurveyCache:
+    # On-disk cache of parsed survey files. Every parsed column is stored as
+    # a .npy file and loaded memory-mapped, so reprocessing a file skips
+    # text parsing entirely. Entries are keyed by file content (hash) and
+    # parser, a per-path record of size and mtime avoids rehashing unchanged
+    # files. The least recently used entries are evicted once the cache
+    # grows over max_bytes. The size is scanned once and then kept as a
+    # running total of the entries stored by this object, entries of other
+    # processes are counted at the next scan (by evict()).
+
+    def __init__(self, directory, max_bytes=2 * 1024**3):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self._size = None
+        os.makedirs(os.path.join(self.directory, 'entries'), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, 'paths'), exist_ok=True)
+
+    def parse(self, parse_function, input_file, header_lines=None):
+        # Returns (data, header) of parse_function(input_file, header_lines),
+        # from the cache when possible
+        entry = self._entry_directory(parse_function, input_file, header_lines)
+
+        if os.path.isdir(entry):
+            try:
+                data, header = self._load(entry)
+                os.utime(entry)
+                return data, header
+            except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+                # Incomplete or damaged entry, parse again
+                shutil.rmtree(entry, ignore_errors=True)
+
+        data, header = parse_function(input_file, header_lines)
+        self._store(entry, data, header)
+
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += self._entry_size(entry)
+        if self._size > self.max_bytes:
+            self.evict()
+        return data, header
+
+    def size(self):
+        # Total size of all entries in bytes
+        return sum(size for _, _, size in self._entries())
+
+    def evict(self, max_bytes=None):
+        # Removes least recently used entries until the cache fits max_bytes
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+
+        for entry, _, size in entries:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+        self._size = total
+
+    def clear(self):
+        self._size = 0
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(os.path.join(self.directory, 'entries'), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, 'paths'), exist_ok=True)
+
+    def _entry_directory(self, parse_function, input_file, header_lines):
+        header_key = 'auto' if header_lines is None else str(int(header_lines))
+        name = f'{self._content_hash(input_file)}_{parse_function.__name__}_{header_key}'
+        return os.path.join(self.directory, 'entries', name)
+
+    def _content_hash(self, input_file):
+        # Content hash of the file, recomputed only when path, size or mtime changed
+        path = os.path.abspath(input_file)
+        status = os.stat(path)
+        record_file = os.path.join(self.directory, 'paths', hashlib.sha1(path.encode()).hexdigest() + '.json')
+
+        try:
+            with open(record_file) as file:
+                record = json.load(file)
+            if record['path'] == path and record['size'] == status.st_size and record['mtime_ns'] == status.st_mtime_ns:
+                return record['content_hash']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        content_hash = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                content_hash.update(chunk)
+
+        record = {'path': path, 'size': status.st_size, 'mtime_ns': status.st_mtime_ns, 'content_hash': content_hash.hexdigest()}
+        self._write_atomic(record_file, json.dumps(record).encode())
+        return record['content_hash']
+
+    def _load(self, entry):
+        with open(os.path.join(entry, 'header.pkl'), 'rb') as file:
+            header, columns = pickle.load(file)
+
+        data = {name: np.load(os.path.join(entry, f'{name}.npy'), mmap_mode='r') for name in columns}
+        return data, header
+
+    def _store(self, entry, data, header):
+        # Written to a temporary directory and renamed, so parallel workers
+        # never see a partial entry
+        temporary = tempfile.mkdtemp(dir=os.path.join(self.directory, 'entries'), prefix='.tmp')
+        try:
+            for name, values in data.items():
+                np.save(os.path.join(temporary, f'{name}.npy'), np.asarray(values), allow_pickle=False)
+            with open(os.path.join(temporary, 'header.pkl'), 'wb') as file:
+                pickle.dump((header, list(data)), file)
+            os.replace(temporary, entry)
+        except OSError:
+            # Entry stored meanwhile by another process
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    def _entries(self):
+        # (path, last use, size) of all complete entries
+        entries = []
+        root = os.path.join(self.directory, 'entries')
+        for name in os.listdir(root):
+            entry = os.path.join(root, name)
+            if name.startswith('.tmp') or not os.path.isdir(entry):
+                continue
+            entries.append((entry, os.path.getmtime(entry), self._entry_size(entry)))
+        return entries
+
+    def _entry_size(self, entry):
+        try:
+            return sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+        except OSError:
+            # Evicted meanwhile by another process
+            return 0
+
+    def _write_atomic(self, path, content):
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(content)
+        os.replace(temporary, path)
+
+
+class MemoryCache:
+    # Parsed files kept in memory for the life of the object (one process),
+    # same interface as SurveyCache, e.g. to process the same files with many
+    # settings. Misses go to the parent cache (e.g. a SurveyCache) if given.
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.entries = {}
+
+    def parse(self, parse_function, input_file, header_lines=None):
+        key = (parse_function.__name__, os.path.abspath(input_file), header_lines)
+        if key not in self.entries:
+            self.entries[key] = (parse_function(input_file, header_lines) if self.parent is None
+                                 else self.parent.parse(parse_function, input_file, header_lines))
+        return self.entries[key]
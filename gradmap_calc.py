@@ -1,915 +1,1469 @@
-import numpy as np
-import pandas as pd
-from datetime import datetime
-from scipy.stats import t
-
-
-def gradient_linear(input_file, header_lines, instrument_type, number_of_measured_levels, calibration_factor, SD_scale_information, input_units_option, significance, SD00):
-    # Read data from file
-    filedata = pd.read_csv(input_file, header=header_lines, delimiter=r'\s+', 
-                           names=['col1', 'points', 'height', 'grav', 'col5', 'col6', 'col7', 'col8', 'col9', 'col10', 'col11', 'dn', 'col13', 'YY', 'col15', 'col16'],
-                           dtype={'points': str, 'YY': int})
-
-    # Point ID information
-    points = filedata['points']
-    uniquepoints = points.unique()
-    measured_points = [p if p.isdigit() else f'{float(p):8.2f}' for p in uniquepoints]
-
-    # Datetime numeric information for each measurement (dn)
-    dn = filedata['dn']
-
-    # Time information (dtime)
-    dtime_t = pd.to_datetime(dn, origin='datenum', unit='D')
-    dtime = pd.to_datetime(filedata['YY']*1000000 + filedata['col15']*10000 + filedata['col16']*100 + dtime_t.dt.hour*10000 + dtime_t.dt.minute*100 + dtime_t.dt.second, format='%Y%m%d%H%M%S')
-
-    # Height above surface (mark) - converted to meters
-    height = (filedata['height'] - 21.1) / 100 if input_units_option == 1 else (filedata['height'] - 0.211) if input_units_option == 2 and (filedata['height'].mean() > 3) else (filedata['height'] - 21.1) / 100
-
-    # Measured mGal units converted to μGal
-    grav = filedata['grav'] * 1000 if calibration_factor is None else filedata['grav'] * 1000 * calibration_factor
-
-    # Reducing measured values to a point using normal gradient
-    grav = grav + height * (308.6)
-
-    # Least Square Adjustment - deterministic model
-    n0 = len(points)  # number of measurements taken
-    k = len(uniquepoints)  # number of measured levels
-
-    # Drift polynomial degree
-    polynomial_degree = 2
-
-    # Jacobi matrix, point section
-    A = np.zeros((n0, k))
-    for i, unique_point in enumerate(uniquepoints):
-        ind = points == unique_point
-        A[ind, i] = 1
-        A[~ind, i] = 0
-
-    # Average height for individual measured levels
-    level_height = np.array([height[ind].mean() for ind in A.astype(bool)])
-
-    # Jacobi matrix, drift part
-    A = np.column_stack([A, np.ones(n0)])
-    for i in range(k + 1, k + 1 + polynomial_degree):
-        A = np.column_stack([A, (dn - dn.iloc[0])**(i - k - 1)])
-
-    # Regularization - by default first column is removed to fix position 1 as starting
-    A = np.delete(A, 0, axis=1)
-
-    # Load errors from filedata
-    ERR = filedata['col5'] * 1000
-
-    # Scale errors
-    if SD_scale_information == 1:
-        ERR = ERR / np.sqrt(60)
-
-    # Weights
-    weight = np.mean(ERR) / ERR
-
-    # Weight matrix
-    P = np.diag(weight)
-
-    # Covariance matrix of measurements
-    Q = np.linalg.inv(P)
-    C = (SD00**2) * Q
-
-    # Parameter adjustment using LSE formulas
-    adjusted_parameters = np.linalg.inv(A.T @ np.linalg.inv(C) @ A) @ A.T @ np.linalg.inv(C) @ grav
-
-    # Measurement errors to adjusted parameters
-    v = A @ adjusted_parameters - grav
-
-    # Root mean square error
-    rmse1 = np.sqrt((v.T @ np.linalg.inv(C) @ v) / (n0 - k - 2 - polynomial_degree))
-
-    # Covariance matrix of adjusted parameters
-    C_theta = (rmse1**2) * np.linalg.inv(A.T @ np.linalg.inv(C) @ A)
-
-    # Standard deviation of adjusted parameters
-    SD_theta = np.sqrt(np.diag(C_theta))
-
-    # Drift coefficients
-    drift_koef = adjusted_parameters[-polynomial_degree:]
-    AA = A[:, -polynomial_degree:]
-
-    # Residual (transportation drift)
-    res_drift = AA @ drift_koef
-
-    # Test values
-    test = res_drift + v
-
-    # Average drift value to subtract later
-    res_drift_av = np.mean(res_drift)
-
-    # Outliers testing
-    if significance == 1:
-        significance_level = 0.32
-        students_inverse_approximate = 480.7 * np.exp(-2.068 * (n0 - k)) + 2.847 * np.exp(-0.000441 * (n0 - k))
-
-    elif significance == 2:
-        significance_level = 0.05
-        students_inverse_approximate = 43.06 * np.exp(-1.403 * (n0 - k)) + 2.071 * np.exp(-0.0002368 * (n0 - k))
-
-    elif significance == 3:
-        significance_level = 0.01
-        students_inverse_approximate = 1.633 * np.exp(-0.7396 * (n0 - k)) + 1.013 * np.exp(-7.638e-05 * (n0 - k))
-
-    # Outliers indexes
-    index_outliers = np.where(np.abs(v) >= SD00 * rmse1 * significance)[0]
-
-    # Statistical testing of parameters
-    Tau = adjusted_parameters[-1] / SD_theta[-1]
-
-    # Quadratic component significance testing
-    has_license_for_toolbox = False  # Please replace this with your own check for the Statistics Toolbox
-
-    if not has_license_for_toolbox:
-        students_inverse = students_inverse_approximate
-
-        if np.abs(Tau) < students_inverse:
-            polynomial_degree_new = 1  # Drift approx. function set to linear
-        else:
-            polynomial_degree_new = 2  # Drift approx. function remains quadratic
-
-    else:  # If working with statistic toolbox
-        students_inverse = t.ppf(1 - (significance_level) / 2, n0 - k)
-
-        if np.abs(Tau) < students_inverse:
-            polynomial_degree_new = 1  # Drift approx. function set to linear
-        else:
-            polynomial_degree_new = 2  # Drift approx. function remains quadratic
-
-    # Removing outliers
-    grav = np.delete(grav, index_outliers)
-    dn = np.delete(dn, index_outliers)
-    points = np.delete(points, index_outliers)
-    ERR = np.delete(ERR, index_outliers)
-    YY = np.delete(filedata['YY'], index_outliers)
-
-    n = len(points)
-    A = np.zeros((n, k))
-
-    # Reprocessing without outliers
-    for i, unique_point in enumerate(uniquepoints):
-        ind = points == unique_point
-        A[ind, i] = 1
-        A[~ind, i] = 0
-
-    # The not so useful part of Jacobi's matrix
-    A = np.column_stack([A, np.ones(n)])
-    for i in range(k + 1, k + 1 + polynomial_degree_new):
-        A = np.column_stack([A, (dn - dn[0])**(i - k - 1)])
-
-    # Jacobi Matrix new
-    A = np.delete(A, 0, axis=1)
-
-    # New weighing
-    weight = np.mean(ERR) / ERR
-    P = np.diag(weight)
-    Q = np.linalg.inv(P)
-    C = (SD00**2) * Q  # Factor and Covariance matrix
-
-    # New adjusted parameters without considering outliers in the processing
-    adjusted_parameters_new = np.linalg.inv(A.T @ np.linalg.inv(C) @ A) @ A.T @ np.linalg.inv(C) @ grav
-
-    # Measurements errors to adjusted parameters
-    v = A @ adjusted_parameters_new - grav
-    rmse2 = np.sqrt((v.T @ np.linalg.inv(C) @ v) / (n - k - 2 - polynomial_degree_new - 1))
-    C_theta = (rmse2**2) * np.linalg.inv(A.T @ np.linalg.inv(C) @ A)
-    SD_theta_new = np.sqrt(np.diag(C_theta))
-
-    drift_koef2 = adjusted_parameters_new[-polynomial_degree_new:]
-    AA = A[:, -polynomial_degree_new:]
-
-    # New drift
-    res_drift_new = AA @ drift_koef2
-    res_drift_new_av = np.mean(res_drift_new)
-
-    # Time information - dtime (datetime)
-    dtime_t_new = pd.to_datetime(dn, origin='datenum', unit='D')
-    dtime_new = pd.to_datetime(YY*1000000 + dtime_t_new.dt.month*10000 + dtime_t_new.dt.day*100 + dtime_t_new.dt.hour*10000 + dtime_t_new.dt.minute*100 + dtime_t_new.dt.second, format='%Y%m%d%H%M%S')
-
-    # Output dictionary
-    output_gravity_diff = {
-        'stationinfo': {
-            'filename': input_file.ljust(100),
-            'measurement_date': str(dtime_new.iloc[0]),
-            'measuredpoints': measured_points
-        },
-        'time': {
-            'all_measurements': dtime,
-            'no_outliers': dtime_new,
-            'outliers': dtime.iloc[index_outliers].tolist()
-        },
-        'processing': {
-            'number_of_measurements': n0,
-            'rejected_measurements': n0 - n,
-            'RMSE': rmse2 * SD00,
-            'errors_all': (test - res_drift_av).tolist(),
-            'errors_outliers': (test.iloc[index_outliers] - res_drift_av).tolist()
-        },
-        'drift': {
-            'polynomial_degree': str(polynomial_degree_new),
-            'drift_all_measurements': (res_drift - res_drift_av).tolist(),
-            'drift_no_outliers': (res_drift_new - res_drift_new_av).tolist()
-        },
-        'adjusted': {
-            'differences': adjusted_parameters_new[:-polynomial_degree_new-1].tolist(),
-            'std': SD_theta_new[:-polynomial_degree_new-1].tolist()
-        }
-    }
-    return output_gravity_diff
-
-
-
-
-def gradient_linear(input_file, header_lines, calibration_factor, SD_scale_information, number_of_measured_levels, input_units_option, significance, SD00):
-    
-    
-    
-
-    # Least Square Adjustment - deterministic model
-    n0 = len(points)
-    uniquepoints = points.unique()
-    k = len(uniquepoints)
-
-    # Drift polynomial degree
-    polynomial_degree = 2
-
-    # Jacobi matrix, point section
-    A = np.zeros((n0, k))
-    level_height = np.zeros((k, 1))
-
-    for i, unique_point in enumerate(uniquepoints):
-        ind = points == unique_point
-        A[ind, i] = 1
-        level_height[i, 0] = height[ind].mean()
-
-    # Jacobi matrix, drift part
-    A[:, k] = 1
-    for i in range(k + 1, k + 1 + polynomial_degree):
-        A[:, i] = (dn - dn.iloc[0]).pow(i - (k + 1))
-
-    # Regularization
-    A = np.delete(A, 0, axis=1)
-
-    # Scaling
-    if SD_scale_information == 1:
-        ERR = ERR / np.sqrt(60)
-
-    # Weights
-    weight = np.mean(ERR) / ERR
-
-    # Weight matrix
-    P = np.diag(weight)
-
-    # Covariance matrix of measurements
-    Q = np.linalg.inv(P)
-    C = SD00**2 * Q
-
-    # Parameter adjustment using LSE formulas
-    adjusted_parameters = np.linalg.inv(A.T @ np.linalg.inv(C) @ A) @ A.T @ np.linalg.inv(C) @ grav
-    v = A @ adjusted_parameters - grav
-    rmse1 = np.sqrt((v.T @ np.linalg.inv(C) @ v) / (n0 - k - 2 - polynomial_degree))
-    C_theta = (rmse1**2) * np.linalg.inv(A.T @ np.linalg.inv(C) @ A)
-    SD_theta = np.sqrt(np.diag(C_theta))
-
-    # Drift coefficients
-    drift_koef = adjusted_parameters[-polynomial_degree:]
-    AA = A[:, -polynomial_degree:]
-
-    res_drift = AA @ drift_koef
-    test = res_drift + v
-    res_drift_av = np.mean(res_drift)
-
-    # Outliers testing
-    if significance == 1:
-        significance_level = 0.32
-        students_inverse_approximate = 480.7 * np.exp(-2.068 * (n0 - k)) + 2.847 * np.exp(-0.000441 * (n0 - k))
-    elif significance == 2:
-        significance_level = 0.05
-        students_inverse_approximate = 43.06 * np.exp(-1.403 * (n0 - k)) + 2.071 * np.exp(-0.0002368 * (n0 - k))
-    elif significance == 3:
-        significance_level = 0.01
-        students_inverse_approximate = 1.633 * np.exp(-0.7396 * (n0 - k)) + 1.013 * np.exp(-7.638e-05 * (n0 - k))
-
-    index_outliers = np.where(np.abs(v) >= SD00 * rmse1 * significance)[0]
-
-    Tau = adjusted_parameters[-1] / SD_theta[-1]
-
-    has_license_for_toolbox = False  # Assuming no statistical toolbox license
-
-    if has_license_for_toolbox:
-        students_inverse = 1.0  # Replace with actual tinv() function call
-    else:
-        students_inverse = students_inverse_approximate
-
-    polynomial_degree_new = 1 if np.abs(Tau) < students_inverse else 2
-
-    # Removing outliers
-    grav = np.delete(grav, index_outliers)
-    dn = np.delete(dn, index_outliers)
-    points = np.delete(points, index_outliers)
-    ERR = np.delete(ERR, index_outliers)
-
-    n = len(points)
-
-    # Reprocessing without outliers
-    A = np.zeros((n, k))
-
-    for i, unique_point in enumerate(uniquepoints):
-        ind = points == unique_point
-        A[ind, i] = 1
-
-    A[:, k] = 1
-    for i in range(k + 1, k + 1 + polynomial_degree_new):
-        A[:, i] = (dn - dn.iloc[0]).pow(i - (k + 1))
-
-    A = np.delete(A, 0, axis=1)
-
-    weight = np.mean(ERR) / ERR
-    P = np.diag(weight)
-    Q = np.linalg.inv(P)
-    C = SD00**2 * Q
-
-    adjusted_parameters_new = np.linalg.inv(A.T @ np.linalg.inv(C) @ A) @ A.T @ np.linalg.inv(C) @ grav
-    v = A @ adjusted_parameters_new - grav
-    rmse2 = np.sqrt((v.T @ np.linalg.inv(C) @ v) / (n - k - 2 - polynomial_degree_new - 1))
-    C_theta = (rmse2**2) * np.linalg.inv(A.T @ np.linalg.inv(C) @ A)
-    SD_theta_new = np.sqrt(np.diag(C_theta))
-
-    drift_koef2 = adjusted_parameters_new[-polynomial_degree_new:]
-    AA = A[:, -polynomial_degree_new:]
-
-    res_drift_new = AA @ drift_koef2
-    res_drift_new_av = np.mean(res_drift_new)
-
-    dtime_t_new = pd.to_datetime(dn, format='%Y%m%d%H%M%S')
-    av_height = np.sum(level_height) / number_of_measured_levels
-
-    if number_of_measured_levels == 2:
-        if len(uniquepoints) > number_of_measured_levels:
-            print('File contains data from more than 2 points - Check point Id for any typos.')
-        elif len(uniquepoints) == number_of_measured_levels:
-            av_Wzz = adjusted_parameters_new[0] / np.abs(level_height[1] - level_height[0])
-            sigma_av_Wzz = np.sqrt((SD_theta_new[0] / np.abs(level_height[1] - level_height[0]))**2)
-            av_height = np.sum(level_height) / number_of_measured_levels
-
-    elif number_of_measured_levels == 3:
-        if len(uniquepoints) > number_of_measured_levels:
-            print('File contains data from more than 3 points - Check point Id for any typos.')
-        elif len(uniquepoints) == number_of_measured_levels:
-            height_dif = np.abs(level_height[1:] - level_height[0])
-            Wzz = adjusted_parameters_new[:2] / height_dif[:2]
-            sigma_Wzz = np.sqrt((SD_theta_new[:2] / height_dif[:2])**2)
-            Wzz = np.append(Wzz, (adjusted_parameters_new[1] - adjusted_parameters_new[0]) / height_dif[2])
-            dg_sigma = np.sqrt(SD_theta_new[0]**2 + SD_theta_new[1]**2)
-            sigma_Wzz = np.append(sigma_Wzz, np.sqrt((dg_sigma / height_dif[2])**2))
-
-            av_Wzz = np.mean(Wzz)
-            sigma_av_Wzz = np.sqrt(np.sum(sigma_Wzz**2) / number_of_measured_levels)
-            av_height = np.sum(level_height) / number_of_measured_levels
-
-    elif number_of_measured_levels == 4:
-        if len(uniquepoints) == number_of_measured_levels:
-            relg = adjusted_parameters_new[:-polynomial_degree_new-1]
-            Dg = np.array([relg[2] - relg[1], relg[1] - relg[0], relg[0], relg[2], relg[2] - relg[0], relg[1]])
-            height_dif = np.array([level_height[3] - level_height[2], level_height[2] - level_height[1],
-                                   level_height[1] - level_height[0], level_height[3] - level_height[0],
-                                   level_height[3] - level_height[1], level_height[2] - level_height[0]])
-
-            Wzz = Dg / height_dif
-            av_Wzz = np.mean(Wzz)
-
-            SD_Wzz = np.zeros(6)
-            SD_Wzz[0] = np.sqrt((SD_theta[1] / height_dif[0])**2)
-            SD_Wzz[1] = np.sqrt((SD_theta[0] / height_dif[1])**2)
-            SD_Wzz[2] = np.sqrt((SD_theta[3] / height_dif[2])**2 + (SD_theta[0] / height_dif[2])**2)
-            SD_Wzz[3] = np.sqrt((SD_theta[2] / height_dif[3])**2)
-            SD_Wzz[4] = np.sqrt((SD_theta[0] / height_dif[4])**2 + (SD_theta[2] / height_dif[4])**2)
-            SD_Wzz[5] = np.sqrt((SD_theta[1] / height_dif[5])**2 + (SD_theta[3] / height_dif[5])**2)
-
-            sigma_av_Wzz = np.mean(SD_Wzz)
-            av_height = np.sum(level_height) / number_of_measured_levels
-        elif len(uniquepoints) < 4:
-            print('Why would you measure at more than four levels?')
-
-    output_linear = {
-        'stationinfo': {
-            'ID': measured_station_ID,
-            'filename': input_file.ljust(100),
-            'measurement_date': dtime_t_new.iloc[0].strftime('%Y-%m-%d %H:%M:%S')
-        },
-        'time': {
-            'all_measurements': dtime,
-            'no_outliers': dtime_t_new,
-            'outliers': dtime.iloc[index_outliers].to_list()
-        },
-        'processing': {
-            'number_of_measurements': n0,
-            'number_of_rejected_measurements': n0 - n,
-            'errors_all': test - res_drift_av,
-            'errors_outliers': test.iloc[index_outliers].to_list() - res_drift_av,
-            'RMSE': rmse2 * SD00
-        },
-        'drift': {
-            'polynomial_degree': str(polynomial_degree_new),
-            'drift_all_measurements': res_drift - res_drift_av,
-            'drift_no_outliers': res_drift_new - res_drift_new_av
-        },
-        'gradient': {
-            'average_height': f'{av_height:.3f}',
-            'average_gradient': f'{av_Wzz:.1f}',
-            'std': f'{sigma_av_Wzz:.1f}',
-            'average_height_num': av_height,
-            'average_gradient_num': av_Wzz,
-            'std_num': sigma_av_Wzz
-        }
-    }
-
-    return output_linear
-
-
-def gradient_function(input_file, header_lines, calibration_factor, SD_scale_information, input_units_option, significance, SD00):
-
-    # Deterministic model
-    n0 = len(points)  # number of measurements taken
-    k = len(uniquepoints)  # number of measured levels
-
-    # Drift polynomial degrees
-    polynomial_degree_time = 2
-    polynomial_degree_height = k - 1
-
-    # Jacobi matrix creation - first column
-    A = np.ones((n0, 1))
-
-    # Jacobi matrix - 2nd part: height section
-    for i in range(2, polynomial_degree_height + 2):
-        A = np.column_stack([A, height**(i - 1)])
-
-    # Jacobi matrix - 3rd part: drift section
-    for i in range(polynomial_degree_height + 2, polynomial_degree_height + 2 + polynomial_degree_time):
-        A = np.column_stack([A, (dn - dn.iloc[0])**(i - (1 + polynomial_degree_height))])
-
-    # Scale errors
-    if SD_scale_information == 1:
-        ERR = ERR / np.sqrt(60)
-
-    # Weights
-    weight = np.mean(ERR) / ERR
-
-    # Weight matrix
-    P = np.diag(weight)
-
-    # Covariance matrix of measurements
-    Q = np.linalg.inv(P)
-    C = (SD00**2) * Q
-
-    # Parameter adjustment using LSE formulas
-    adjusted_parameters = np.linalg.inv(A.T @ np.linalg.inv(C) @ A) @ A.T @ np.linalg.inv(C) @ grav
-
-    # Measurement errors to adjusted parameters
-    v = A @ adjusted_parameters - grav
-
-    # Root mean square error
-    rmse1 = np.sqrt((v.T @ np.linalg.inv(C) @ v) / (n0 - len(A.T) - 1))
-
-    # Covariance matrix of adjusted parameters
-    C_theta = (rmse1**2) * np.linalg.inv(A.T @ np.linalg.inv(C) @ A)
-
-    # Standard deviation of adjusted parameters
-    SD_theta = np.sqrt(np.diag(C_theta))
-
-    # Drift coefficients
-    drift_koef = adjusted_parameters[-polynomial_degree_time:]
-    A_drift = A[:, -polynomial_degree_time:]
-
-    # Residual (transportation drift)
-    res_drift = A_drift @ drift_koef
-
-    # Test values
-    test1 = res_drift + v
-
-    # Average drift value to subtract later
-    res_drift_av = np.mean(res_drift)
-
-    # Outliers testing
-    if significance == 1:
-        significance_level = 0.32
-        students_inverse_approximate = 480.7 * np.exp(-2.068 * (n0 - len(A.T))) + 2.847 * np.exp(-0.000441 * (n0 - len(A.T)))
-
-    elif significance == 2:
-        significance_level = 0.05
-        students_inverse_approximate = 43.06 * np.exp(-1.403 * (n0 - len(A.T))) + 2.071 * np.exp(-0.0002368 * (n0 - len(A.T)))
-
-    elif significance == 3:
-        significance_level = 0.01
-        students_inverse_approximate = 1.633 * np.exp(-0.7396 * (n0 - len(A.T))) + 1.013 * np.exp(-7.638e-05 * (n0 - len(A.T)))
-
-    # Outliers indexes
-    index_outliers = np.where(np.abs(v) >= SD00 * rmse1 * significance)[0]
-
-    # Statistical testing of parameters
-    Tau1 = adjusted_parameters[-1] / SD_theta[-1]
-    Tau2 = adjusted_parameters[-polynomial_degree_time] / SD_theta[-polynomial_degree_time]
-
-    # Quadratic component significance testing
-    has_license_for_toolbox = False  # Please replace this with your own check for the Statistics Toolbox
-
-    if not has_license_for_toolbox:
-        students_inverse = students_inverse_approximate
-
-        if np.abs(Tau1) < students_inverse:
-            polynomial_degree_time_final = polynomial_degree_time - 1
-        else:
-            polynomial_degree_time_final = polynomial_degree_time
-
-        if np.abs(Tau2) < students_inverse:
-            polynomial_degree_height_new = polynomial_degree_height - 1
-        else:
-            polynomial_degree_height_new = polynomial_degree_height
-
-    else:
-        students_inverse = t.ppf(1 - (significance_level) / 2, n0 - len(A.T))
-
-        if np.abs(Tau1) < students_inverse:
-            polynomial_degree_time_final = 1
-        else:
-            polynomial_degree_time_final = 2
-
-        if np.abs(Tau2) < students_inverse:
-            polynomial_degree_height_new = polynomial_degree_height - 1
-        else:
-            polynomial_degree_height_new = polynomial_degree_height
-
-    # Removing outliers 1
-    grav_new = np.delete(grav, index_outliers)
-    dn_new = np.delete(dn, index_outliers)
-    points_new = np.delete(points, index_outliers)
-    ERR_new = np.delete(ERR, index_outliers)
-    YY_new = np.delete(filedata['YY'], index_outliers)
-    height_new = np.delete(height, index_outliers)
-
-    # Reprocessing without outliers 1
-    A = np.ones((len(points_new), 1))
-
-    for i in range(2, polynomial_degree_height_new + 2):
-        A = np.column_stack([A, height_new**(i - 1)])
-
-    for i in range(polynomial_degree_height_new + 2, polynomial_degree_height_new + 2 + polynomial_degree_time_final):
-        A = np.column_stack([A, (dn_new - dn_new[0])**(i - (1 + polynomial_degree_height_new))])
-
-    nrows, lgt = A.shape
-
-    # Weights
-    weight = np.mean(ERR_new) / ERR_new
-
-    # Weight matrix
-    P = np.diag(weight)
-
-    # Covariance matrix of measurements
-    Q = np.linalg.inv(P)
-    C = (SD00**2) * Q
-
-    # Parameter adjustment without outliers 1
-    adjusted_parameters_new = np.linalg.inv(A.T @ np.linalg.inv(C) @ A) @ A.T @ np.linalg.inv(C) @ grav_new
-
-    # Measurement errors to adjusted parameters
-    v_new = A @ adjusted_parameters_new - grav_new
-
-    # Root mean square error
-    rmse2 = np.sqrt((v_new.T @ np.linalg.inv(C) @ v_new) / (nrows - lgt))
-
-    # Covariance matrix of adjusted parameters
-    C_theta = (rmse2**2) * np.linalg.inv(A.T @ np.linalg.inv(C) @ A)
-
-    # Standard deviation of adjusted parameters
-    SD_theta_new = np.sqrt(np.diag(C_theta))
-
-    # Drift coefficients
-    drift_koef = adjusted_parameters_new[-polynomial_degree_time_final:]
-    A_drift = A[:, -polynomial_degree_time_final:]
-
-    # Residual (transportation drift)
-    res_drift_new = A_drift @ drift_koef
-
-    # Test values
-    test2 = res_drift_new + v_new
-
-    # Average drift value to subtract later
-    res_drift_av_new = np.mean(res_drift_new)
-
-    # Time information (datetime) for reprocessed data without outliers 1
-    dtime_t_new = pd.to_datetime(dn_new, origin='datenum', unit='D')
-    dtime_new = pd.to_datetime(YY_new*1000000 + dtime_t_new.dt.month*10000 + dtime_t_new.dt.day*100 + dtime_t_new.dt.hour*10000 + dtime_t_new.dt.minute*100 + dtime_t_new.dt.second, format='%Y%m%d%H%M%S')
-
-    # Outliers indexes after reprocessing without outliers 1
-    index_outliers_new = np.where(np.abs(v_new) >= SD00 * rmse2 * significance)[0]
-
-    # Statistical testing of parameters
-    Tau2_new = adjusted_parameters_new[-polynomial_degree_time_final] / SD_theta_new[-polynomial_degree_time_final]
-
-    # Quadratic component significance testing (2nd round)
-    if not has_license_for_toolbox:
-
-        if np.abs(Tau2_new) < np.sqrt(students_inverse_approximate):
-            polynomial_degree_height_final = polynomial_degree_height_new - 1
-        else:
-            polynomial_degree_height_final = polynomial_degree_height_new
-
-    else:
-        students_inverse = t.ppf(1 - (significance_level) / 2, nrows - lgt)
-
-        if np.abs(Tau2_new) < np.sqrt(students_inverse):
-            polynomial_degree_height_final = polynomial_degree_height_new - 1
-        else:
-            polynomial_degree_height_final = polynomial_degree_height_new
-
-    # Removing outliers 2
-    grav_final = np.delete(grav_new, index_outliers_new)
-    dn_final = np.delete(dn_new, index_outliers_new)
-    points_final = np.delete(points_new, index_outliers_new)
-    ERR_final = np.delete(ERR_new, index_outliers_new)
-    YY_final = np.delete(YY_new, index_outliers_new)
-    height_final = np.delete(height_new, index_outliers_new)
-
-    # Reprocessing without outliers 2
-    A = np.ones((len(points_final), 1))
-
-    for i in range(2, polynomial_degree_height_final + 2):
-        A = np.column_stack([A, height_final**(i - 1)])
-
-    for i in range(polynomial_degree_height_final + 2, polynomial_degree_height_final + 2 + polynomial_degree_time_final):
-        A = np.column_stack([A, (dn_final - dn_final[0])**(i - (1 + polynomial_degree_height_final))])
-
-    nrows, lgt = A.shape
-
-    # Weights
-    weight = np.mean(ERR_final) / ERR_final
-
-    # Weight matrix
-    P = np.diag(weight)
-
-    # Covariance matrix of measurements
-    Q = np.linalg.inv(P)
-    C = (SD00**2) * Q
-
-    # Parameter adjustment without outliers 2
-    adjusted_parameters_final = np.linalg.inv(A.T @ np.linalg.inv(C) @ A) @ A.T @ np.linalg.inv(C) @ grav_final
-
-    # Measurement errors to adjusted parameters
-    v_final = A @ adjusted_parameters_final - grav_final
-
-    # Root mean square error
-    rmse3 = np.sqrt((v_final.T @ np.linalg.inv(C) @ v_final) / (nrows - lgt))
-
-    # Covariance matrix of adjusted parameters
-    C_theta = (rmse3**2) * np.linalg.inv(A.T @ np.linalg.inv(C) @ A)
-
-    # Standard deviation of adjusted parameters
-    SD_theta_final = np.sqrt(np.diag(C_theta))
-
-    # Drift coefficients
-    drift_koef = adjusted_parameters_final[-polynomial_degree_time_final:]
-    A_drift = A[:, -polynomial_degree_time_final:]
-
-    # Residual (transportation drift)
-    res_drift_final = A_drift @ drift_koef
-
-    # Test values
-    test_final = res_drift_final + v_final
-
-    # Average drift value to subtract later
-    res_drift_av_final = np.mean(res_drift_final)
-
-    # Time information (datetime) for reprocessed data without outliers 2
-    dtime_t_final = pd.to_datetime(dn_final, origin='datenum', unit='D')
-    dtime_final = pd.to_datetime(YY_final*1000000 + dtime_t_final.dt.month*10000 + dtime_t_final.dt.day*100 + dtime_t_final.dt.hour*10000 + dtime_t_final.dt.minute*100 + dtime_t_final.dt.second, format='%Y%m%d%H%M%S')
-
-    # Output dictionary
-    output_function = {
-        'stationinfo': {
-            'ID': measured_station_ID,
-            'filename': input_file.ljust(100),
-            'measurement_date': str(dtime_new.iloc[0]),
-        },
-        'time': {
-            'all_measurements': dtime,
-            'no_outliers': dtime_final,
-        },
-        'processing': {
-            'number_of_measurements': nrows,
-            'number_of_rejected_measurements': n0 - nrows,
-            'errors_all': (test1 - res_drift_av).tolist(),
-            'outliers_removed': (test_final - res_drift_av_final).tolist(),
-            'RMSE': rmse3 * SD00,
-        },
-        'drift': {
-            'polynomial_degree': str(polynomial_degree_time_final),
-            'drift_all_measurements': (res_drift - res_drift_av).tolist(),
-            'drift_no_outliers': (res_drift_final - res_drift_av_final).tolist(),
-        },
-        'gradient': {
-            'polynomial_degree': str(polynomial_degree_height_final),
-            'gradient_param': adjusted_parameters_final[1:polynomial_degree_height_final + 1].tolist() + [0] * (3 - polynomial_degree_height_final),
-            'std': SD_theta_final[1:polynomial_degree_height_final + 1].tolist() + [0] * (3 - polynomial_degree_height_final),
-        },
-    }
-
-    return output_function
-
-def gravity_differences(input_file, header_lines, significance, SD_scale_information, instrument_type, calibration_factor):
-    
-    if instrument_type == 'CG5':
-    
-        filedata = read_CG5(input_file, header_lines, calibration_factor, SD_scale_information)
-    
-    uniquepoints = filedata['points'].unique()
-    grav = filedata['grav']
-    dn = filedata['datenum']
-    
-    measured_points = [p if p.isdigit() else f'{float(p):8.2f}' for p in uniquepoints]
-    # Least Square Adjustment - deterministic model
-    n0 = len(filedata['points'])  # number of measurements taken
-    k = len(uniquepoints)  # number of measured points
-    
-    # starting drift polynomial degree
-    polynomial_degree = 2
-    
-    
-    
-    
-    
-    # Jacobi matrix, point section
-    A = np.zeros((n0, k))
-    for i, unique_point in enumerate(uniquepoints):
-        ind = filedata['points'] == unique_point
-        A[ind, i] = 1
-    
-    # Jacobi matrix, drift part
-    A = np.column_stack([A, np.ones(n0)])
-    for i in range(k + 2 , k + 2 + polynomial_degree):
-        A = np.column_stack([A, (dn - dn[0])**(i - k - 1)])
-    # Regularization - by default first column is removed to fix position 1 as starting 
-    A = np.delete(A, 0, axis=1)
-    
-    
-    
-    
-    
-    # # Load errors from filedata and transfer from miliGal to microGal
-    C = np.diag(np.square(filedata['ERR'] ))
-    # Parameter adjustment using LSE formulas
-    adjusted_parameters = np.linalg.inv(A.T @ np.linalg.inv(C) @ A) @ A.T @ np.linalg.inv(C) @ grav
-    # Measurement errors to adjusted parameters
-    v = A @ adjusted_parameters - grav
-    # Root mean square error
-    rmse1 = np.sqrt((v.T @ np.linalg.inv(C) @ v) / (n0 - k - 2 - polynomial_degree))
-    # Covariance matrix of adjusted parameters
-    C_theta = (rmse1**2) * np.linalg.inv(A.T @ np.linalg.inv(C) @ A)
-    # Standard deviation of adjusted parameters
-    SD_theta = np.sqrt(np.diag(C_theta))
-    # Drift coefficients
-    drift_koef = adjusted_parameters[-polynomial_degree:]
-    AA = A[:, -polynomial_degree:]
-    # Residual (transportation drift)
-    res_drift = AA @ drift_koef
-    # Test values
-    test = res_drift + v
-    # Average drift value to subtract later
-    res_drift_av = np.mean(res_drift)
-    # Outliers testing
-    if significance == 1:
-        significance_level = 0.32
-    
-    elif significance == 2:
-        significance_level = 0.05
-    
-    elif significance == 3:
-        significance_level = 0.01
-    
-    # Outliers indexes
-    index_outliers = np.where(np.abs(v) >= 5 *3* rmse1 * significance)[0]
-    # Statistical testing of parameters
-    Tau = adjusted_parameters[-1] / SD_theta[-1]
-    # Quadratic component significance testing
-    
-    t_value = stats.t.ppf(1-significance_level/2, n0-k)
-    
-    if np.abs(Tau) < t_value:
-        polynomial_degree_new = 1  # Drift approx. function set to linear
-    else:
-        polynomial_degree_new = 2  # Drift approx. function remains quadratic
-    
-    # Removing outliers
-    grav = np.delete(grav, index_outliers)
-    dn = np.delete(dn, index_outliers)
-    points = np.delete(points, index_outliers)
-    ERR = np.delete(ERR, index_outliers)
-    
-    n = len(points)
-    A = np.zeros((n, k))
-    for i, unique_point in enumerate(uniquepoints):
-        ind = points == unique_point
-        A[ind, i] = 1
-    
-    # Jacobi matrix, drift part
-    A = np.column_stack([A, np.ones(n)])
-    for i in range(k + 2 , k + 2 + polynomial_degree):
-        A = np.column_stack([A, (dn - dn[0])**(i - k - 1)])
-        
-    # Regularization - by default first column is removed to fix position 1 as starting 
-    A = np.delete(A, 0, axis=1)
-    C = np.square(np.diag(ERR))
-    
-    # New adjusted parameters without considering outliers in the processing
-    adjusted_parameters_new = np.linalg.inv(A.T @ np.linalg.inv(C) @ A) @ A.T @ np.linalg.inv(C) @ grav
-    
-    # Measurements errors to adjusted parameters
-    v = A @ adjusted_parameters_new - grav
-    rmse2 = np.sqrt((v.T @ np.linalg.inv(C) @ v) / (n - k - 2 - polynomial_degree_new - 1))
-    C_theta = (rmse2**2) * np.linalg.inv(A.T @ np.linalg.inv(C) @ A)
-    SD_theta_new = np.sqrt(np.diag(C_theta))
-    
-    drift_koef2 = adjusted_parameters_new[-polynomial_degree_new:]
-    AA = A[:, -polynomial_degree_new:]
-    
-    # New drift
-    res_drift_new = AA @ drift_koef2
-    res_drift_new_av = np.mean(res_drift_new)
-    
-    # new Time information dtime (datetime)
-    dtime_new = pd.to_datetime(dn, unit='D', origin='unix')
-    
-    # Output dictionary
-    output_gravity_diff = {
-        'stationinfo': {
-            'filename': input_file.ljust(100),
-            'measurement_date': str(dtime_new[0]),
-            'measuredpoints': measured_points
-        },
-        'time': {
-            'all_measurements': dtime,
-            'no_outliers': dtime_new,
-            'outliers': dtime.iloc[index_outliers].tolist()
-        },
-        'processing': {
-            'number_of_measurements': n0,
-            'rejected_measurements': n0 - n,
-            'RMSE': rmse2,
-            'errors_all': (test - res_drift_av).tolist(),
-            'errors_outliers': (test.iloc[index_outliers] - res_drift_av).tolist()
-        },
-        'drift': {
-            'polynomial_degree': str(polynomial_degree_new),
-            'drift_all_measurements': (res_drift - res_drift_av).tolist(),
-            'drift_no_outliers': (res_drift_new - res_drift_new_av).tolist()
-        },
-        'adjusted': {
-            'differences': adjusted_parameters_new[:len(uniquepoints)-1].tolist(),
-            'std': SD_theta_new[:len(uniquepoints)-1].tolist()
-        },
-        'instrument_info': {
-            'GCAL1':GCAL1,
-            'SN':SN_str
-            }
-        }
-
-    return output_gravity_diff
-
-def read_CG5(input_file, header_lines, calibration_factor, SD_scale_information):
-    
-    # # Read data from file
-    filedata = pd.read_csv(input_file, header=header_lines, delimiter=r'\s+', 
-                            names=['col1', 'points', 'height', 'grav', 'SD', 'tiltx', 'tilty', 'temp_corr', 'tide_corr', 'duration', 'rejected', 'time', 'dn', 'terrain_col', 'date'],
-                            dtype={'points': str, 'height':float, 'time': str})
-
-    # Combine date and time into datetime column
-    filedata['datetime'] = pd.to_datetime(filedata['date'] + ' ' + filedata['time'], format='%Y/%m/%d %H:%M:%S')
-    
-    # Convert datetime to numeric date format (days since Unix epoch)
-    filedata['datenum']= filedata['datetime'].apply(lambda x: x.timestamp() / (24 * 3600))
-    
-    # Determine the adjustment based on testheight
-    if filedata['height'].iloc[0] > 2:
-        # Convert centimeters to meters: Subtract 21.1 and divide by 100
-        filedata['height'] = (filedata['height'] - 21.1) / 100
-    else:
-        # Assume default units are meters: Subtract 0.211
-        filedata['height'] = filedata['height'] - 0.211
-    
-    # Convert measured mGal units to μGal
-    filedata['grav'] *= 1000
-    # Reducing measured values to a point using normal gradient
-    filedata['grav'] = filedata['grav'] + filedata['height'] * 308.6
-    # Point ID information
-    
-    if SD_scale_information == 1:
-        filedata['ERR'] = filedata['SD'] / np.sqrt(60)
-    
-    return filedata
-
-
-# def read_CG6(input_file, header_lines, calibration_factor):
-    
-#     return CG6_data
\ No newline at end of file
+import io
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from scipy.linalg import cho_factor, cho_solve
+from scipy.stats import t
+
+from gradmap_profile import stage
+from gradmap_tide import longman_tide
+
+
+def jacobi_matrix(point_codes=None, number_of_points=0, time=None, drift_degree=0, height=None, height_degree=0, fix_first_point=True, tares=()):
+    # Jacobi matrix of the adjustment models assembled in one preallocated
+    # array. Column order: point section (one indicator column per point
+    # code, the first point left out when fixed as datum), tare section (a
+    # step from the reading index of each tare on), constant term, height
+    # polynomial (degrees 1..height_degree) and drift polynomial in time
+    # since the first reading (degrees 1..drift_degree).
+    n = len(next(x for x in (point_codes, time, height) if x is not None))
+    first = 1 if fix_first_point else 0
+    k = number_of_points - first if point_codes is not None else 0
+    constant = k + len(tares)
+
+    with stage('jacobi', rows=n, columns=constant + 1 + height_degree + drift_degree):
+        A = np.zeros((n, constant + 1 + height_degree + drift_degree))
+
+        # Point section, rows of the datum point have no indicator
+        if point_codes is not None:
+            point_codes = np.asarray(point_codes)
+            rows = np.flatnonzero(point_codes >= first)
+            A[rows, point_codes[rows] - first] = 1
+
+        # Tare section, readings are in time order
+        for column, start in enumerate(tares):
+            A[start:, k + column] = 1
+
+        # Constant term
+        A[:, constant] = 1
+
+        # Height and drift sections as Vandermonde blocks
+        if height_degree > 0:
+            np.power(np.asarray(height, dtype=float)[:, None], np.arange(1, height_degree + 1), out=A[:, constant + 1:constant + 1 + height_degree])
+
+        if drift_degree > 0:
+            time = np.asarray(time, dtype=float)
+            np.power((time - time[0])[:, None], np.arange(1, drift_degree + 1), out=A[:, constant + 1 + height_degree:])
+
+    return A
+
+
+def level_gradients(point_differences, level_height):
+    # Gradients between the measured levels from the gravity differences of
+    # the levels to the first (datum) level: 2 levels give one, 3 levels all
+    # three pairs and 4 levels all six pairs. point_differences may carry
+    # further axes (e.g. replicates, or stations with level_height of shape
+    # levels x stations), the gradients are stacked along axis 0.
+    point_differences = np.asarray(point_differences, dtype=float)
+    number_of_levels = len(level_height)
+
+    if number_of_levels == 2:
+        return point_differences[:1] / np.abs(level_height[1] - level_height[0])
+
+    if number_of_levels == 3:
+        height_dif = np.abs([level_height[1] - level_height[0], level_height[2] - level_height[0], level_height[2] - level_height[1]])
+        return np.stack([point_differences[0] / height_dif[0], point_differences[1] / height_dif[1],
+                         (point_differences[1] - point_differences[0]) / height_dif[2]])
+
+    if number_of_levels == 4:
+        relg = point_differences
+        Dg = np.stack([relg[2] - relg[1], relg[1] - relg[0], relg[0], relg[2], relg[2] - relg[0], relg[1]])
+        height_dif = np.array([level_height[3] - level_height[2], level_height[2] - level_height[1],
+                               level_height[1] - level_height[0], level_height[3] - level_height[0],
+                               level_height[3] - level_height[1], level_height[2] - level_height[0]])
+        return Dg / height_dif.reshape(height_dif.shape + (1,) * (Dg.ndim - height_dif.ndim))
+
+    raise ValueError(f'Gradient of {number_of_levels} levels is not supported, use 2, 3 or 4 levels')
+
+
+def level_gradient_std(SD_point_differences, level_height):
+    # Standard deviation of the average gradient of level_gradient from the
+    # standard deviations of the adjusted gravity differences, same axes as
+    # level_gradients
+    SD = np.asarray(SD_point_differences, dtype=float)
+    number_of_levels = len(level_height)
+
+    if number_of_levels == 2:
+        return SD[0] / np.abs(level_height[1] - level_height[0])
+
+    if number_of_levels == 3:
+        height_dif = np.abs(np.stack([level_height[1] - level_height[0], level_height[2] - level_height[0], level_height[2] - level_height[1]]))
+        sigma_Wzz = np.stack([SD[0] / height_dif[0], SD[1] / height_dif[1], np.sqrt(SD[0]**2 + SD[1]**2) / height_dif[2]])
+        return np.sqrt(np.sum(sigma_Wzz**2, axis=0) / number_of_levels)
+
+    if number_of_levels == 4:
+        # Standard deviations of the six differences from those of the
+        # three adjusted differences
+        SD_Dg = np.sqrt(np.stack([SD[2]**2 + SD[1]**2, SD[1]**2 + SD[0]**2, SD[0]**2, SD[2]**2, SD[2]**2 + SD[0]**2, SD[1]**2]))
+        height_dif = np.abs(np.stack([level_height[3] - level_height[2], level_height[2] - level_height[1],
+                                      level_height[1] - level_height[0], level_height[3] - level_height[0],
+                                      level_height[3] - level_height[1], level_height[2] - level_height[0]]))
+        return np.mean(SD_Dg / height_dif, axis=0)
+
+    raise ValueError(f'Gradient of {number_of_levels} levels is not supported, use 2, 3 or 4 levels')
+
+
+def level_gradient(point_differences, SD_point_differences, level_height):
+    # Average vertical gradient and its standard deviation for two, three or
+    # four measured levels from the adjusted gravity differences of the
+    # levels to the first (datum) level and their standard deviations
+    Wzz = level_gradients(point_differences, level_height)
+    return np.mean(Wzz, axis=0), level_gradient_std(SD_point_differences, level_height)
+
+
+def check_drift_degree(drift_degree):
+    # Drift models of the routines need at least a linear term, the drift
+    # coefficients are the last parameters of the adjustment
+    if drift_degree is None or int(drift_degree) != drift_degree or drift_degree < 1:
+        raise ValueError(f'drift_degree must be an integer of at least 1, got {drift_degree!r}')
+
+
+# Significance (1-, 2- or 3-sigma) to significance level of statistical tests
+SIGNIFICANCE_LEVELS = {1: 0.32, 2: 0.05, 3: 0.01}
+
+
+@lru_cache(maxsize=1024)
+def _students_inverse(significance_level, degrees_of_freedom):
+    return float(t.ppf(1 - significance_level / 2, degrees_of_freedom))
+
+
+def students_inverse(significance_level, degrees_of_freedom):
+    # Two-sided critical value of Student's t distribution (MATLAB tinv),
+    # cached by (significance level, degrees of freedom)
+    return _students_inverse(float(significance_level), int(degrees_of_freedom))
+
+
+class Observations:
+    # Readings of one file as contiguous arrays: gravity and errors in μGal,
+    # heights in metres, time as days since the Unix epoch and datetime64,
+    # points as integer codes into point_names (order of first reading).
+    # Rejected readings are only switched off in the active mask, arrays are
+    # never shortened; an Adjustment built with the same mask updates it.
+    __slots__ = ('point_codes', 'point_names', 'grav', 'ERR', 'height', 'datenum', 'datetime', 'active', 'header')
+
+    def __init__(self, points, grav, ERR, height, datenum, datetime=None, header=None):
+        point_codes, point_names = pd.factorize(np.asarray(points))
+        self.point_codes = np.ascontiguousarray(point_codes, dtype=np.int64)
+        self.point_names = np.asarray(point_names, dtype=str)
+        self.grav = np.ascontiguousarray(grav, dtype=np.float64)
+        self.ERR = np.ascontiguousarray(ERR, dtype=np.float64)
+        self.height = np.ascontiguousarray(height, dtype=np.float64)
+        self.datenum = np.ascontiguousarray(datenum, dtype=np.float64)
+        self.datetime = None if datetime is None else np.asarray(datetime, dtype='datetime64[s]')
+        self.active = np.ones(len(self.grav), dtype=bool)
+        self.header = {} if header is None else header
+
+    @classmethod
+    def from_frame(cls, filedata):
+        # From a read_CG5/read_CG6 table, numeric columns are taken without copies
+        return cls(filedata['points'].to_numpy(), filedata['grav'].to_numpy(), filedata['ERR'].to_numpy(),
+                   filedata['height'].to_numpy(), filedata['datenum'].to_numpy(), filedata['datetime'].to_numpy(),
+                   filedata.attrs.get('header'))
+
+    def __len__(self):
+        return len(self.grav)
+
+    @property
+    def number_of_observations(self):
+        return len(self.grav)
+
+    @property
+    def number_of_active(self):
+        return int(np.count_nonzero(self.active))
+
+    @property
+    def number_of_points(self):
+        return len(self.point_names)
+
+    @property
+    def points(self):
+        return self.point_names[self.point_codes]
+
+    def level_height(self):
+        # Average height of every point (all readings)
+        return np.bincount(self.point_codes, weights=self.height, minlength=self.number_of_points) / np.bincount(self.point_codes, minlength=self.number_of_points)
+
+
+# Tuning constants of the robust weight functions (95 % efficiency for
+# normally distributed errors), standardized residuals in units of the scale
+ROBUST_TUNING = {'huber': 1.345, 'tukey': 4.685}
+
+
+def robust_psi(u, weight_function, tuning=None):
+    # Influence function psi(u) of standardized residuals u: Huber clips
+    # them at +-c, Tukey's biweight redescends to zero beyond c
+    if weight_function not in ROBUST_TUNING:
+        raise ValueError(f'Unknown robust weight function {weight_function!r}, use one of {sorted(ROBUST_TUNING)}')
+    c = ROBUST_TUNING[weight_function] if tuning is None else tuning
+
+    if weight_function == 'huber':
+        return np.clip(u, -c, c)
+    return np.where(np.abs(u) < c, u * (1 - (u / c)**2)**2, 0)
+
+
+# Readings with a robust weight below this are reported as outliers
+# (|u| over about 2.5 for both weight functions)
+DOWNWEIGHTED = 0.5
+
+# Resampling methods of Adjustment.resample
+RESAMPLING_METHODS = ('bootstrap', 'montecarlo')
+
+
+class Adjustment:
+    # Weighted least squares adjustment kept as normal equations N x = b,
+    # N = A' P A and b = A' P l, with P the diagonal weight vector. Rejected
+    # observations are removed as rank-one downdates and parameters (columns)
+    # can be dropped or appended without recomputing the unchanged ones, so
+    # a refit without m outliers costs O(m p^2) instead of a full rebuild.
+
+    def __init__(self, A, observations, weight, active=None):
+        # active is an optional boolean mask (e.g. Observations.active) that
+        # is updated in place as observations are removed
+        self.A = np.asarray(A, dtype=float)
+        self.observations = np.asarray(observations, dtype=float)
+        self.weight = np.asarray(weight, dtype=float)
+        self.active = np.ones(len(self.observations), dtype=bool) if active is None else active
+
+        with stage('normal_equations', rows=self.A.shape[0], columns=self.A.shape[1]):
+            if self.active.all():
+                A_weighted = self.A * self.weight[:, None]
+                self.N = A_weighted.T @ self.A
+                self.b = A_weighted.T @ self.observations
+            else:
+                A_weighted = self.A[self.active] * self.weight[self.active, None]
+                self.N = A_weighted.T @ self.A[self.active]
+                self.b = A_weighted.T @ self.observations[self.active]
+
+    @property
+    def number_of_observations(self):
+        return int(np.count_nonzero(self.active))
+
+    @property
+    def number_of_parameters(self):
+        return self.A.shape[1]
+
+    def remove_observations(self, index):
+        # Downdate by the rows of removed observations, already removed
+        # observations are ignored
+        index = np.asarray(index, dtype=int)
+        index = index[self.active[index]]
+        if index.size == 0:
+            return
+
+        with stage('downdate', rows=index.size, columns=self.number_of_parameters):
+            A_removed = self.A[index]
+            A_weighted = A_removed * self.weight[index, None]
+            self.N -= A_weighted.T @ A_removed
+            self.b -= A_weighted.T @ self.observations[index]
+            self.active[index] = False
+
+    def scale_weights(self, factor):
+        # Uniform rescaling of all weights (e.g. weights relative to the mean
+        # error of the remaining observations)
+        self.weight = self.weight * factor
+        self.N *= factor
+        self.b *= factor
+
+    def remove_columns(self, columns):
+        # Drops parameters, negative indexes count from the last column
+        keep = np.setdiff1d(np.arange(self.number_of_parameters), np.asarray(columns, dtype=int) % self.number_of_parameters)
+        self.A = self.A[:, keep]
+        self.N = self.N[np.ix_(keep, keep)]
+        self.b = self.b[keep]
+
+    def add_columns(self, columns):
+        # Appends parameters, only products with the new columns are computed
+        columns = np.asarray(columns, dtype=float).reshape(len(self.observations), -1)
+        columns_weighted = columns[self.active] * self.weight[self.active, None]
+
+        N_cross = self.A[self.active].T @ columns_weighted
+        self.N = np.block([[self.N, N_cross], [N_cross.T, columns[self.active].T @ columns_weighted]])
+        self.b = np.concatenate([self.b, columns_weighted.T @ self.observations[self.active]])
+        self.A = np.column_stack([self.A, columns])
+
+    def solve(self, dof_correction=0):
+        # Returns adjusted parameters, residuals of all observations (removed
+        # included), a posteriori RMSE of the active observations and
+        # covariance matrix of adjusted parameters. Degrees of freedom are
+        # n - p - dof_correction.
+        with stage('solve', rows=self.number_of_observations, columns=self.number_of_parameters):
+            factor = cho_factor(self.N)
+            adjusted_parameters = cho_solve(factor, self.b)
+            v = self.A @ adjusted_parameters - self.observations
+
+            degrees_of_freedom = self.number_of_observations - self.number_of_parameters - dof_correction
+            rmse = np.sqrt(np.sum(self.weight[self.active] * v[self.active]**2) / degrees_of_freedom)
+            C_theta = (rmse**2) * cho_solve(factor, np.eye(self.number_of_parameters))
+
+        return adjusted_parameters, v, rmse, C_theta
+
+    def reject_outliers(self, rejection_factor, max_iterations=10, dof_correction=0):
+        # Iterative rejection of observations with |v| >= rejection_factor * rmse
+        # until none is left or max_iterations is reached
+        solution = self.solve(dof_correction)
+
+        for _ in range(max_iterations):
+            v, rmse = solution[1], solution[2]
+            with stage('outliers', rows=len(v)):
+                index_outliers = np.flatnonzero(self.active & (np.abs(v) >= rejection_factor * rmse))
+            if index_outliers.size == 0:
+                break
+
+            self.remove_observations(index_outliers)
+            solution = self.solve(dof_correction)
+
+        return solution
+
+    def robust_solve(self, weight_function='huber', tuning=None, max_iterations=50, tolerance=1e-3, dof_correction=0):
+        # Iteratively reweighted least squares (M-estimation) of the active
+        # observations. Residuals standardized by sqrt(weight) and a robust
+        # scale s (MAD) get the robust weights psi(u)/u. Iterations reuse
+        # the Cholesky factor of the normal matrix (Huber's H-algorithm,
+        # x += N^-1 A' P s psi(u) / sqrt(P)) until no parameter changes by
+        # more than tolerance times its SD; Tukey starts from the converged
+        # Huber solution. Only the final covariance is computed from a new
+        # factorization with the robust weights. Observations with zero
+        # robust weight are removed. Returns the solve() tuple and robust
+        # weights of all observations (0 for removed ones); the number of
+        # iterations and convergence are kept in iterations and converged.
+        with stage('robust', rows=self.number_of_observations, columns=self.number_of_parameters):
+            factor = cho_factor(self.N)
+            SD_unit = np.sqrt(np.diag(cho_solve(factor, np.eye(self.number_of_parameters))))
+            adjusted_parameters = cho_solve(factor, self.b)
+
+            A = self.A[self.active]
+            observations = self.observations[self.active]
+            sqrt_weight = np.sqrt(self.weight[self.active])
+
+            self.iterations = 0
+            self.converged = False
+            for current_function in (['huber', 'tukey'] if weight_function == 'tukey' else [weight_function]):
+                current_tuning = tuning if current_function == weight_function else None
+                for _ in range(max_iterations):
+                    self.iterations += 1
+                    residuals = sqrt_weight * (observations - A @ adjusted_parameters)
+                    scale = 1.4826 * np.median(np.abs(residuals))
+                    if scale == 0:
+                        break
+                    pseudo_residuals = scale * robust_psi(residuals / scale, current_function, current_tuning)
+                    step = cho_solve(factor, A.T @ (sqrt_weight * pseudo_residuals))
+                    adjusted_parameters = adjusted_parameters + step
+                    if np.all(np.abs(step) <= tolerance * scale * SD_unit):
+                        self.converged = True
+                        break
+
+            # Robust weights of the solution, psi(u)/u is 1 at u = 0
+            residuals = sqrt_weight * (observations - A @ adjusted_parameters)
+            scale = 1.4826 * np.median(np.abs(residuals))
+            u = residuals / scale if scale > 0 else np.zeros_like(residuals)
+            robust_weight = np.zeros(len(self.observations))
+            robust_weight[self.active] = np.where(u == 0, 1, robust_psi(u, weight_function, tuning) / np.where(u == 0, 1, u))
+
+            # Covariance with the robust weights
+            self.remove_observations(np.flatnonzero(self.active & (robust_weight == 0)))
+            P = self.weight[self.active] * robust_weight[self.active]
+            A = self.A[self.active]
+            N = (A * P[:, None]).T @ A
+            v = self.A @ adjusted_parameters - self.observations
+
+            degrees_of_freedom = self.number_of_observations - self.number_of_parameters - dof_correction
+            rmse = np.sqrt(np.sum(P * v[self.active]**2) / degrees_of_freedom)
+            C_theta = (rmse**2) * cho_solve(cho_factor(N), np.eye(self.number_of_parameters))
+
+        return adjusted_parameters, v, rmse, C_theta, robust_weight
+
+    def resample(self, method='bootstrap', replicates=10000, seed=None, dof_correction=0, chunk_size=2000):
+        # Replicates of the adjusted parameters (replicates x parameters) for
+        # empirical uncertainties. Every replicate replaces the observations
+        # by l* = A x + e*, with e* drawn from the weighted residuals with
+        # replacement (bootstrap, scaled by sqrt(n / degrees of freedom)) or
+        # from N(0, rmse^2 / P) (montecarlo). As the design is shared,
+        #     x* = x + N^-1 A' P e*
+        # so all replicates are one solve with many right hand sides against
+        # the factor of N, in chunks of chunk_size replicates. Removed
+        # observations stay removed.
+        if method not in RESAMPLING_METHODS:
+            raise ValueError(f'Unknown resampling method {method!r}, use one of {RESAMPLING_METHODS}')
+        rng = np.random.default_rng(seed)
+
+        with stage('resample', rows=self.number_of_observations, columns=self.number_of_parameters, replicates=replicates):
+            factor = cho_factor(self.N)
+            adjusted_parameters = cho_solve(factor, self.b)
+
+            sqrt_weight = np.sqrt(self.weight[self.active])
+            A_weighted = self.A[self.active] * sqrt_weight[:, None]
+            residuals = sqrt_weight * (self.A[self.active] @ adjusted_parameters - self.observations[self.active])
+            n = len(residuals)
+            degrees_of_freedom = n - self.number_of_parameters - dof_correction
+            residuals = (residuals - residuals.mean()) * np.sqrt(n / degrees_of_freedom)
+            rmse = np.sqrt(np.sum(residuals**2) / n)
+
+            parameter_replicates = np.empty((replicates, self.number_of_parameters))
+            for start in range(0, replicates, chunk_size):
+                size = min(chunk_size, replicates - start)
+                if method == 'bootstrap':
+                    errors = residuals[rng.integers(0, n, size=(n, size))]
+                else:
+                    errors = rng.normal(0, rmse, size=(n, size))
+                parameter_replicates[start:start + size] = adjusted_parameters + cho_solve(factor, A_weighted.T @ errors).T
+
+        return parameter_replicates
+
+
+def find_tares(point_codes, number_of_points, time, drift_degree, observations, weight, active=None, significance=2, min_setups=2):
+    # Tare detection stage before the drift fit, a binary segmentation of
+    # the time ordered residuals into drift segments. A step (tare) at every
+    # boundary between setups (runs of readings on one point) is tested
+    # against the current model with the score statistic
+    #     t = |s' P v| / (rmse sqrt(s' P s - s' P A N^-1 A' P s))
+    # (t of the step if it were added, s is 1 from the boundary on); tail
+    # sums give all boundaries in one O(n) pass. The largest t is kept as a
+    # tare while it is over the Bonferroni critical value of the
+    # significance level, then the model is adjusted again with it. Steps
+    # absorbed by the model (e.g. every reading after them is the only
+    # visit of its points) and steps leaving less than min_setups setups
+    # in a segment are never tested. Returns the reading indexes where
+    # tare steps start.
+    active = np.ones(len(observations), dtype=bool) if active is None else active
+    significance_level = SIGNIFICANCE_LEVELS[significance]
+    boundaries = np.flatnonzero(np.diff(point_codes) != 0) + 1
+    setup = np.concatenate([[0], np.cumsum(np.diff(point_codes) != 0)])
+    tares = []
+
+    with stage('tares', rows=int(np.count_nonzero(active)), boundaries=len(boundaries)):
+        while len(tares) < len(boundaries):
+            A = jacobi_matrix(point_codes, number_of_points, time, drift_degree, tares=tares)
+            adjustment = Adjustment(A, observations, weight, active.copy())
+            _, v, rmse, _ = adjustment.solve()
+            degrees_of_freedom = adjustment.number_of_observations - A.shape[1] - 1
+            if degrees_of_freedom <= 0 or not rmse > 0:
+                break
+
+            # Tail sums over the readings from every boundary on
+            P = np.where(active, weight, 0)
+            PA = np.cumsum((A * P[:, None])[::-1], axis=0)[::-1][boundaries]
+            Pv = np.cumsum((P * v)[::-1])[::-1][boundaries]
+            Ps = np.cumsum(P[::-1])[::-1][boundaries]
+
+            N = (A[active] * P[active, None]).T @ A[active]
+            denominator = Ps - np.sum(PA * cho_solve(cho_factor(N), PA.T).T, axis=1)
+            # Segments between tares keep at least min_setups setups
+            edges = np.concatenate([[0], setup[tares], [setup[-1] + 1]])
+            position = np.searchsorted(edges, setup[boundaries], side='right')
+            testable = ((denominator > 1e-9 * Ps) & (setup[boundaries] - edges[position - 1] >= min_setups)
+                        & (edges[np.minimum(position, len(edges) - 1)] - setup[boundaries] >= min_setups))
+            if not np.any(testable):
+                break
+
+            # Readings of one setup share errors (tilt, temperature, setup
+            # height), their scatter understates the noise of a step between
+            # setups. The variance factor of the setup mean residuals (less
+            # the part the step would fit) over their expected variance
+            # scales the test up to that noise.
+            setup_weight = np.bincount(setup, weights=P)
+            setup_residual = np.bincount(setup, weights=P * v)
+            measured = setup_weight > 0
+            setup_redundancy = np.count_nonzero(measured) - A.shape[1] - 1
+            if setup_redundancy <= 0:
+                break
+            step_fit = np.zeros(len(boundaries))
+            step_fit[testable] = Pv[testable]**2 / denominator[testable]
+            setup_scatter = np.sum(setup_residual[measured]**2 / setup_weight[measured])
+            variance_factor = np.maximum(1, (setup_scatter - step_fit) / rmse**2 / setup_redundancy)
+
+            t = np.zeros(len(boundaries))
+            t[testable] = np.sqrt(step_fit[testable] / variance_factor[testable]) / rmse
+            best = int(np.argmax(t))
+            if t[best] < students_inverse(significance_level / len(boundaries), degrees_of_freedom):
+                break
+            tares = sorted(tares + [int(boundaries[best])])
+
+    return tares
+
+
+def tare_output(tares, adjusted_parameters, SD_theta, first_tare_column, dtime):
+    # Detected tares with the adjusted step and its standard deviation
+    columns = first_tare_column + np.arange(len(tares))
+    return {
+        'index': np.asarray(tares, dtype=int),
+        'datetime': dtime[np.asarray(tares, dtype=int)],
+        'size': adjusted_parameters[columns],
+        'std': SD_theta[columns],
+    }
+
+
+def empirical_uncertainty(samples, significance):
+    # Standard deviation and two-sided confidence interval (percentiles at
+    # the significance level) of replicates along axis 0
+    significance_level = SIGNIFICANCE_LEVELS[significance]
+    lower, upper = np.percentile(samples, [50 * significance_level, 100 - 50 * significance_level], axis=0)
+    return {'std': np.std(samples, axis=0, ddof=1), 'lower': lower, 'upper': upper}
+
+
+def resampling_output(adjustment, method, replicates, seed, significance, number_of_differences, level_height=None):
+    # Empirical uncertainty of the adjusted differences (and of the average
+    # gradient of the levels, if given) from Adjustment.resample replicates
+    # of the final fit. In robust mode the replicates are solutions with the
+    # plain weights of the readings kept.
+    parameter_replicates = adjustment.resample(method, replicates, seed, dof_correction=3)
+    differences = parameter_replicates[:, :number_of_differences]
+
+    output_uncertainty = {
+        'method': method,
+        'replicates': replicates,
+        'confidence': 1 - SIGNIFICANCE_LEVELS[significance],
+        'differences': empirical_uncertainty(differences, significance),
+        'gradient': None,
+    }
+    if level_height is not None:
+        gradient = np.mean(level_gradients(differences.T, level_height), axis=0)
+        output_uncertainty['gradient'] = empirical_uncertainty(gradient, significance)
+
+    return output_uncertainty
+
+
+def gradient_linear(input_file, header_lines, calibration_factor, SD_scale_information, number_of_measured_levels, input_units_option, significance, SD00, max_iterations=1, cache=None, instrument_type='CG5', robust=None, detect_tares=False,
+                    uncertainty=None, replicates=10000, seed=None, drift_degree=2, tide_model=None):
+
+    check_drift_degree(drift_degree)
+
+    # Read data from file
+    observations = read_survey(input_file, instrument_type, header_lines, calibration_factor, SD_scale_information, cache, tide_model,
+                               input_units_option)
+    ERR = observations.ERR
+    dtime = observations.datetime
+
+    # Measured station ID (first point)
+    uniquepoints = observations.point_names
+    measured_station_ID = uniquepoints[0] if not uniquepoints[0].replace('.', '', 1).isdigit() else f'{float(uniquepoints[0]):8.2f}'
+
+    # Least Square Adjustment - deterministic model
+    n0 = observations.number_of_observations
+    k = observations.number_of_points
+
+    # Number of levels taken from the file (assumes correctly assigned point IDs)
+    if number_of_measured_levels is None:
+        number_of_measured_levels = len(uniquepoints)
+
+    # Points of the file have to be the measured levels
+    if len(uniquepoints) != number_of_measured_levels:
+        raise ValueError(f'File contains data from {len(uniquepoints)} points but {number_of_measured_levels} measured levels '
+                         f'were chosen - check point IDs for typos ({", ".join(uniquepoints)})')
+    if number_of_measured_levels not in (2, 3, 4):
+        raise ValueError(f'Gradient of {number_of_measured_levels} levels is not supported, use 2, 3 or 4 levels')
+
+    # Drift polynomial degree
+    polynomial_degree = drift_degree
+
+    # Average height for individual measured levels
+    level_height = observations.level_height()
+
+    # Jacobi matrix, first position fixed (regularization)
+    A = jacobi_matrix(observations.point_codes, k, observations.datenum, polynomial_degree)
+
+    # Weights
+    weight = np.mean(ERR) / ERR
+
+    # Tares found in the residuals of the model without them become steps of
+    # a piecewise drift
+    tares = find_tares(observations.point_codes, k, observations.datenum, polynomial_degree, observations.grav, weight / SD00**2,
+                       observations.active, significance) if detect_tares else []
+    if tares:
+        A = jacobi_matrix(observations.point_codes, k, observations.datenum, polynomial_degree, tares=tares)
+    tare_columns = slice(k - 1, k - 1 + len(tares))
+
+    # Parameter adjustment using LSE formulas, C = SD00^2 * P^-1, rejections
+    # are recorded in observations.active
+    adjustment = Adjustment(A, observations.grav, weight / SD00**2, observations.active)
+    adjusted_parameters, v, rmse1, C_theta = adjustment.solve(dof_correction=2)
+    SD_theta = np.sqrt(np.diag(C_theta))
+
+    # Drift coefficients
+    drift_koef = adjusted_parameters[-polynomial_degree:]
+    AA = A[:, -polynomial_degree:]
+
+    res_drift = AA @ drift_koef + A[:, tare_columns] @ adjusted_parameters[tare_columns]
+    test = res_drift + v
+    res_drift_av = np.mean(res_drift)
+
+    # Outliers testing
+    significance_level = SIGNIFICANCE_LEVELS[significance]
+
+    index_outliers = np.where(np.abs(v) >= SD00 * rmse1 * significance)[0]
+
+    Tau = adjusted_parameters[-1] / SD_theta[-1]
+
+    # Highest (quadratic) drift component significance testing, a linear
+    # drift is always kept
+    polynomial_degree_new = polynomial_degree
+    if polynomial_degree > 1 and np.abs(Tau) < students_inverse(significance_level, n0 - k):
+        polynomial_degree_new = polynomial_degree - 1
+
+    # Removing outliers, weights relative to the mean error of the remaining measurements
+    if robust is None:
+        adjustment.remove_observations(index_outliers)
+        adjustment.scale_weights(np.mean(ERR[adjustment.active]) / np.mean(ERR))
+
+    # Reprocessing without outliers, quadratic drift column dropped if not significant
+    adjustment.remove_columns(np.arange(polynomial_degree_new - polynomial_degree, 0))
+    if robust is None:
+        adjusted_parameters_new, v, rmse2, C_theta = adjustment.reject_outliers(SD00 * significance, max_iterations - 1, dof_correction=3)
+        index_outliers = np.flatnonzero(~adjustment.active)
+    else:
+        # Robust reprocessing instead, downweighted readings are the outliers
+        adjusted_parameters_new, v, rmse2, C_theta, robust_weight = adjustment.robust_solve(robust, dof_correction=3)
+        index_outliers = np.flatnonzero(robust_weight < DOWNWEIGHTED)
+    SD_theta_new = np.sqrt(np.diag(C_theta))
+    n = adjustment.number_of_observations
+
+    drift_koef2 = adjusted_parameters_new[-polynomial_degree_new:]
+    AA = adjustment.A[adjustment.active, -polynomial_degree_new:]
+
+    res_drift_new = AA @ drift_koef2 + adjustment.A[adjustment.active, tare_columns] @ adjusted_parameters_new[tare_columns]
+    res_drift_new_av = np.mean(res_drift_new)
+
+    dtime_t_new = dtime[observations.active]
+
+    av_height = np.sum(level_height) / number_of_measured_levels
+
+    av_Wzz, sigma_av_Wzz = level_gradient(adjusted_parameters_new[:k - 1], SD_theta_new[:k - 1], level_height)
+
+    # Empirical uncertainty from bootstrap or Monte Carlo replicates
+    output_uncertainty = None
+    if uncertainty is not None:
+        output_uncertainty = resampling_output(adjustment, uncertainty, replicates, seed, significance, k - 1, level_height)
+
+    output_linear = {
+        'stationinfo': {
+            'ID': measured_station_ID,
+            'filename': input_file.ljust(100),
+            'measurement_date': str(dtime_t_new[0]).replace('T', ' ')
+        },
+        'time': {
+            'all_measurements': dtime,
+            'no_outliers': dtime_t_new,
+            'outliers': dtime[index_outliers]
+        },
+        'processing': {
+            'number_of_measurements': n0,
+            'number_of_rejected_measurements': n0 - n,
+            'errors_all': test - res_drift_av,
+            'errors_outliers': test[index_outliers] - res_drift_av,
+            'RMSE': rmse2 * SD00,
+            'robust_weights': None if robust is None else robust_weight
+        },
+        'drift': {
+            'polynomial_degree': str(polynomial_degree_new),
+            'drift_all_measurements': res_drift - res_drift_av,
+            'drift_no_outliers': res_drift_new - res_drift_new_av,
+            'tares': tare_output(tares, adjusted_parameters_new, SD_theta_new, k - 1, dtime)
+        },
+        'gradient': {
+            'average_height': f'{av_height:.3f}',
+            'average_gradient': f'{av_Wzz:.1f}',
+            'std': f'{sigma_av_Wzz:.1f}',
+            'average_height_num': av_height,
+            'average_gradient_num': av_Wzz,
+            'std_num': sigma_av_Wzz
+        },
+        'uncertainty': output_uncertainty
+    }
+
+    return output_linear
+
+
+def gradient_linear_stack(grav, ERR, time, point_codes, valid, level_height, significance, SD00, max_iterations=1):
+    # gradient_linear of S stations with the same number of levels k at once.
+    # Readings are stacked into (S, n) arrays padded to the longest station
+    # (valid marks real readings), normal equations of all stations are
+    # (S, p, p) arrays solved in one call. Stations whose quadratic drift is
+    # not significant keep the column with a decoupled unit diagonal and a
+    # zero estimate, so all stations share one shape. Returns the parameters,
+    # their SDs, RMSE, drift degree and the final active mask.
+    number_of_stations, n = grav.shape
+    k = level_height.shape[1]
+    p = k + 2
+    significance_level = SIGNIFICANCE_LEVELS[significance]
+
+    # Jacobi matrices [points 2..k | constant | drift t, t^2]
+    A = np.zeros((number_of_stations, n, p))
+    stations, readings = np.nonzero(valid & (point_codes > 0))
+    A[stations, readings, point_codes[stations, readings] - 1] = 1
+    A[:, :, k - 1] = valid
+    A[:, :, k] = time * valid
+    A[:, :, k + 1] = time**2 * valid
+
+    number_of_readings = valid.sum(axis=1)
+    mean_ERR = np.sum(ERR * valid, axis=1) / number_of_readings
+    weight = np.where(valid, mean_ERR[:, None] / np.where(valid, ERR, 1), 0) / SD00**2
+
+    def solve(active, weight, linear_drift, dof_correction):
+        W = weight * active
+        A_weighted = A * W[:, :, None]
+        N = np.matmul(A_weighted.transpose(0, 2, 1), A)
+        b = np.einsum('snp,sn->sp', A_weighted, grav)
+
+        # Quadratic drift decoupled where it was dropped
+        N[linear_drift, -1, :] = 0
+        N[linear_drift, :, -1] = 0
+        N[linear_drift, -1, -1] = 1
+        b[linear_drift, -1] = 0
+
+        N_inv = np.linalg.inv(N)
+        adjusted_parameters = np.einsum('spq,sq->sp', N_inv, b)
+        v = np.einsum('snp,sp->sn', A, adjusted_parameters) - grav
+
+        degrees_of_freedom = active.sum(axis=1) - (p - linear_drift) - dof_correction
+        rmse = np.sqrt(np.sum(W * v**2, axis=1) / degrees_of_freedom)
+        SD_theta = rmse[:, None] * np.sqrt(np.diagonal(N_inv, axis1=1, axis2=2))
+        return adjusted_parameters, v, rmse, SD_theta
+
+    # First solution with quadratic drift
+    no_stations = np.zeros(number_of_stations, dtype=bool)
+    adjusted_parameters, v, rmse1, SD_theta = solve(valid, weight, no_stations, 2)
+    outliers = valid & (np.abs(v) >= SD00 * rmse1[:, None] * significance)
+
+    # Quadratic component significance testing, critical values per number of readings
+    Tau = adjusted_parameters[:, -1] / SD_theta[:, -1]
+    t_values = {dof: students_inverse(significance_level, dof) for dof in np.unique(number_of_readings - k)}
+    t_value = np.array([t_values[dof] for dof in number_of_readings - k])
+    linear_drift = np.abs(Tau) < t_value
+
+    # Reprocessing without outliers, weights relative to the mean error of
+    # the remaining readings
+    active = valid & ~outliers
+    weight = weight * (np.sum(ERR * active, axis=1) / active.sum(axis=1) / mean_ERR)[:, None]
+    adjusted_parameters, v, rmse2, SD_theta = solve(active, weight, linear_drift, 3)
+
+    for _ in range(max_iterations - 1):
+        outliers = active & (np.abs(v) >= SD00 * significance * rmse2[:, None])
+        if not outliers.any():
+            break
+        active &= ~outliers
+        adjusted_parameters, v, rmse2, SD_theta = solve(active, weight, linear_drift, 3)
+
+    return adjusted_parameters, SD_theta, rmse2, np.where(linear_drift, 1, 2), active
+
+
+def gradient_linear_batch(observations, significance=2, SD00=5, max_iterations=1, chunk_size=10000):
+    # gradient_linear of many stations (a list of Observations) without a
+    # Python loop per station: stations are grouped by their number of
+    # levels and solved in stacks of chunk_size. Results are arrays in the
+    # order of the input, gradients are NaN for other than 2, 3 or 4 levels.
+    # Rejected readings are switched off in each Observations.active.
+    number_of_stations = len(observations)
+    output_batch = {
+        'number_of_levels': np.array([station.number_of_points for station in observations], dtype=int),
+        'number_of_measurements': np.array([station.number_of_observations for station in observations], dtype=int),
+        'number_of_rejected_measurements': np.zeros(number_of_stations, dtype=int),
+        'drift_polynomial_degree': np.zeros(number_of_stations, dtype=int),
+        'RMSE': np.full(number_of_stations, np.nan),
+        'average_height': np.full(number_of_stations, np.nan),
+        'gradient': np.full(number_of_stations, np.nan),
+        'std': np.full(number_of_stations, np.nan),
+    }
+
+    for k in np.unique(output_batch['number_of_levels']):
+        group = np.flatnonzero(output_batch['number_of_levels'] == k)
+        # Stations of similar length together keep the padding small
+        group = group[np.argsort(output_batch['number_of_measurements'][group], kind='stable')]
+
+        for start in range(0, len(group), chunk_size):
+            chunk = group[start:start + chunk_size]
+            stations = [observations[index] for index in chunk]
+            n = max(station.number_of_observations for station in stations)
+
+            grav = np.zeros((len(chunk), n))
+            ERR = np.ones((len(chunk), n))
+            time = np.zeros((len(chunk), n))
+            point_codes = np.zeros((len(chunk), n), dtype=np.int64)
+            valid = np.zeros((len(chunk), n), dtype=bool)
+            level_height = np.empty((len(chunk), k))
+            for row, station in enumerate(stations):
+                m = station.number_of_observations
+                grav[row, :m] = station.grav
+                ERR[row, :m] = station.ERR
+                time[row, :m] = station.datenum - station.datenum[0]
+                point_codes[row, :m] = station.point_codes
+                valid[row, :m] = True
+                level_height[row] = station.level_height()
+
+            adjusted_parameters, SD_theta, rmse, drift_degree, active = gradient_linear_stack(
+                grav, ERR, time, point_codes, valid, level_height, significance, SD00, max_iterations)
+
+            for row, station in enumerate(stations):
+                station.active[:] = active[row, :station.number_of_observations]
+
+            output_batch['number_of_rejected_measurements'][chunk] = np.sum(valid & ~active, axis=1)
+            output_batch['drift_polynomial_degree'][chunk] = drift_degree
+            output_batch['RMSE'][chunk] = rmse * SD00
+            output_batch['average_height'][chunk] = level_height.mean(axis=1)
+
+            # Average gradient of the levels (level_gradient for a stack)
+            if 2 <= k <= 4:
+                output_batch['gradient'][chunk], output_batch['std'][chunk] = level_gradient(
+                    adjusted_parameters[:, :k - 1].T, SD_theta[:, :k - 1].T, level_height.T)
+
+    return output_batch
+
+
+def gradient_function(input_file, header_lines, calibration_factor, SD_scale_information, input_units_option, significance, SD00, cache=None, instrument_type='CG5', robust=None,
+                      tide_model=None):
+
+    # Read data from file
+    observations = read_survey(input_file, instrument_type, header_lines, calibration_factor, SD_scale_information, cache, tide_model,
+                               input_units_option)
+    ERR = observations.ERR
+    dtime = observations.datetime
+
+    # Measured station ID (first point)
+    uniquepoints = observations.point_names
+    measured_station_ID = uniquepoints[0] if not uniquepoints[0].replace('.', '', 1).isdigit() else f'{float(uniquepoints[0]):8.2f}'
+
+    # Deterministic model
+    n0 = observations.number_of_observations  # number of measurements taken
+    k = observations.number_of_points  # number of measured levels
+
+    # Drift polynomial degrees
+    polynomial_degree_time = 2
+    polynomial_degree_height = k - 1
+
+    # Jacobi matrix - constant, height section and drift section
+    A = jacobi_matrix(time=observations.datenum, drift_degree=polynomial_degree_time, height=observations.height, height_degree=polynomial_degree_height)
+
+    # Weights
+    weight = np.mean(ERR) / ERR
+
+    # Parameter adjustment using LSE formulas, C = SD00^2 * P^-1, rejections
+    # are recorded in observations.active
+    adjustment = Adjustment(A, observations.grav, weight / SD00**2, observations.active)
+    adjusted_parameters, v, rmse1, C_theta = adjustment.solve(dof_correction=1)
+
+    # Standard deviation of adjusted parameters
+    SD_theta = np.sqrt(np.diag(C_theta))
+
+    # Drift coefficients
+    drift_koef = adjusted_parameters[-polynomial_degree_time:]
+    A_drift = A[:, -polynomial_degree_time:]
+
+    # Residual (transportation drift)
+    res_drift = A_drift @ drift_koef
+
+    # Test values
+    test1 = res_drift + v
+
+    # Average drift value to subtract later
+    res_drift_av = np.mean(res_drift)
+
+    # Outliers testing
+    significance_level = SIGNIFICANCE_LEVELS[significance]
+
+    # Outliers indexes
+    index_outliers = np.where(np.abs(v) >= SD00 * rmse1 * significance)[0]
+
+    # Statistical testing of parameters
+    Tau1 = adjusted_parameters[-1] / SD_theta[-1]
+    Tau2 = adjusted_parameters[-polynomial_degree_time] / SD_theta[-polynomial_degree_time]
+
+    # Quadratic component significance testing
+    t_value = students_inverse(significance_level, n0 - len(A.T))
+
+    if np.abs(Tau1) < t_value:
+        polynomial_degree_time_final = polynomial_degree_time - 1
+    else:
+        polynomial_degree_time_final = polynomial_degree_time
+
+    if np.abs(Tau2) < t_value:
+        polynomial_degree_height_new = polynomial_degree_height - 1
+    else:
+        polynomial_degree_height_new = polynomial_degree_height
+
+    # Removing outliers 1, weights relative to the mean error of the remaining
+    # measurements (robust mode downweights them instead)
+    if robust is None:
+        adjustment.remove_observations(index_outliers)
+        adjustment.scale_weights(np.mean(ERR[adjustment.active]) / np.mean(ERR))
+    dtime_new = dtime[adjustment.active]
+
+    # Reprocessing without outliers 1, insignificant highest height and drift
+    # polynomial terms are dropped from the normal equations
+    adjustment.remove_columns(np.concatenate([np.arange(polynomial_degree_height_new + 1, polynomial_degree_height + 1),
+                                              np.arange(polynomial_degree_time_final - polynomial_degree_time, 0)]))
+
+    nrows, lgt = adjustment.number_of_observations, adjustment.number_of_parameters
+
+    # Parameter adjustment without outliers 1
+    if robust is None:
+        adjusted_parameters_new, v_new, rmse2, C_theta = adjustment.solve()
+    else:
+        adjusted_parameters_new, v_new, rmse2, C_theta, robust_weight = adjustment.robust_solve(robust)
+
+    # Standard deviation of adjusted parameters
+    SD_theta_new = np.sqrt(np.diag(C_theta))
+
+    # Outliers indexes after reprocessing without outliers 1
+    index_outliers_new = np.flatnonzero(adjustment.active & (np.abs(v_new) >= SD00 * rmse2 * significance))
+
+    # Statistical testing of parameters
+    Tau2_new = adjusted_parameters_new[-polynomial_degree_time_final] / SD_theta_new[-polynomial_degree_time_final]
+
+    # Quadratic component significance testing (2nd round)
+    if np.abs(Tau2_new) < np.sqrt(students_inverse(significance_level, nrows - lgt)):
+        polynomial_degree_height_final = polynomial_degree_height_new - 1
+    else:
+        polynomial_degree_height_final = polynomial_degree_height_new
+
+    # Removing outliers 2
+    if robust is None:
+        ERR_new = ERR[adjustment.active]
+        adjustment.remove_observations(index_outliers_new)
+        adjustment.scale_weights(np.mean(ERR[adjustment.active]) / np.mean(ERR_new))
+    dtime_final = dtime[adjustment.active]
+
+    # Reprocessing without outliers 2
+    adjustment.remove_columns(np.arange(polynomial_degree_height_final + 1, polynomial_degree_height_new + 1))
+
+    nrows, lgt = adjustment.number_of_observations, adjustment.number_of_parameters
+
+    # Parameter adjustment without outliers 2, the robust solution is only
+    # repeated when the height polynomial changed
+    if robust is None:
+        adjusted_parameters_final, v_final, rmse3, C_theta = adjustment.solve()
+    elif polynomial_degree_height_final < polynomial_degree_height_new:
+        adjusted_parameters_final, v_final, rmse3, C_theta, robust_weight = adjustment.robust_solve(robust)
+    else:
+        adjusted_parameters_final, v_final, rmse3 = adjusted_parameters_new, v_new, rmse2
+    v_final = v_final[adjustment.active]
+
+    # Standard deviation of adjusted parameters
+    SD_theta_final = np.sqrt(np.diag(C_theta))
+
+    # Drift coefficients
+    drift_koef = adjusted_parameters_final[-polynomial_degree_time_final:]
+    A_drift = adjustment.A[adjustment.active, -polynomial_degree_time_final:]
+
+    # Residual (transportation drift)
+    res_drift_final = A_drift @ drift_koef
+
+    # Test values
+    test_final = res_drift_final + v_final
+
+    # Average drift value to subtract later
+    res_drift_av_final = np.mean(res_drift_final)
+
+    # Output dictionary
+    output_function = {
+        'stationinfo': {
+            'ID': measured_station_ID,
+            'filename': input_file.ljust(100),
+            'measurement_date': str(dtime_new[0]).replace('T', ' '),
+        },
+        'time': {
+            'all_measurements': dtime,
+            'no_outliers': dtime_final,
+            'downweighted': None if robust is None else dtime[robust_weight < DOWNWEIGHTED],
+        },
+        'processing': {
+            'number_of_measurements': nrows,
+            'number_of_rejected_measurements': n0 - nrows,
+            'errors_all': test1 - res_drift_av,
+            'outliers_removed': test_final - res_drift_av_final,
+            'RMSE': rmse3 * SD00,
+            'robust_weights': None if robust is None else robust_weight,
+        },
+        'drift': {
+            'polynomial_degree': str(polynomial_degree_time_final),
+            'drift_all_measurements': res_drift - res_drift_av,
+            'drift_no_outliers': res_drift_final - res_drift_av_final,
+        },
+        'gradient': {
+            'polynomial_degree': str(polynomial_degree_height_final),
+            'gradient_param': np.concatenate([adjusted_parameters_final[1:polynomial_degree_height_final + 1], np.zeros(3 - polynomial_degree_height_final)]),
+            'std': np.concatenate([SD_theta_final[1:polynomial_degree_height_final + 1], np.zeros(3 - polynomial_degree_height_final)]),
+            'cov': C_theta[1, 2] if polynomial_degree_height_final > 1 else 0,
+        },
+    }
+
+    return output_function
+
+def gravity_differences(input_file, header_lines, significance, SD_scale_information, instrument_type, calibration_factor, max_iterations=1, cache=None, robust=None, detect_tares=False,
+                        uncertainty=None, replicates=10000, seed=None, drift_degree=2, tide_model=None,
+                        input_units_option=None):
+    
+    check_drift_degree(drift_degree)
+    observations = read_survey(input_file, instrument_type, header_lines, calibration_factor, SD_scale_information, cache, tide_model,
+                               input_units_option)
+    ERR = observations.ERR
+    dtime = observations.datetime
+
+    # Reducing measured values to a point using normal gradient
+    grav = observations.grav + observations.height * 308.6
+
+    uniquepoints = observations.point_names
+    
+    measured_points = [p if p.isdigit() else f'{float(p):8.2f}' for p in uniquepoints]
+    # Least Square Adjustment - deterministic model
+    n0 = observations.number_of_observations  # number of measurements taken
+    k = observations.number_of_points  # number of measured points
+    
+    # starting drift polynomial degree
+    polynomial_degree = drift_degree
+    
+    
+    
+    
+    
+    # Jacobi matrix, point and drift section
+    # Regularization - by default first point is fixed as starting 
+    A = jacobi_matrix(observations.point_codes, k, observations.datenum, polynomial_degree)
+
+    # Tares found in the residuals of the model without them become steps of
+    # a piecewise drift
+    tares = find_tares(observations.point_codes, k, observations.datenum, polynomial_degree, grav, 1 / np.square(ERR),
+                       observations.active, significance) if detect_tares else []
+    if tares:
+        A = jacobi_matrix(observations.point_codes, k, observations.datenum, polynomial_degree, tares=tares)
+    tare_columns = slice(k - 1, k - 1 + len(tares))
+    
+    
+    
+    
+    
+    # # Load errors from filedata (microGal), C = diag(ERR^2)
+    # Parameter adjustment using LSE formulas
+    adjustment = Adjustment(A, grav, 1 / np.square(ERR), observations.active)
+    adjusted_parameters, v, rmse1, C_theta = adjustment.solve(dof_correction=2)
+    # Standard deviation of adjusted parameters
+    SD_theta = np.sqrt(np.diag(C_theta))
+    # Drift coefficients
+    drift_koef = adjusted_parameters[-polynomial_degree:]
+    AA = A[:, -polynomial_degree:]
+    # Residual (transportation drift)
+    res_drift = AA @ drift_koef + A[:, tare_columns] @ adjusted_parameters[tare_columns]
+    # Test values
+    test = res_drift + v
+    # Average drift value to subtract later
+    res_drift_av = np.mean(res_drift)
+    # Outliers testing
+    significance_level = SIGNIFICANCE_LEVELS[significance]
+    
+    # Outliers indexes
+    index_outliers = np.where(np.abs(v) >= 5 *3* rmse1 * significance)[0]
+    # Statistical testing of parameters
+    Tau = adjusted_parameters[-1] / SD_theta[-1]
+    # Quadratic component significance testing
+    
+    t_value = students_inverse(significance_level, n0 - k)
+    
+    if polynomial_degree > 1 and np.abs(Tau) < t_value:
+        polynomial_degree_new = polynomial_degree - 1  # Highest drift term dropped
+    else:
+        polynomial_degree_new = polynomial_degree  # Drift approx. function kept
+    
+    # Removing outliers
+    if robust is None:
+        adjustment.remove_observations(index_outliers)
+    
+    # Quadratic drift column dropped if not significant
+    adjustment.remove_columns(np.arange(polynomial_degree_new - polynomial_degree, 0))
+    
+    # New adjusted parameters without considering outliers in the processing,
+    # or robust reprocessing where downweighted readings are the outliers
+    if robust is None:
+        adjusted_parameters_new, v, rmse2, C_theta = adjustment.reject_outliers(5 * 3 * significance, max_iterations - 1, dof_correction=3)
+        index_outliers = np.flatnonzero(~adjustment.active)
+    else:
+        adjusted_parameters_new, v, rmse2, C_theta, robust_weight = adjustment.robust_solve(robust, dof_correction=3)
+        index_outliers = np.flatnonzero(robust_weight < DOWNWEIGHTED)
+    SD_theta_new = np.sqrt(np.diag(C_theta))
+    n = adjustment.number_of_observations
+    
+    drift_koef2 = adjusted_parameters_new[-polynomial_degree_new:]
+    AA = adjustment.A[adjustment.active, -polynomial_degree_new:]
+    
+    # New drift
+    res_drift_new = AA @ drift_koef2 + adjustment.A[adjustment.active, tare_columns] @ adjusted_parameters_new[tare_columns]
+    res_drift_new_av = np.mean(res_drift_new)
+    
+    # Instrument information from file header
+    GCAL1 = observations.header.get('Gcal1')
+    SN_str = observations.header.get('Instrument S/N')
+    
+    # new Time information dtime (datetime)
+    dtime_new = dtime[observations.active]
+
+    # Empirical uncertainty from bootstrap or Monte Carlo replicates
+    output_uncertainty = None
+    if uncertainty is not None:
+        output_uncertainty = resampling_output(adjustment, uncertainty, replicates, seed, significance, k - 1)
+    
+    # Output dictionary
+    output_gravity_diff = {
+        'stationinfo': {
+            'filename': input_file.ljust(100),
+            'measurement_date': str(dtime_new[0]).replace('T', ' '),
+            'measuredpoints': measured_points,
+            'points': uniquepoints
+        },
+        'time': {
+            'all_measurements': dtime,
+            'no_outliers': dtime_new,
+            'outliers': dtime[index_outliers]
+        },
+        'processing': {
+            'number_of_measurements': n0,
+            'rejected_measurements': n0 - n,
+            'RMSE': rmse2,
+            'errors_all': test - res_drift_av,
+            'errors_outliers': test[index_outliers] - res_drift_av,
+            'robust_weights': None if robust is None else robust_weight
+        },
+        'drift': {
+            'polynomial_degree': str(polynomial_degree_new),
+            'drift_all_measurements': res_drift - res_drift_av,
+            'drift_no_outliers': res_drift_new - res_drift_new_av,
+            'tares': tare_output(tares, adjusted_parameters_new, SD_theta_new, k - 1, dtime)
+        },
+        'adjusted': {
+            'differences': adjusted_parameters_new[:k - 1],
+            'std': SD_theta_new[:k - 1]
+        },
+        'instrument_info': {
+            'GCAL1':GCAL1,
+            'SN':SN_str
+            },
+        'uncertainty': output_uncertainty
+        }
+
+    return output_gravity_diff
+
+# Tide models replacing the instrument tide correction
+TIDE_MODELS = {'longman': longman_tide}
+
+
+def tide_correction(tide_model, datetime, latitude, longitude, height=0.0):
+    # Tide correction in μGal of UTC readings by the given model
+    if tide_model not in TIDE_MODELS:
+        raise ValueError(f'Unknown tide model {tide_model!r}, use one of {sorted(TIDE_MODELS)}')
+    return TIDE_MODELS[tide_model](datetime, latitude, longitude, height)
+
+
+# Column layout of CG5 data rows, time (hh:mm:ss) and date (YYYY/MM/DD) are
+# split into their integer fields
+CG5_COLUMNS = ['col1', 'points', 'height', 'grav', 'SD', 'tiltx', 'tilty', 'temp_corr', 'tide_corr', 'duration', 'rejected',
+               'hour', 'minute', 'second', 'dn', 'terrain_col', 'year', 'month', 'day']
+
+
+def measurement_datetime(year, month, day, hour, minute, second):
+    # Vectorized datetime64[s] from integer date and time fields
+    date = (np.asarray(year, dtype=np.int64) - 1970).astype('datetime64[Y]')
+    date = date.astype('datetime64[M]') + (np.asarray(month, dtype=np.int64) - 1).astype('timedelta64[M]')
+    date = date.astype('datetime64[D]') + (np.asarray(day, dtype=np.int64) - 1).astype('timedelta64[D]')
+    seconds = np.asarray(hour, dtype=np.int64) * 3600 + np.asarray(minute, dtype=np.int64) * 60 + np.asarray(second, dtype=np.int64)
+    return date.astype('datetime64[s]') + seconds.astype('timedelta64[s]')
+
+
+# Header fields holding numeric values
+CG5_NUMERIC_HEADER_FIELDS = ['GMT DIFF.', 'Gref', 'Gcal1', 'TiltxS', 'TiltyS', 'TiltxO', 'TiltyO', 'Tempco', 'Drift']
+
+
+def split_CG5_header(raw, header_lines=None):
+    # Finds where the data block starts. With header_lines set, that many
+    # lines are skipped, otherwise the '/' prefixed header is scanned up to
+    # the '/------LINE-----STATION...' column banner. The first data row
+    # always ends the header, also when header_lines is larger than the
+    # header of the file. Returns decoded header lines and the byte offset
+    # of the data block.
+    header = []
+    position = 0
+
+    while position < len(raw):
+        end = raw.find(b'\n', position)
+        end = len(raw) if end == -1 else end
+        line = raw[position:end].strip()
+
+        if (header_lines is not None and len(header) == header_lines) or (line and not line.startswith(b'/')):
+            break
+
+        header.append(line.decode('latin-1'))
+        position = end + 1
+
+        # Column banner closes the header
+        if header_lines is None and line.startswith(b'/---') and b'LINE' in line:
+            break
+
+    return header, position
+
+
+def parse_CG5_header(header):
+    # Header fields ('/ Key: Value') as a dictionary keyed by the names used
+    # in the file, e.g. 'Gcal1', 'Instrument S/N', 'Date', 'LAT', 'LONG'
+    metadata = {}
+
+    for line in header:
+        key, separator, value = line.lstrip('/').strip().partition(':')
+        key, value = key.strip(), value.strip()
+        if not separator or not key or key.startswith('-'):
+            continue
+
+        if key in CG5_NUMERIC_HEADER_FIELDS:
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+
+        # Dates written as YYYY/ M/DD
+        elif key in ('Date', 'DriftDate Start'):
+            date_fields = re.findall(r'\d+', value)
+            if len(date_fields) == 3:
+                value = datetime(*map(int, date_fields)).date()
+
+        # Coordinates in degrees, west and south negative
+        elif key in ('LONG', 'LAT'):
+            number, _, hemisphere = value.partition(' ')
+            try:
+                value = float(number) * (-1 if hemisphere.strip().upper() in ('W', 'S') else 1)
+            except ValueError:
+                pass
+
+        metadata[key] = value
+
+    return metadata
+
+
+def parse_CG5(input_file, header_lines=None):
+    # Reads a CG5 file into typed arrays without any unit conversion and the
+    # header metadata. header_lines is the number of lines preceding the
+    # data, when None the header is detected.
+    with open(input_file, 'rb') as file:
+        raw = file.read()
+
+    header, data_start = split_CG5_header(raw, header_lines)
+
+    # Header lines repeated inside the data block become comments, time and
+    # date separators become whitespace so that every field is numeric and
+    # the whole block is tokenized by the C parser
+    data = (b'\n' + raw[data_start:]).replace(b'\n/', b'\n#').replace(b':', b' ').replace(b'/', b' ')
+
+    with stage('parse', bytes=len(raw)):
+        filedata = pd.read_csv(io.BytesIO(data), sep=r'\s+', engine='c', header=None, names=CG5_COLUMNS, comment='#',
+                               dtype={'points': str, 'duration': np.int64, 'rejected': np.int64,
+                                      'hour': np.int64, 'minute': np.int64, 'second': np.int64,
+                                      'year': np.int64, 'month': np.int64, 'day': np.int64})
+
+        CG5_data = {name: filedata[name].to_numpy() for name in CG5_COLUMNS}
+        CG5_data['points'] = CG5_data['points'].astype(str)
+
+    # Datetime and numeric date (days since Unix epoch)
+    with stage('datetime', rows=len(filedata)):
+        CG5_data['datetime'] = measurement_datetime(CG5_data['year'], CG5_data['month'], CG5_data['day'],
+                                                    CG5_data['hour'], CG5_data['minute'], CG5_data['second'])
+        CG5_data['datenum'] = CG5_data['datetime'].astype(np.int64) / (24 * 3600)
+
+    return CG5_data, parse_CG5_header(header)
+
+
+# input_units_option -> heights in centimetres (True) or metres (False),
+# None detects the units from the file
+HEIGHT_UNITS = {1: True, 2: False}
+
+
+def height_in_centimetres(input_units_option, detected):
+    # Height units of the option, detected (bool) when the option is None
+    if input_units_option is None:
+        return bool(detected)
+    if input_units_option not in HEIGHT_UNITS:
+        raise ValueError(f'Unknown input_units_option {input_units_option!r}, use 1 (cm), 2 (m) or None (detect)')
+    return HEIGHT_UNITS[input_units_option]
+
+
+def convert_CG5_units(height, grav, SD, calibration_factor=None, SD_scale_information=0, height_in_centimetres=True):
+    # Unit conversion of CG5 readings (arrays or single values): instrument
+    # height to metres (the reading refers to 21.1 cm / 0.211 m below the
+    # measured height), mGal to μGal calibrated when a factor is provided,
+    # SD in mGal to errors in μGal (1 Hz SD scaled to the 60 s estimate)
+    if height_in_centimetres:
+        height = (height - 21.1) / 100
+    else:
+        height = height - 0.211
+
+    grav = grav * (1000 if calibration_factor is None else 1000 * calibration_factor)
+
+    ERR = SD * 1000
+    if SD_scale_information == 1:
+        ERR = ERR / np.sqrt(60)
+
+    return height, grav, ERR
+
+
+def read_CG5(input_file, header_lines=None, calibration_factor=None, SD_scale_information=0, cache=None, tide_model=None,
+             input_units_option=None):
+    
+    # # Read data from file (or a gradmap_cache.SurveyCache), header metadata
+    # is kept in filedata.attrs['header']
+    CG5_data, header = parse_CG5(input_file, header_lines) if cache is None else cache.parse(parse_CG5, input_file, header_lines)
+    filedata = pd.DataFrame(CG5_data, copy=False)
+    filedata.attrs['header'] = header
+
+    # Instrument tide correction replaced by the computed one, readings are
+    # in local time UTC - GMT DIFF. at the coordinates of the header
+    if tide_model is not None:
+        if 'LAT' not in header or 'LONG' not in header:
+            raise ValueError(f'{input_file}: LAT and LONG are missing in the header, tide correction cannot be computed')
+        utc = filedata['datetime'].to_numpy() + np.timedelta64(int(round(header.get('GMT DIFF.', 0) * 3600)), 's')
+        tide = tide_correction(tide_model, utc, header['LAT'], header['LONG'])
+        applied = filedata['tide_corr'] if str(header.get('Tide Correction', 'YES')).upper() != 'NO' else 0
+        filedata['grav'] = filedata['grav'] - applied + tide / 1000
+    
+    # Heights in the units of input_units_option, without it in centimetres
+    # when the first one is over 2, metres otherwise
+    centimetres = height_in_centimetres(input_units_option, filedata['height'].iloc[0] > 2)
+    with stage('units', rows=len(filedata)):
+        filedata['height'], filedata['grav'], filedata['ERR'] = convert_CG5_units(filedata['height'], filedata['grav'], filedata['SD'],
+                                                                                  calibration_factor, SD_scale_information, centimetres)
+
+    return filedata
+
+
+# Column layout of CG6 (LynxLG / CG-6 Survey) data rows, used when the file
+# has no '/Station Date Time ...' column banner
+CG6_COLUMNS = ['Station', 'Date', 'Time', 'CorrGrav', 'Line', 'StdDev', 'StdErr', 'RawGrav', 'X', 'Y', 'SensorTemp',
+               'TideCorr', 'TiltCorr', 'TempCorr', 'DriftCorr', 'MeasurDur', 'InstrHeight', 'LatUser', 'LonUser',
+               'ElevUser', 'LatGPS', 'LonGPS', 'ElevGPS', 'Corrections[drift-temp-na-tide-tilt]']
+
+# CG6 columns renamed to their CG5 counterparts, other columns keep the names
+# of the file
+CG6_TO_CG5_COLUMNS = {'Station': 'points', 'CorrGrav': 'grav', 'StdDev': 'SD', 'StdErr': 'SE', 'X': 'tiltx', 'Y': 'tilty',
+                      'TideCorr': 'tide_corr', 'TempCorr': 'temp_corr', 'MeasurDur': 'duration', 'InstrHeight': 'height'}
+
+# CG6 column of the applied corrections, one flag digit each
+CG6_CORRECTION_FLAGS = 'Corrections[drift-temp-na-tide-tilt]'
+
+# CG6 header fields also stored under the CG5 name
+CG6_HEADER_ALIASES = {'Instrument Serial Number': 'Instrument S/N'}
+
+
+def parse_CG6_header(header):
+    # Header fields ('/ Key [unit]: Value', tab separated) as a dictionary,
+    # units are stripped from the keys, e.g. 'Gcal1', 'Instrument Serial
+    # Number' (also as 'Instrument S/N'), 'Drift Rate', 'Created'. Fields
+    # with a unit hold numbers.
+    metadata = {}
+
+    for line in header:
+        key, separator, value = line.lstrip('/').strip().partition(':')
+        key, unit = re.match(r'(.*?)\s*(\[.*\])?$', key.strip()).groups()
+        value = value.strip()
+        if not separator or not key:
+            continue
+
+        if unit:
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+
+        # Dates and times written as YYYY-MM-DD HH:MM:SS
+        elif re.fullmatch(r'\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2})?', value):
+            value = datetime.fromisoformat(value)
+
+        metadata[key] = value
+        if key in CG6_HEADER_ALIASES:
+            metadata[CG6_HEADER_ALIASES[key]] = value
+
+    return metadata
+
+
+def parse_CG6(input_file, header_lines=None):
+    # Reads a CG6 file into typed arrays without any unit conversion and the
+    # header metadata, same header rules as parse_CG5. Columns follow the
+    # column banner of the file, renamed by CG6_TO_CG5_COLUMNS.
+    with open(input_file, 'rb') as file:
+        raw = file.read()
+
+    header, data_start = split_CG5_header(raw, header_lines)
+
+    # Column names from the banner, the last header line starting with '/Station'
+    columns = CG6_COLUMNS
+    for line in reversed(header):
+        if line.lstrip('/').strip().startswith('Station'):
+            columns = line.lstrip('/').strip().split('\t')
+            break
+
+    data = (b'\n' + raw[data_start:]).replace(b'\n/', b'\n#')
+
+    with stage('parse', bytes=len(raw)):
+        filedata = pd.read_csv(io.BytesIO(data), sep='\t', engine='c', header=None, names=columns, comment='#',
+                               dtype={'Station': str, 'Date': str, 'Time': str, 'Line': str}, skip_blank_lines=True)
+
+        CG6_data = {CG6_TO_CG5_COLUMNS.get(name, name): filedata[name].to_numpy() for name in columns if name not in ('Date', 'Time')}
+        for name, values in CG6_data.items():
+            if values.dtype == object:
+                CG6_data[name] = values.astype(str)
+
+    # Datetime and numeric date (days since Unix epoch), ISO date and time
+    # strings are parsed by numpy in one pass
+    with stage('datetime', rows=len(filedata)):
+        CG6_data['datetime'] = np.array(filedata['Date'].to_numpy(dtype=object) + 'T' + filedata['Time'].to_numpy(dtype=object), dtype='datetime64[s]')
+        CG6_data['datenum'] = CG6_data['datetime'].astype(np.int64) / (24 * 3600)
+
+    return CG6_data, parse_CG6_header(header)
+
+
+def read_CG6(input_file, header_lines=None, calibration_factor=None, SD_scale_information=0, cache=None, tide_model=None,
+             input_units_option=None):
+
+    # Read data from file (or a gradmap_cache.SurveyCache), columns and units
+    # as in read_CG5, header metadata is kept in filedata.attrs['header']
+    CG6_data, header = parse_CG6(input_file, header_lines) if cache is None else cache.parse(parse_CG6, input_file, header_lines)
+    filedata = pd.DataFrame(CG6_data, copy=False)
+    filedata.attrs['header'] = header
+
+    # Instrument tide correction replaced by the computed one, readings are
+    # in UTC at the user coordinates of every reading. The tide flag of the
+    # corrections column tells whether the instrument applied its own.
+    if tide_model is not None:
+        tide = tide_correction(tide_model, filedata['datetime'].to_numpy(), filedata['LatUser'].to_numpy(),
+                               filedata['LonUser'].to_numpy(), filedata['ElevUser'].to_numpy())
+        applied = filedata['tide_corr']
+        if CG6_CORRECTION_FLAGS in filedata:
+            flags = filedata[CG6_CORRECTION_FLAGS].astype(str).str.zfill(5)
+            applied = applied.where(flags.str[3] == '1', 0)
+        filedata['grav'] = filedata['grav'] - applied + tide / 1000
+
+    # Height measured from the point to the bottom of the gravimeter, the
+    # sensor is 6.58 cm above it. Units of input_units_option, without it
+    # centimetres when the mean height is over 3.
+    with stage('units', rows=len(filedata)):
+        if height_in_centimetres(input_units_option, filedata['height'].mean() > 3):
+            filedata['height'] = (filedata['height'] + 6.58) / 100
+        else:
+            filedata['height'] = filedata['height'] + 0.0658
+
+        # Convert measured mGal units to μGal, calibrated when factor is provided
+        filedata['grav'] = filedata['grav'] * (1000 if calibration_factor is None else 1000 * calibration_factor)
+
+        # Standard error of the mean reading in μGal, already refers to the whole
+        # measurement so SD scaling does not apply
+        filedata['ERR'] = filedata['SE'] * 1000
+
+    return filedata
+
+
+# Readers of the supported instruments
+READERS = {'CG5': read_CG5, 'CG6': read_CG6}
+
+
+def read_survey(input_file, instrument_type='CG5', header_lines=None, calibration_factor=None, SD_scale_information=0, cache=None,
+                tide_model=None, input_units_option=None):
+    # Observations of a file of the given instrument type, with tide_model
+    # (see TIDE_MODELS) the tide correction of the instrument is replaced,
+    # input_units_option gives the height units (see HEIGHT_UNITS)
+    if instrument_type not in READERS:
+        raise ValueError(f'Unknown instrument type {instrument_type!r}, use one of {sorted(READERS)}')
+
+    return Observations.from_frame(READERS[instrument_type](input_file, header_lines, calibration_factor, SD_scale_information, cache,
+                                                            tide_model, input_units_option))
\ No newline at end of file
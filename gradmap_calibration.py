@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Calibration of relative gravimeters on calibration lines.
+
+Repeated surveys of a calibration line with known reference gravity are
+adjusted together with a scale factor per instrument (serial number), a
+constant and a drift polynomial per file. The estimated factor is the
+calibration_factor of the processing routines.
+
+Usage: python -m gradmap_calibration reference.csv input_file [input_file ...]
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from gradmap_batch import collect_input_files
+from gradmap_calc import read_survey
+from gradmap_network import factorize, inverse_diagonal
+
+
+def read_reference_values(reference_file):
+    # Known gravity of the calibration points in μGal, CSV with the point ID
+    # in the first column and gravity in the second (any common datum)
+    table = pd.read_csv(reference_file, dtype={0: str}, sep=None, engine='python')
+    return dict(zip(table.iloc[:, 0].str.strip(), table.iloc[:, 1].astype(float)))
+
+
+def calibration_block(observations, reference_values, drift_degree=2):
+    # Jacobi matrix block and observations of one file. The model of a
+    # reading of point p is
+    #     k (g - g0) + 308.6 h = G_p + c + d1 t + ... + dD t^D
+    # with the scale k of the instrument, known gravity G_p and the constant
+    # and drift of the file; g0 (mean reading) keeps k decorrelated from the
+    # constant. Columns are [scale | constant, drift 1..D], readings of
+    # points without reference value are left out.
+    points = observations.points
+    known = np.array([point in reference_values for point in observations.point_names])
+    rows = np.flatnonzero(known[observations.point_codes])
+    if np.count_nonzero(known) < 2:
+        raise ValueError('Calibration file has less than two points with a reference value')
+
+    grav = observations.grav[rows]
+    time = observations.datenum[rows] - observations.datenum[0]
+    reading = grav - grav.mean()
+
+    block = np.column_stack([reading, -np.ones(len(rows))] + [-time**degree for degree in range(1, drift_degree + 1)])
+    reference = np.array([reference_values[point] for point in points[rows]])
+    l = reference - observations.height[rows] * 308.6
+
+    return {
+        'block': block,
+        'observations': l - block[:, 0],
+        'weight': 1 / np.square(observations.ERR[rows]),
+        'SN': str(observations.header.get('Instrument S/N', '')).strip(),
+        'number_of_measurements': observations.number_of_observations,
+        'number_of_points': int(np.count_nonzero(known)),
+    }
+
+
+def file_block(input_file, reference_values, instrument_type='CG5', header_lines=None, calibration_factor=None,
+               SD_scale_information=0, drift_degree=2, cache=None):
+    # Reads one file and builds its block, runs in the worker processes
+    observations = read_survey(input_file, instrument_type, header_lines, calibration_factor, SD_scale_information, cache)
+    return calibration_block(observations, reference_values, drift_degree)
+
+
+def calibration_adjustment(blocks, filenames=None, calibration_factor=None, significance=2, max_iterations=1):
+    # Joint adjustment of the file blocks. Observations are reduced by the
+    # reading (k = 1 + dk), so the parameters are the scale corrections dk
+    # of the instruments and the constants and drift of the files.
+    # Instruments are identified by serial number, files without one get
+    # their own scale. Outliers as in gravity_differences.
+    number_of_files = len(blocks)
+    if number_of_files == 0:
+        raise ValueError('No calibration files')
+    if filenames is None:
+        filenames = [f'file {index + 1}' for index in range(number_of_files)]
+
+    instruments = [block['SN'] or filename for block, filename in zip(blocks, filenames)]
+    instrument_codes, instrument_names = pd.factorize(np.array(instruments, dtype=str))
+    number_of_instruments = len(instrument_names)
+
+    # Sparse Jacobi matrix: scale column of the instrument, then the own
+    # columns of the file
+    widths = np.array([block['block'].shape[1] - 1 for block in blocks])
+    file_offset = number_of_instruments + np.concatenate([[0], np.cumsum(widths)[:-1]])
+    number_of_parameters = number_of_instruments + int(widths.sum())
+
+    row_offset = np.concatenate([[0], np.cumsum([len(block['observations']) for block in blocks])])
+    rows, columns, values = [], [], []
+    for index, block in enumerate(blocks):
+        height, width = block['block'].shape
+        block_columns = np.concatenate([[instrument_codes[index]], file_offset[index] + np.arange(width - 1)])
+        rows.append(np.repeat(np.arange(row_offset[index], row_offset[index] + height), width))
+        columns.append(np.tile(block_columns, height))
+        values.append(block['block'].ravel())
+
+    A = sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                          shape=(row_offset[-1], number_of_parameters))
+    l = np.concatenate([block['observations'] for block in blocks])
+    weight = np.concatenate([block['weight'] for block in blocks])
+    active = np.ones(len(l), dtype=bool)
+
+    degrees_of_freedom = len(l) - number_of_parameters
+    if degrees_of_freedom <= 0:
+        raise ValueError('Calibration has no redundancy')
+
+    def solve(active):
+        A_active = A[active]
+        A_weighted = A_active.multiply(weight[active][:, None]).tocsr()
+        factor = factorize((A_weighted.T @ A_active).tocsc())
+        adjusted_parameters = factor.solve(A_weighted.T @ l[active])
+        v = A @ adjusted_parameters - l
+        degrees_of_freedom = np.count_nonzero(active) - number_of_parameters
+        rmse = np.sqrt(np.sum(weight[active] * v[active]**2) / degrees_of_freedom)
+        return adjusted_parameters, v, rmse, factor, degrees_of_freedom
+
+    adjusted_parameters, v, rmse, factor, degrees_of_freedom = solve(active)
+
+    # Outliers removed and the adjustment repeated, at most max_iterations times
+    for _ in range(max(max_iterations, 1)):
+        index_outliers = np.flatnonzero(active & (np.abs(v) >= 5 * 3 * rmse * significance))
+        if index_outliers.size == 0:
+            break
+        active[index_outliers] = False
+        adjusted_parameters, v, rmse, factor, degrees_of_freedom = solve(active)
+
+    scale = 1 + adjusted_parameters[:number_of_instruments]
+    SD_scale = rmse * np.sqrt(inverse_diagonal(factor, np.arange(number_of_instruments)))
+    if calibration_factor is not None:
+        scale = scale * calibration_factor
+        SD_scale = SD_scale * calibration_factor
+
+    files = []
+    for index, block in enumerate(blocks):
+        rows = slice(row_offset[index], row_offset[index + 1])
+        parameters = adjusted_parameters[file_offset[index]:file_offset[index] + widths[index]]
+        files.append({
+            'filename': filenames[index],
+            'SN': instrument_names[instrument_codes[index]],
+            'number_of_measurements': block['number_of_measurements'],
+            'calibration_measurements': int(row_offset[index + 1] - row_offset[index]),
+            'rejected_measurements': int(np.count_nonzero(~active[rows])),
+            'number_of_points': block['number_of_points'],
+            'constant': parameters[0],
+            'drift_parameters': parameters[1:],
+            'RMSE': np.sqrt(np.mean(weight[rows][active[rows]] * v[rows][active[rows]]**2)),
+        })
+
+    output_calibration = {
+        'instruments': {
+            'SN': np.asarray(instrument_names, dtype=str),
+            'calibration_factor': scale,
+            'std': SD_scale,
+            'number_of_files': np.bincount(instrument_codes, minlength=number_of_instruments),
+        },
+        'files': files,
+        'processing': {
+            'number_of_measurements': int(len(l)),
+            'rejected_measurements': int(np.count_nonzero(~active)),
+            'number_of_parameters': int(number_of_parameters),
+            'degrees_of_freedom': int(degrees_of_freedom),
+            'RMSE': rmse,
+            'residuals': v,
+            'active': active,
+        },
+    }
+
+    return output_calibration
+
+
+def calibrate_files(input_files, reference_values, instrument_type='CG5', header_lines=None, calibration_factor=None,
+                    SD_scale_information=0, drift_degree=2, significance=2, max_iterations=1, cache=None, max_workers=None):
+    # Calibration from a list of files (or glob patterns), blocks of the
+    # files are read and built in a process pool
+    file_list = collect_input_files(input_files)
+    if isinstance(reference_values, str):
+        reference_values = read_reference_values(reference_values)
+    settings = (reference_values, instrument_type, header_lines, calibration_factor, SD_scale_information, drift_degree, cache)
+
+    if max_workers == 1 or len(file_list) <= 1:
+        blocks = [file_block(input_file, *settings) for input_file in file_list]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(file_block, input_file, *settings) for input_file in file_list]
+            blocks = [future.result() for future in futures]
+
+    return calibration_adjustment(blocks, file_list, calibration_factor, significance, max_iterations)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='gradmap_calibration', description='Calibration factors from calibration line surveys.')
+    parser.add_argument('reference', help='CSV of point IDs and reference gravity in μGal')
+    parser.add_argument('input_files', nargs='+', help='calibration line survey file(s), glob patterns are expanded')
+    parser.add_argument('--instrument', choices=['CG5', 'CG6'], default='CG5')
+    parser.add_argument('--header-lines', type=int, default=None)
+    parser.add_argument('--SD-scaling', type=int, choices=[0, 1], default=0)
+    parser.add_argument('--calibration-factor', type=float, default=None, help='factor applied to the readings (default: GCAL1 only)')
+    parser.add_argument('--drift-degree', type=int, default=2)
+    parser.add_argument('--significance', type=int, choices=[1, 2, 3], default=2)
+    parser.add_argument('--max-iterations', type=int, default=1)
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    arguments = parser.parse_args(argv)
+
+    calibration = calibrate_files(arguments.input_files, arguments.reference, arguments.instrument, arguments.header_lines,
+                                  arguments.calibration_factor, arguments.SD_scaling, arguments.drift_degree,
+                                  arguments.significance, arguments.max_iterations, max_workers=arguments.jobs)
+
+    instruments = calibration['instruments']
+    print(f'{"instrument":>12} {"files":>6} {"calibration factor":>19} {"SD":>10}')
+    for SN, files, scale, std in zip(instruments['SN'], instruments['number_of_files'], instruments['calibration_factor'], instruments['std']):
+        print(f'{os.path.basename(SN):>12} {files:>6} {scale:19.7f} {std:10.7f}')
+    print(f"RMSE [μGal]: {calibration['processing']['RMSE']:.1f}, "
+          f"rejected: {calibration['processing']['rejected_measurements']}/{calibration['processing']['number_of_measurements']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Command line interface of gradmap for batch processing without the GUI.
+
+Usage: python -m gradmap_cli [options] input_file [input_file ...]
+       python gradmap_cli.py --help
+"""
+
+import argparse
+import os
+import sys
+
+from gradmap_batch import collect_input_files, process_files
+from gradmap_profile import Profiler
+from gradmap_report import CONFIDENCE, ResultWriter, summary_header
+
+# GUI option 'number of measured positions' -> number_of_measured_levels,
+# None lets the processing count the levels in the file
+MEASURED_POSITIONS = {'2': 2, '3': 3, '4': 4, 'from-file': None}
+
+# GUI option height units -> input_units_option, without the option the
+# units are detected from the file
+INPUT_UNITS = {'cm': 1, 'm': 2}
+
+
+def processing_mode(arguments):
+    # Batch processing mode of the chosen method and gradient format
+    if arguments.mode == 'standard':
+        return 'differences'
+    return arguments.gradient_format
+
+
+def processing_settings(arguments):
+    # Settings shared by all files, each routine picks the ones it accepts
+    settings = {
+        'header_lines': arguments.header_lines,
+        'instrument_type': arguments.instrument,
+        'calibration_factor': arguments.calibration_factor,
+        'SD_scale_information': arguments.SD_scaling,
+        'number_of_measured_levels': MEASURED_POSITIONS[arguments.measured_positions],
+        'input_units_option': INPUT_UNITS.get(arguments.units),
+        'significance': arguments.significance,
+        'SD00': arguments.instrument_uncertainty,
+        'max_iterations': arguments.max_iterations,
+        'robust': arguments.robust,
+        'detect_tares': arguments.detect_tares,
+        'uncertainty': arguments.uncertainty,
+        'replicates': arguments.replicates,
+        'tide_model': None if arguments.tide == 'instrument' else arguments.tide,
+    }
+
+    if arguments.cache:
+        from gradmap_cache import SurveyCache
+        settings['cache'] = SurveyCache(arguments.cache)
+
+    return settings
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='gradmap',
+        description='Vertical gravity gradient and gravity difference processing of relative gravimeter data.')
+
+    parser.add_argument('input_files', nargs='+', help='input file(s), glob patterns are expanded')
+
+    # Input data
+    parser.add_argument('--instrument', choices=['CG5', 'CG6'], default='CG5', help='instrument type (default: %(default)s)')
+    parser.add_argument('--header-lines', type=int, default=None,
+                        help='number of header lines to skip (default: detected from the file)')
+    parser.add_argument('--units', choices=sorted(INPUT_UNITS), default=None, help='height units (default: detected from the file)')
+    parser.add_argument('--SD-scaling', type=int, choices=[0, 1], default=0,
+                        help='0 if SD refers to the 60 s estimate, 1 if it refers to 1 Hz readings (default: %(default)s)')
+    parser.add_argument('--instrument-uncertainty', type=float, default=5, dest='instrument_uncertainty',
+                        help='instrument specific precision SD00 in μGal (default: %(default)s)')
+
+    # Processing
+    parser.add_argument('--mode', choices=['gradient', 'standard'], default='gradient',
+                        help='gradient processing or standard processing of gravity differences (default: %(default)s)')
+    parser.add_argument('--measured-positions', choices=sorted(MEASURED_POSITIONS), default='2',
+                        help='number of measured positions (default: %(default)s)')
+    parser.add_argument('--rejection-threshold', type=float, default=5,
+                        help='rejection threshold in μGal (default: %(default)s)')
+    parser.add_argument('--gradient-format', choices=['linear', 'function'], default='linear',
+                        help='gradient format (default: %(default)s)')
+    parser.add_argument('--significance', type=int, choices=sorted(CONFIDENCE), default=2,
+                        help='significance level in sigma: 1 (68%%), 2 (95%%) or 3 (99.7%%) (default: %(default)s)')
+    parser.add_argument('--calibration-factor', type=float, default=None,
+                        help='extra scale factor of the readings (default: none)')
+    parser.add_argument('--max-iterations', type=int, default=1,
+                        help='outlier rejection passes (default: %(default)s)')
+    parser.add_argument('--robust', choices=['huber', 'tukey'], default=None,
+                        help='robust estimation (IRLS) with Huber or Tukey weights instead of outlier rejection')
+    parser.add_argument('--detect-tares', action='store_true',
+                        help='detect tares (jumps) and fit a piecewise drift (linear gradient and standard processing)')
+    parser.add_argument('--uncertainty', choices=['bootstrap', 'montecarlo'], default=None,
+                        help='empirical confidence intervals from resampled replicates (linear gradient and standard processing)')
+    parser.add_argument('--replicates', type=int, default=10000, help='number of resampled replicates (default: %(default)s)')
+    parser.add_argument('--tide', choices=['instrument', 'longman'], default='instrument',
+                        help='tide correction: as applied by the instrument, or computed (Longman) from the time and coordinates of the readings (default: %(default)s)')
+
+    # Output and execution
+    parser.add_argument('-o', '--report', default='gradmap_report.txt', help='report file (default: %(default)s)')
+    parser.add_argument('-s', '--summary', default=None, help='summary table of all processed files (.csv or .parquet)')
+    parser.add_argument('--json', default=None, help='results of all files as JSON (.json, or .jsonl with one file per line)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs, 1 for serial processing)')
+    parser.add_argument('--cache', default=None, help='directory of the parsed file cache')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not print progress')
+    parser.add_argument('--profile', default=None, metavar='FILE',
+                        help='record the time of every processing stage to FILE (.json or .csv) and print a summary')
+
+    return parser
+
+
+def main(argv=None):
+    arguments = build_parser().parse_args(argv)
+
+    file_list = collect_input_files(arguments.input_files)
+    if not file_list:
+        print('input files are missing', file=sys.stderr)
+        return 2
+
+    # prevents overwriting an input file with the report
+    report_file = arguments.report
+    if os.path.abspath(report_file) in map(os.path.abspath, file_list):
+        root, extension = os.path.splitext(report_file)
+        report_file = f'{root}_output{extension}'
+
+    mode = processing_mode(arguments)
+    settings = processing_settings(arguments)
+
+    profiler = Profiler() if arguments.profile else None
+
+    # Workers serialize their results and put them to the queue of the
+    # writer, which appends them to the output files in input order
+    try:
+        writer = ResultWriter(report_file, arguments.summary, arguments.json, shared=arguments.jobs != 1 and len(file_list) > 1)
+    except (ValueError, ImportError) as error:
+        print(f'summary cannot be written: {error}', file=sys.stderr)
+        return 2
+    record_options = {'rejection_threshold': arguments.rejection_threshold, 'parts': writer.parts()}
+
+    results = [None] * len(file_list)
+    with writer:
+        for number, result in enumerate(process_files(file_list, mode, settings, arguments.jobs, bool(profiler),
+                                                      writer.queue, record_options), start=1):
+            # The output went to the writer as a record, only the status is kept
+            result['output'] = None
+            results[result['index']] = result
+            if profiler:
+                profiler.extend(result['profile'])
+            if not arguments.quiet:
+                status = 'done' if result['error'] is None else 'failed'
+                print(f"Processed file {number:.0f}/{len(file_list):.0f} ({status}): {result['filename']}", file=sys.stderr)
+
+        writer.close(lambda writer: summary_header(writer.number_of_files, writer.rejected_files, writer.failed_files, mode,
+                                                   arguments.calibration_factor, arguments.instrument_uncertainty,
+                                                   arguments.significance))
+
+    if profiler:
+        profiler({'stage': 'report', 'files': writer.number_of_files, 'wall_time': writer.write_time})
+        profiler.export(arguments.profile)
+        print(profiler.summary().to_string(), file=sys.stderr)
+
+    failed = [result for result in results if result['error'] is not None]
+    for result in failed:
+        print(f"Processing of {result['filename']} failed:\n{result['error']}", file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
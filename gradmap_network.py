@@ -0,0 +1,241 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import splu, spsolve_triangular
+
+from gradmap_calc import SIGNIFICANCE_LEVELS, read_survey, students_inverse
+
+
+def read_network(input_files, instrument_type='CG5', header_lines=None, calibration_factor=None, SD_scale_information=0, cache=None):
+    # Observations of all files of a campaign, one per file
+    return [read_survey(input_file, instrument_type, header_lines, calibration_factor, SD_scale_information, cache)
+            for input_file in input_files]
+
+
+def network_jacobi_matrix(free_codes, number_of_free_points, file_index, time, drift_degrees):
+    # Sparse Jacobi matrix of the network: one column per free point, then
+    # for every file a constant and drift polynomial (degrees 1..D of the
+    # file) in time since the first reading of the file. Readings of fixed
+    # points (free_codes < 0) have no point entry.
+    n = len(file_index)
+    block_size = 1 + np.asarray(drift_degrees)
+    file_offset = number_of_free_points + np.concatenate([[0], np.cumsum(block_size)[:-1]])
+    number_of_parameters = number_of_free_points + int(np.sum(block_size))
+
+    rows, columns, values = [], [], []
+
+    free = free_codes >= 0
+    rows.append(np.flatnonzero(free))
+    columns.append(free_codes[free])
+    values.append(np.ones(np.count_nonzero(free)))
+
+    # Constant of the file
+    rows.append(np.arange(n))
+    columns.append(file_offset[file_index])
+    values.append(np.ones(n))
+
+    # Drift polynomial, readings of files with at least the given degree
+    for degree in range(1, int(np.max(drift_degrees, initial=0)) + 1):
+        with_degree = np.flatnonzero(np.asarray(drift_degrees)[file_index] >= degree)
+        rows.append(with_degree)
+        columns.append(file_offset[file_index[with_degree]] + degree)
+        values.append(time[with_degree]**degree)
+
+    A = sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                          shape=(n, number_of_parameters))
+    return A, file_offset
+
+
+def factorize(N):
+    # Sparse LDL' factorization of the (symmetric positive definite) normal
+    # matrix: SuperLU in symmetric mode with a fill reducing ordering of
+    # N + N' and no pivoting, so U = D L'
+    return splu(N.tocsc(), permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0, options={'SymmetricMode': True})
+
+
+def inverse_diagonal(factor, columns, block_size=256):
+    # Selected diagonal elements of N^-1 = P L^-T D^-1 L^-1 P', element i is
+    # sum(y^2 / D) for y = L^-1 P' e_i. y is zero above the position of i in
+    # the elimination order, so blocks of columns sorted by that position
+    # only solve the trailing part of L.
+    L = factor.L.tocsr()
+    D = factor.U.diagonal()
+    number_of_parameters = L.shape[0]
+
+    position = factor.perm_r[np.asarray(columns, dtype=int)]
+    order = np.argsort(position)
+    diagonal = np.empty(len(position))
+
+    for start in range(0, len(order), block_size):
+        block = order[start:start + block_size]
+        first = position[block].min()
+
+        unit = np.zeros((number_of_parameters - first, len(block)))
+        unit[position[block] - first, np.arange(len(block))] = 1
+        y = spsolve_triangular(L[first:, first:], unit, lower=True, unit_diagonal=True)
+        diagonal[block] = np.sum(y**2 / D[first:, None], axis=0)
+
+    return diagonal
+
+
+def network_adjustment(observations, filenames=None, fixed_points=None, drift_degree=2, significance=2, max_iterations=1, rejection_factor=None):
+    # Adjustment of a campaign network in one sparse weighted least squares
+    # system. Points are identified by ID across all files, every file has
+    # its own constant and drift polynomial. fixed_points maps point IDs to
+    # known gravity in μGal (default: first point of the first file fixed at
+    # 0, results are then differences to it). Readings are reduced to the
+    # mark by the normal gradient and weighted by 1/ERR^2 as in
+    # gravity_differences, drift degrees are tested per file in the same
+    # way. Outliers are readings with |v| >= rejection_factor * rmse
+    # (default 5*3*significance as in gravity_differences).
+    number_of_files = len(observations)
+    if number_of_files == 0:
+        raise ValueError('No observations to adjust')
+    if filenames is None:
+        filenames = [f'file {index + 1}' for index in range(number_of_files)]
+    if rejection_factor is None:
+        rejection_factor = 5 * 3 * significance
+
+    lengths = np.array([observation.number_of_observations for observation in observations])
+    file_index = np.repeat(np.arange(number_of_files), lengths)
+
+    # Points by ID across files
+    point_codes, point_names = pd.factorize(np.concatenate([observation.points for observation in observations]))
+    number_of_points = len(point_names)
+
+    if fixed_points is None:
+        fixed_points = {point_names[0]: 0.0}
+    fixed_value = np.full(number_of_points, np.nan)
+    for point, value in fixed_points.items():
+        matches = np.flatnonzero(point_names == str(point))
+        if matches.size == 0:
+            raise ValueError(f'Fixed point {point!r} is not in the network')
+        fixed_value[matches[0]] = value
+
+    fixed = ~np.isnan(fixed_value)
+    free_code = np.full(number_of_points, -1)
+    free_code[~fixed] = np.arange(np.count_nonzero(~fixed))
+    number_of_free_points = int(np.count_nonzero(~fixed))
+
+    check_connectivity(point_codes, file_index, number_of_points, number_of_files, fixed, point_names)
+
+    # Observations reduced to the mark, known gravity of fixed points moved
+    # to the observation side
+    grav = np.concatenate([observation.grav + observation.height * 308.6 for observation in observations])
+    grav = grav - np.where(fixed[point_codes], fixed_value[point_codes], 0)
+    ERR = np.concatenate([observation.ERR for observation in observations])
+    weight = 1 / np.square(ERR)
+    time = np.concatenate([observation.datenum - observation.datenum[0] for observation in observations])
+    active = np.concatenate([observation.active for observation in observations])
+
+    free_codes = free_code[point_codes]
+    drift_degrees = np.full(number_of_files, drift_degree)
+
+    def solve(drift_degrees, active):
+        A, file_offset = network_jacobi_matrix(free_codes, number_of_free_points, file_index, time, drift_degrees)
+        A_active = A[active]
+        A_weighted = A_active.multiply(weight[active][:, None]).tocsr()
+        N = (A_weighted.T @ A_active).tocsc()
+        b = A_weighted.T @ grav[active]
+
+        factor = factorize(N)
+        adjusted_parameters = factor.solve(b)
+        v = A @ adjusted_parameters - grav
+
+        degrees_of_freedom = np.count_nonzero(active) - A.shape[1]
+        if degrees_of_freedom <= 0:
+            raise ValueError('Network has no redundancy')
+        rmse = np.sqrt(np.sum(weight[active] * v[active]**2) / degrees_of_freedom)
+
+        return adjusted_parameters, v, rmse, factor, file_offset, A.shape[1], degrees_of_freedom
+
+    adjusted_parameters, v, rmse1, factor, file_offset, number_of_parameters, _ = solve(drift_degrees, active)
+
+    # Outliers of the first solution
+    index_outliers = np.flatnonzero(active & (np.abs(v) >= rejection_factor * rmse1))
+
+    # Significance of the highest drift coefficient of every file
+    if drift_degree > 0:
+        significance_level = SIGNIFICANCE_LEVELS[significance]
+        last_drift = file_offset + drift_degrees
+        SD_last = rmse1 * np.sqrt(inverse_diagonal(factor, last_drift))
+        Tau = adjusted_parameters[last_drift] / SD_last
+        points_per_file = np.array([observation.number_of_points for observation in observations])
+        t_value = np.array([students_inverse(significance_level, max(n - k, 1)) for n, k in zip(lengths, points_per_file)])
+        drift_degrees = np.where(np.abs(Tau) < t_value, drift_degrees - 1, drift_degrees)
+
+    # Reprocessing without outliers, repeated until none is left or
+    # max_iterations is reached
+    for _ in range(max(max_iterations, 1)):
+        active[index_outliers] = False
+        adjusted_parameters, v, rmse, factor, file_offset, number_of_parameters, degrees_of_freedom = solve(drift_degrees, active)
+        index_outliers = np.flatnonzero(active & (np.abs(v) >= rejection_factor * rmse))
+        if index_outliers.size == 0:
+            break
+
+    # Point gravity and standard deviation, fixed points keep their value
+    gravity = fixed_value.copy()
+    SD = np.zeros(number_of_points)
+    gravity[~fixed] = adjusted_parameters[:number_of_free_points]
+    SD[~fixed] = rmse * np.sqrt(inverse_diagonal(factor, np.arange(number_of_free_points)))
+
+    # Per file results
+    files = []
+    boundaries = np.concatenate([[0], np.cumsum(lengths)])
+    for index in range(number_of_files):
+        rows = slice(boundaries[index], boundaries[index + 1])
+        observations[index].active[:] = active[rows]
+        block = slice(file_offset[index], file_offset[index] + 1 + drift_degrees[index])
+        files.append({
+            'filename': filenames[index],
+            'number_of_measurements': int(lengths[index]),
+            'rejected_measurements': int(np.count_nonzero(~active[rows])),
+            'drift_polynomial_degree': int(drift_degrees[index]),
+            'drift_parameters': adjusted_parameters[block][1:],
+            'constant': adjusted_parameters[block][0],
+        })
+
+    readings_per_point = np.bincount(point_codes[active], minlength=number_of_points)
+
+    output_network = {
+        'points': {
+            'ID': np.asarray(point_names, dtype=str),
+            'gravity': gravity,
+            'std': SD,
+            'fixed': fixed,
+            'number_of_measurements': readings_per_point,
+        },
+        'files': files,
+        'processing': {
+            'number_of_measurements': int(len(active)),
+            'rejected_measurements': int(np.count_nonzero(~active)),
+            'number_of_parameters': int(number_of_parameters),
+            'degrees_of_freedom': int(degrees_of_freedom),
+            'RMSE': rmse,
+            'residuals': v,
+            'active': active,
+        },
+    }
+
+    return output_network
+
+
+def check_connectivity(point_codes, file_index, number_of_points, number_of_files, fixed, point_names):
+    # Every point has to be tied to a fixed point through shared files,
+    # otherwise the normal matrix is singular
+    graph = sparse.coo_matrix((np.ones(len(point_codes)), (point_codes, number_of_points + file_index)),
+                              shape=(number_of_points + number_of_files,) * 2)
+    _, labels = connected_components(graph, directed=False)
+
+    tied = np.isin(labels[:number_of_points], labels[:number_of_points][fixed])
+    if not tied.all():
+        loose = ', '.join(point_names[~tied][:10])
+        raise ValueError(f'{np.count_nonzero(~tied)} point(s) are not connected to a fixed point: {loose}')
+
+
+def network_files(input_files, instrument_type='CG5', header_lines=None, calibration_factor=None, SD_scale_information=0,
+                  fixed_points=None, drift_degree=2, significance=2, max_iterations=1, cache=None):
+    # Network adjustment of a list of files
+    observations = read_network(input_files, instrument_type, header_lines, calibration_factor, SD_scale_information, cache)
+    return network_adjustment(observations, list(input_files), fixed_points, drift_degree, significance, max_iterations)
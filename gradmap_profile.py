@@ -0,0 +1,127 @@
+import contextlib
+import csv
+import json
+import time
+import tracemalloc
+
+import pandas as pd
+
+
+# Active hooks, each called with the record of every finished stage. Stages
+# are not timed at all while the list is empty.
+_hooks = []
+
+# Shared do-nothing context returned by stage() when profiling is off
+_NO_STAGE = contextlib.nullcontext()
+
+
+class _Stage:
+    # Timing (and optionally allocations) of one named stage, the record is
+    # passed to all hooks when the stage ends
+    __slots__ = ('record', 'start', 'memory_start')
+
+    def __init__(self, name, info):
+        self.record = {'stage': name, **info}
+
+    def __enter__(self):
+        if tracemalloc.is_tracing():
+            # Nested stages reset the peak of the enclosing one, peaks of
+            # enclosing stages are then a lower bound
+            self.memory_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, *exception):
+        self.record['wall_time'] = time.perf_counter() - self.start
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self.record['allocated_bytes'] = current - self.memory_start
+            self.record['peak_bytes'] = peak - self.memory_start
+        for hook in _hooks:
+            hook(self.record)
+        return False
+
+
+def stage(name, **info):
+    # Context manager around a named stage of the processing, info holds
+    # sizes (e.g. rows=, columns=) stored with the record. Returns a shared
+    # null context when no hook is active.
+    if not _hooks:
+        return _NO_STAGE
+    return _Stage(name, info)
+
+
+def add_hook(hook):
+    # Registers a callback receiving the record (dict) of every stage
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+class Profiler:
+    # Collects stage records, labels (e.g. file=...) are added to every
+    # record. Records of other processes (batch workers) are merged with
+    # extend().
+    def __init__(self, **labels):
+        self.labels = labels
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append({**self.labels, 'sequence': len(self.records), **record})
+
+    def extend(self, records):
+        self.records.extend(records)
+
+    def to_frame(self):
+        return pd.DataFrame(self.records)
+
+    def summary(self):
+        # Totals per stage over all records (nested stages are also part of
+        # their enclosing stage)
+        table = self.to_frame()
+        if table.empty:
+            return table
+        aggregations = {'count': ('wall_time', 'size'), 'total_time': ('wall_time', 'sum'),
+                        'mean_time': ('wall_time', 'mean'), 'max_time': ('wall_time', 'max')}
+        if 'peak_bytes' in table:
+            aggregations['max_peak_bytes'] = ('peak_bytes', 'max')
+        summary = table.groupby('stage').agg(**aggregations)
+        summary['share'] = summary['total_time'] / summary['total_time'].sum()
+        return summary.sort_values('total_time', ascending=False)
+
+    def export(self, path):
+        # Records as JSON (list of objects) or CSV, chosen by the extension
+        if path.lower().endswith('.json'):
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(self.records, file, indent=1, default=str)
+            return
+
+        fields = list(dict.fromkeys(key for record in self.records for key in record))
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.records)
+
+
+@contextlib.contextmanager
+def profiling(track_memory=False, **labels):
+    # Records all stages run inside the block, e.g.
+    #     with profiling(file=name) as profiler:
+    #         gradient_linear(...)
+    #     profiler.summary()
+    # track_memory also records allocations (tracemalloc, slows down the run)
+    profiler = Profiler(**labels)
+    started_tracing = track_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    add_hook(profiler)
+    try:
+        yield profiler
+    finally:
+        remove_hook(profiler)
+        if started_tracing:
+            tracemalloc.stop()
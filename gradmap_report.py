@@ -0,0 +1,391 @@
+import csv
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+
+# Labels of the significance level option (1, 2 or 3 sigma)
+CONFIDENCE = {1: '68%', 2: '95%', 3: '99.7%'}
+
+# Output kinds of a result record and the file formats of the summary
+RECORD_PARTS = ('report', 'summary', 'json')
+SUMMARY_FORMATS = {'.csv': 'csv', '.parquet': 'parquet'}
+
+# Buffer of every output file, rows are written in blocks of this size
+BUFFER_SIZE = 1 << 20
+
+# Summary rows kept before a Parquet row group is written
+PARQUET_ROW_GROUP = 10000
+
+
+def is_rejected(output, mode, rejection_threshold):
+    # Rejection status of a processed station (same rules as gradmap.m)
+    if mode == 'linear':
+        return output['gradient']['std_num'] > rejection_threshold
+    if mode == 'function':
+        processing = output['processing']
+        return (output['gradient']['std'][0] > rejection_threshold
+                or processing['number_of_rejected_measurements'] > 0.5 * processing['number_of_measurements'])
+    return False
+
+
+def file_report(result, mode, rejection_threshold):
+    # Report lines of one processed file, layout follows gradmap.m
+    if result['error'] is not None:
+        message = result['error'].strip().splitlines()[-1]
+        return ['', f"processed file: {result['filename']}", f'status: failed ({message})']
+
+    output = result['output']
+    stationinfo = output['stationinfo']
+    processing = output['processing']
+
+    if mode == 'differences':
+        lines = ['',
+                 f"processed file: {stationinfo['filename']}",
+                 f"measurement date: {stationinfo['measurement_date']}",
+                 f"number of measurements accepted: {processing['number_of_measurements'] - processing['rejected_measurements']:.0f}",
+                 f"number of outliers: {processing['rejected_measurements']:.0f}",
+                 f"drift polynomial degree: {output['drift']['polynomial_degree']}",
+                 f"root mean square error [μGal]: {processing['RMSE']:.1f}",
+                 '#' * 84,
+                 'starting point, ending point, gravity difference [μGal], standard deviation [μGal]']
+
+        measured_points = stationinfo['measuredpoints']
+        for end_point, difference, std in zip(measured_points[1:], output['adjusted']['differences'], output['adjusted']['std']):
+            lines.append(f'{measured_points[0]},{end_point},{difference:5.1f},{std:5.1f}')
+
+        lines.append('#' * 84)
+        return lines
+
+    status = 'rejected' if is_rejected(output, mode, rejection_threshold) else 'accepted'
+    lines = ['',
+             f"processed file: {stationinfo['filename']}",
+             f"point ID: {stationinfo['ID']}",
+             f"measurement date: {stationinfo['measurement_date']}",
+             f'status: {status}',
+             f"number of measurements accepted: {processing['number_of_measurements']:.0f}",
+             f"number of outliers: {processing['number_of_rejected_measurements']:.0f}",
+             f"root mean square error: {processing['RMSE']:.1f}",
+             f"drift polynomial degree: {output['drift']['polynomial_degree']}"]
+
+    gradient = output['gradient']
+    if mode == 'linear':
+        lines += ['average height, gradient, standard deviation',
+                  f"{gradient['average_height']},{gradient['average_gradient']},{gradient['std']}"]
+    else:
+        lines += [f"gradient polynomial degree: {gradient['polynomial_degree']}",
+                  'gradient parameters',
+                  ','.join(f'{value:g}' for value in gradient['gradient_param']),
+                  'standard deviation ',
+                  ','.join(f'{value:g}' for value in gradient['std']),
+                  f"covariance:{gradient['cov']:g}"]
+
+    return lines
+
+
+def summary_header(number_of_files, rejected_files, failed_files, mode, calibration_factor, SD00, significance):
+    # Header block of the report file
+    calibration_factor = 'none' if calibration_factor is None else f'{calibration_factor:8.7f}'
+
+    header = ['Summary',
+              f'number of processed files: {number_of_files:.0f}']
+    if mode != 'differences':
+        header.append(f'number of files passing the rejection threshold: {rejected_files:.0f}')
+    if failed_files:
+        header.append(f'number of files failed to process: {failed_files:.0f}')
+    header += [f'calibration factor used: {calibration_factor}',
+               f'instrument uncertainty used: {SD00:.0f}',
+               f'computation performed on: {date.today():%d-%b-%Y}',
+               f'confidence: {CONFIDENCE[significance]}']
+
+    if mode == 'linear':
+        header += ['processing method: linear', 'gradient units: μGal/m']
+    elif mode == 'function':
+        header += ['processing method: function AH + BH²', 'Parameter units: A[μGal/m], B[μGal/m²]']
+
+    header.append('End of summary')
+    return header
+
+
+def summary_rows(result, mode):
+    # Summary rows of one file: one per station (gradient) or per gravity
+    # difference (standard processing), none for a failed file
+    output = result['output']
+    if output is None:
+        return []
+
+    uncertainty = output.get('uncertainty')
+
+    if mode == 'linear':
+        row = {'Station ID': output['stationinfo']['ID'],
+               'Gradient': output['gradient']['average_gradient_num'],
+               'Gradient SD': output['gradient']['std_num']}
+        if uncertainty is not None and uncertainty['gradient'] is not None:
+            row.update({'Gradient SD (resampled)': uncertainty['gradient']['std'],
+                        'Gradient CI lower': uncertainty['gradient']['lower'],
+                        'Gradient CI upper': uncertainty['gradient']['upper']})
+        return [row]
+    if mode == 'function':
+        gradient = output['gradient']
+        return [{'Station ID': output['stationinfo']['ID'],
+                 'A': gradient['gradient_param'][0], 'B': gradient['gradient_param'][1],
+                 'SD_A': gradient['std'][0], 'SD_B': gradient['std'][1],
+                 'cov_A_B': gradient['cov']}]
+
+    measured_points = output['stationinfo']['measuredpoints']
+    rows = [{'File': os.path.basename(result['filename']),
+             'Starting point': measured_points[0], 'Ending point': end_point,
+             'Gravity difference': difference, 'SD': std}
+            for end_point, difference, std in zip(measured_points[1:], output['adjusted']['differences'], output['adjusted']['std'])]
+    if uncertainty is not None:
+        differences = uncertainty['differences']
+        for row, std, lower, upper in zip(rows, differences['std'], differences['lower'], differences['upper']):
+            row.update({'SD (resampled)': std, 'CI lower': lower, 'CI upper': upper})
+    return rows
+
+
+def summary_table(results, mode):
+    return pd.DataFrame([row for result in results for row in summary_rows(result, mode)])
+
+
+def json_ready(value):
+    # Result dicts as plain JSON types: arrays and pandas objects become
+    # lists, datetimes ISO strings, NaN None and padded strings are stripped
+    if isinstance(value, dict):
+        return {str(key): json_ready(item) for key, item in value.items()}
+    if isinstance(value, pd.DataFrame):
+        return json_ready(value.to_dict(orient='list'))
+    if isinstance(value, (pd.Series, pd.Index)):
+        return json_ready(value.to_numpy())
+    if isinstance(value, np.ndarray):
+        if np.issubdtype(value.dtype, np.datetime64):
+            return np.datetime_as_string(value).tolist()
+        return [json_ready(item) for item in value.tolist()]
+    if isinstance(value, (list, tuple)):
+        return [json_ready(item) for item in value]
+    if isinstance(value, np.datetime64):
+        return str(np.datetime_as_string(value))
+    if isinstance(value, (datetime.datetime, datetime.date, pd.Timestamp)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def result_record(result, mode, rejection_threshold=5, parts=RECORD_PARTS):
+    # Serialized result of one file as written by ResultWriter, built in the
+    # worker process so that only text and rows go through the queue
+    record = {'index': result.get('index'), 'filename': result['filename'],
+              'failed': result['error'] is not None,
+              'rejected': result['error'] is None and bool(is_rejected(result['output'], mode, rejection_threshold))}
+    if 'report' in parts:
+        record['report'] = file_report(result, mode, rejection_threshold)
+    if 'summary' in parts:
+        record['summary'] = summary_rows(result, mode)
+    if 'json' in parts:
+        record['json'] = json_ready({'filename': result['filename'], 'output': result['output'], 'error': result['error']})
+    return record
+
+
+class ResultWriter:
+    # One buffered writer per output (text report, CSV/Parquet summary,
+    # JSON) for a whole batch. Records (result_record) come from a queue,
+    # shared=True makes it a manager queue that worker processes can put to.
+    # A thread drains the queue while the batch runs; records are written
+    # in input order (by their index) as soon as all earlier ones arrived,
+    # so output files are opened once and never rewritten per station. The
+    # report header depends on all files and is put in front on close().
+    #     with ResultWriter('report.txt', 'summary.csv', 'results.json') as writer:
+    #         for result in process_files(..., output_queue=writer.queue):
+    #             ...
+    #         writer.close(header)
+    def __init__(self, report_file=None, summary_file=None, json_file=None, shared=False, buffer_size=BUFFER_SIZE):
+        self.report_file = report_file
+        self.summary_file = summary_file
+        self.json_file = json_file
+        self.buffer_size = buffer_size
+        self.number_of_files = 0
+        self.rejected_files = 0
+        self.failed_files = 0
+        # Time spent writing (the writer thread runs outside of the stages
+        # of gradmap_profile)
+        self.write_time = 0.0
+
+        self._parquet = None
+        if summary_file is not None:
+            summary_format = SUMMARY_FORMATS.get(os.path.splitext(summary_file)[1].lower())
+            if summary_format is None:
+                raise ValueError(f'Unknown summary format {summary_file!r}, use one of {sorted(SUMMARY_FORMATS)}')
+            if summary_format == 'parquet':
+                # Fails before any file is processed if pyarrow is missing
+                import pyarrow
+                import pyarrow.parquet
+                self._parquet = pyarrow
+
+        self._manager = multiprocessing.Manager() if shared else None
+        self.queue = self._manager.Queue() if shared else queue.Queue()
+        self._pending = {}
+        self._next_index = 0
+        self._thread = None
+        self._error = None
+        self._closed = False
+
+        self._report = None
+        if report_file is not None:
+            # Sections go to a temporary file next to the report until the
+            # header is known
+            self._report_body = report_file + '.part'
+            self._report = open(self._report_body, 'w', encoding='utf-8', buffering=buffer_size)
+
+        self._summary = None
+        self._summary_rows = []
+        self._summary_fields = None
+
+        self._json = None
+        if json_file is not None:
+            self._json = open(json_file, 'w', encoding='utf-8', buffering=buffer_size)
+            self._json_lines = json_file.lower().endswith('.jsonl')
+            if not self._json_lines:
+                self._json.write('[')
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+        return False
+
+    def parts(self):
+        # Record parts needed by the outputs of this writer
+        outputs = {'report': self.report_file, 'summary': self.summary_file, 'json': self.json_file}
+        return tuple(part for part in RECORD_PARTS if outputs[part] is not None)
+
+    def start(self):
+        # Drains the queue in a thread until close()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._listen, name='gradmap-writer', daemon=True)
+            self._thread.start()
+
+    def _listen(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            try:
+                self.write(record)
+            except Exception as error:
+                # Raised again by close(), the queue keeps being drained
+                self._error = self._error or error
+
+    def write(self, record):
+        # Writes the record and all following ones that already arrived,
+        # records without index are written at once
+        if record.get('index') is None:
+            self._write(record)
+            return
+
+        self._pending[record['index']] = record
+        while self._next_index in self._pending:
+            self._write(self._pending.pop(self._next_index))
+            self._next_index += 1
+
+    def _write(self, record):
+        start = time.perf_counter()
+        self.number_of_files += 1
+        self.rejected_files += record['rejected']
+        self.failed_files += record['failed']
+
+        if self._report is not None:
+            self._report.write('\n'.join(record['report']) + '\n')
+        if self.summary_file is not None and record['summary']:
+            self._write_summary(record['summary'])
+        if self._json is not None:
+            text = json.dumps(record['json'], ensure_ascii=False)
+            if self._json_lines:
+                self._json.write(text + '\n')
+            else:
+                self._json.write(('\n' if self.number_of_files == 1 else ',\n') + text)
+        self.write_time += time.perf_counter() - start
+
+    def _write_summary(self, rows):
+        if self._parquet is not None:
+            self._summary_rows.extend(rows)
+            if len(self._summary_rows) >= PARQUET_ROW_GROUP:
+                self._flush_parquet()
+            return
+
+        if self._summary is None:
+            self._summary_fields = list(rows[0])
+            self._summary = open(self.summary_file, 'w', newline='', encoding='utf-8', buffering=self.buffer_size)
+            self._summary_writer = csv.DictWriter(self._summary, fieldnames=self._summary_fields, lineterminator='\n')
+            self._summary_writer.writeheader()
+        self._summary_writer.writerows(rows)
+
+    def _flush_parquet(self):
+        # Row group of the buffered rows
+        table = self._parquet.Table.from_pandas(pd.DataFrame(self._summary_rows), preserve_index=False)
+        if self._summary is None:
+            self._summary = self._parquet.parquet.ParquetWriter(self.summary_file, table.schema)
+        self._summary.write_table(table)
+        self._summary_rows = []
+
+    def close(self, header=None):
+        # Stops the thread after the queued records are written, puts the
+        # header in front of the report and closes all files. header is a
+        # list of lines or a function of the writer returning them (file
+        # counts are final when it is called). Records still missing
+        # (indexes never received) do not hold back later ones.
+        if self._closed:
+            return
+        self._closed = True
+
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+        for index in sorted(self._pending):
+            self._write(self._pending.pop(index))
+
+        if self._summary_rows:
+            self._flush_parquet()
+        if self._summary is not None:
+            self._summary.close()
+        elif self.summary_file is not None:
+            # No station was processed, the summary is left empty
+            open(self.summary_file, 'w').close()
+
+        if self._json is not None:
+            if not self._json_lines:
+                self._json.write('\n]\n' if self.number_of_files else ']\n')
+            self._json.close()
+
+        if self._report is not None:
+            self._report.close()
+            with open(self.report_file, 'w', encoding='utf-8', buffering=self.buffer_size) as report:
+                if callable(header):
+                    header = header(self)
+                if header:
+                    report.write('\n'.join(header) + '\n')
+                with open(self._report_body, encoding='utf-8') as body:
+                    shutil.copyfileobj(body, report, self.buffer_size)
+            os.remove(self._report_body)
+
+        if self._manager is not None:
+            self._manager.shutdown()
+
+        if self._error is not None:
+            raise self._error
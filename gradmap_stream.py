@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming processing of CG5 readings while the measurement is running.
+
+Readings are taken line by line from any iterable of lines (a pipe, a file
+being appended, a serial port wrapper) and the gradient_linear model is
+updated after every reading. CG6 output is not parsed (its records have
+another layout and units), CG6 files are processed after the measurement.
+
+Usage: python -m gradmap_stream [options] input_file   (- for stdin)
+"""
+
+import argparse
+import contextlib
+import sys
+import time
+
+import numpy as np
+from scipy.linalg import LinAlgError, cho_factor, cho_solve
+
+from gradmap_calc import CG5_COLUMNS, SIGNIFICANCE_LEVELS, convert_CG5_units, level_gradient, measurement_datetime, students_inverse
+
+
+# Columns of CG5_COLUMNS holding integers, 'points' stays a string
+CG5_INTEGER_COLUMNS = {'duration', 'rejected', 'hour', 'minute', 'second', 'year', 'month', 'day'}
+
+
+def parse_CG5_record(line):
+    # One CG5 data line as a dictionary with the parse_CG5 schema (plus
+    # 'datetime' and 'datenum'), None for header, comment and blank lines
+    if isinstance(line, bytes):
+        line = line.decode('latin-1')
+
+    line = line.strip()
+    if not line or line.startswith('/'):
+        return None
+
+    fields = line.replace(':', ' ').replace('/', ' ').split()
+    if len(fields) != len(CG5_COLUMNS):
+        raise ValueError(f'CG5 record has {len(fields)} fields instead of {len(CG5_COLUMNS)}: {line!r}')
+
+    record = {}
+    for name, value in zip(CG5_COLUMNS, fields):
+        if name == 'points':
+            record[name] = value
+        elif name in CG5_INTEGER_COLUMNS:
+            record[name] = int(value)
+        else:
+            record[name] = float(value)
+
+    record['datetime'] = measurement_datetime(record['year'], record['month'], record['day'],
+                                              record['hour'], record['minute'], record['second'])
+    record['datenum'] = record['datetime'].astype(np.int64) / (24 * 3600)
+
+    return record
+
+
+def follow_file(input_file, poll_interval=0.5, timeout=None):
+    # Lines of a file that is still being written (like tail -f), starting
+    # from its beginning. Stops after timeout seconds without new data, never
+    # when timeout is None.
+    with open(input_file, 'rb') as file:
+        pending = b''
+        last_data = time.monotonic()
+
+        while True:
+            chunk = file.readline()
+            if chunk:
+                last_data = time.monotonic()
+                pending += chunk
+                # Only complete lines are passed on
+                if pending.endswith(b'\n'):
+                    yield pending
+                    pending = b''
+                continue
+
+            if timeout is not None and time.monotonic() - last_data > timeout:
+                if pending:
+                    yield pending
+                return
+            time.sleep(poll_interval)
+
+
+def replay_CG5(input_file, speed=60.0):
+    # Fake serial source: lines of a recorded CG5 file released with the
+    # timing of the measurement, speed times faster than real time (None
+    # for no delay). Header lines are released immediately.
+    previous = None
+
+    with open(input_file, 'rb') as file:
+        for line in file:
+            record = parse_CG5_record(line)
+
+            if record is not None and speed and previous is not None:
+                delay = (record['datetime'] - previous).astype(float) / speed
+                if delay > 0:
+                    time.sleep(delay)
+
+            if record is not None:
+                previous = record['datetime']
+
+            yield line
+
+
+class StreamingGradient:
+    # gradient_linear model (gravity of each point relative to the first
+    # point, constant and quadratic drift in time since the first reading)
+    # kept as weighted normal equations and updated by every reading.
+    #
+    # Weights are 1/ERR, the gradient_linear factor mean(ERR)/SD00^2 is
+    # uniform and applied to the RMSE only (parameters and their covariance
+    # do not depend on it). Once the normal matrix is regular its inverse is
+    # kept up to date by Sherman-Morrison rank-one updates, so a reading
+    # costs O(p^2); the inverse is refactorized only when a new point
+    # (parameter) appears. Outlier rejection is left to the final
+    # processing of the complete file.
+
+    def __init__(self, calibration_factor=None, SD_scale_information=0, significance=2, SD00=5, drift_degree=2):
+        self.calibration_factor = calibration_factor
+        self.SD_scale_information = SD_scale_information
+        self.significance = significance
+        self.SD00 = SD00
+        self.drift_degree = drift_degree
+
+        self.points = []
+        self.height_sum = []
+        self.readings_per_point = []
+        self.number_of_measurements = 0
+        self.ERR_sum = 0.0
+
+        # Normal equations of the parameters [points 2..k, constant, drift 1..D]
+        self.N = np.zeros((1 + drift_degree, 1 + drift_degree))
+        self.b = np.zeros(1 + drift_degree)
+        self.lPl = 0.0
+        self.N_inv = None
+
+        # Origin of time and gravity (first reading), keeps the sums well conditioned
+        self.time_origin = None
+        self.grav_origin = None
+        self.height_in_centimetres = None
+
+    @property
+    def number_of_parameters(self):
+        return len(self.b)
+
+    def add_record(self, record):
+        # Adds one parsed reading (parse_CG5_record) and returns the current estimate
+        if self.time_origin is None:
+            self.time_origin = record['datenum']
+            self.height_in_centimetres = record['height'] > 2
+
+        height, grav, ERR = convert_CG5_units(record['height'], record['grav'], record['SD'], self.calibration_factor,
+                                              self.SD_scale_information, self.height_in_centimetres)
+        if self.grav_origin is None:
+            self.grav_origin = grav
+
+        point = record['points']
+        if point not in self.points:
+            self._add_point(point)
+
+        code = self.points.index(point)
+        self.height_sum[code] += height
+        self.readings_per_point[code] += 1
+        self.number_of_measurements += 1
+        self.ERR_sum += ERR
+
+        # Row of the Jacobi matrix
+        k = len(self.points) - 1
+        a = np.zeros(self.number_of_parameters)
+        if code > 0:
+            a[code - 1] = 1
+        a[k] = 1
+        a[k + 1:] = (record['datenum'] - self.time_origin) ** np.arange(1, self.drift_degree + 1)
+
+        weight = 1 / ERR
+        observation = grav - self.grav_origin
+
+        self.N += weight * np.outer(a, a)
+        self.b += weight * observation * a
+        self.lPl += weight * observation**2
+
+        if self.N_inv is None:
+            self._factorize()
+        else:
+            N_inv_a = self.N_inv @ a
+            self.N_inv -= (weight / (1 + weight * a @ N_inv_a)) * np.outer(N_inv_a, N_inv_a)
+
+        return self.estimate(record)
+
+    def add_line(self, line):
+        # Adds one line of CG5 output, None for lines without a reading
+        record = parse_CG5_record(line)
+        return None if record is None else self.add_record(record)
+
+    def estimate(self, record=None):
+        # Current gradient, SD and drift degree, values are NaN while the
+        # model is not determined
+        estimate = {
+            'number_of_measurements': self.number_of_measurements,
+            'number_of_points': len(self.points),
+            'point': None if record is None else record['points'],
+            'datetime': None if record is None else record['datetime'],
+            'drift_degree': None,
+            'gradient': np.nan,
+            'std': np.nan,
+            'RMSE': np.nan,
+            'average_height': np.nan,
+        }
+
+        k = len(self.points)
+        dof = self.number_of_measurements - self.number_of_parameters - 2
+        if self.N_inv is None or k < 2 or dof <= 0:
+            return estimate
+
+        mean_weight_factor = (self.ERR_sum / self.number_of_measurements) / self.SD00**2
+
+        # Full drift model, significance of the highest drift coefficient
+        adjusted_parameters = self.N_inv @ self.b
+        vPv = max(self.lPl - adjusted_parameters @ self.b, 0)
+        SD_last = np.sqrt(vPv / dof * self.N_inv[-1, -1])
+
+        drift_degree = self.drift_degree
+        Tau = adjusted_parameters[-1] / SD_last
+        if np.abs(Tau) < students_inverse(SIGNIFICANCE_LEVELS[self.significance], self.number_of_measurements - k):
+            drift_degree -= 1
+
+        # Model without the highest drift coefficient from the inverse of the
+        # full normal matrix (Schur complement), degrees of freedom as in the
+        # gradient_linear refit
+        N_inv = self.N_inv
+        b = self.b
+        dof_correction = 2
+        if drift_degree < self.drift_degree:
+            N_inv = self.N_inv[:-1, :-1] - np.outer(self.N_inv[:-1, -1], self.N_inv[-1, :-1]) / self.N_inv[-1, -1]
+            b = self.b[:-1]
+            dof_correction = 3
+            adjusted_parameters = N_inv @ b
+            vPv = max(self.lPl - adjusted_parameters @ b, 0)
+
+        dof = self.number_of_measurements - len(b) - dof_correction
+        if dof <= 0:
+            return estimate
+
+        sigma2 = vPv / dof
+        SD_theta = np.sqrt(sigma2 * np.diag(N_inv))
+        level_height = np.asarray(self.height_sum) / np.asarray(self.readings_per_point)
+
+        estimate['drift_degree'] = drift_degree
+        estimate['RMSE'] = np.sqrt(mean_weight_factor * sigma2) * self.SD00
+        estimate['average_height'] = np.mean(level_height)
+        if k in (2, 3, 4):
+            estimate['gradient'], estimate['std'] = level_gradient(adjusted_parameters[:k - 1], SD_theta[:k - 1], level_height)
+
+        return estimate
+
+    def _add_point(self, point):
+        # New point parameter, inserted before the constant term; its column
+        # is zero in all previous readings
+        self.points.append(point)
+        self.height_sum.append(0.0)
+        self.readings_per_point.append(0)
+
+        if len(self.points) > 1:
+            position = len(self.points) - 2
+            self.N = np.insert(np.insert(self.N, position, 0, axis=0), position, 0, axis=1)
+            self.b = np.insert(self.b, position, 0)
+            self.N_inv = None
+
+    def _factorize(self):
+        # Inverse of the normal matrix once it is regular
+        if self.number_of_measurements < self.number_of_parameters:
+            return
+        try:
+            factor = cho_factor(self.N)
+        except LinAlgError:
+            return
+        self.N_inv = cho_solve(factor, np.eye(self.number_of_parameters))
+
+
+def stream_gradient(lines, **settings):
+    # Estimate after every reading of an iterable of CG5 lines
+    model = StreamingGradient(**settings)
+    for line in lines:
+        estimate = model.add_line(line)
+        if estimate is not None:
+            yield estimate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='gradmap_stream', description='Live gradient estimate from CG5 output.')
+    parser.add_argument('input_file', help="CG5 output (file being written, '-' for stdin)")
+    parser.add_argument('--follow', action='store_true', help='keep reading as the file grows')
+    parser.add_argument('--timeout', type=float, default=None, help='stop following after this many seconds without data')
+    parser.add_argument('--replay', type=float, default=None, metavar='SPEED',
+                        help='replay a recorded file with its timing, SPEED times faster than real time (0 for no delay)')
+    parser.add_argument('--calibration-factor', type=float, default=None)
+    parser.add_argument('--SD-scaling', type=int, choices=[0, 1], default=0)
+    parser.add_argument('--significance', type=int, choices=sorted(SIGNIFICANCE_LEVELS), default=2)
+    parser.add_argument('--instrument-uncertainty', type=float, default=5)
+    arguments = parser.parse_args(argv)
+
+    # Closed (files and their generators) when the stream ends, stdin is left open
+    if arguments.input_file == '-':
+        source = contextlib.nullcontext(sys.stdin.buffer)
+    elif arguments.replay is not None:
+        source = contextlib.closing(replay_CG5(arguments.input_file, arguments.replay or None))
+    elif arguments.follow:
+        source = contextlib.closing(follow_file(arguments.input_file, timeout=arguments.timeout))
+    else:
+        source = open(arguments.input_file, 'rb')
+
+    with source as lines:
+        estimates = stream_gradient(lines, calibration_factor=arguments.calibration_factor, SD_scale_information=arguments.SD_scaling,
+                                    significance=arguments.significance, SD00=arguments.instrument_uncertainty)
+
+        print(f'{"n":>5} {"point":>10} {"time":>20} {"gradient":>10} {"SD":>6} {"drift":>5} {"RMSE":>6}', flush=True)
+        try:
+            for estimate in estimates:
+                drift_degree = '' if estimate['drift_degree'] is None else estimate['drift_degree']
+                print(f"{estimate['number_of_measurements']:5d} {estimate['point']:>10} {str(estimate['datetime']):>20} "
+                      f"{estimate['gradient']:10.1f} {estimate['std']:6.1f} {drift_degree:>5} {estimate['RMSE']:6.1f}", flush=True)
+        except KeyboardInterrupt:
+            pass
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Parameter sweeps of the processing settings over a campaign.
+
+Every file is parsed once per worker task and kept in memory
+(gradmap_cache.MemoryCache) while the settings of the grid are processed.
+The calibration factor and SD00 do not change the adjustment of gradients,
+their values are applied by rescaling the results of one fit. The grid is
+processed in a process pool, the result is a tidy table with one row per
+file, settings and station (gradient) or gravity difference.
+
+Usage: python -m gradmap_sweep [options] --grid significance=1,2,3 --grid calibration_factor=1,1.0005 input_file [input_file ...]
+"""
+
+import argparse
+import itertools
+import math
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from gradmap_batch import PROCESSING_MODES, collect_input_files, processing_arguments
+from gradmap_cache import MemoryCache
+from gradmap_calc import check_drift_degree
+
+
+# Settings applied by rescaling a fit instead of refitting, per mode.
+# Readings are multiplied by the calibration factor and the gradient models
+# are linear in the readings: parameters, residuals and RMSE scale with it,
+# rejections and tests are scale free. SD00 scales weights and a posteriori
+# RMSE inversely, results do not depend on it. gravity_differences reduces
+# the readings by the normal gradient first, the calibration factor is
+# refitted there.
+RESCALED_SETTINGS = {
+    'linear': ('calibration_factor', 'SD00'),
+    'function': ('calibration_factor', 'SD00'),
+    'differences': ('SD00',),
+}
+
+# Result columns of every mode and the power of the calibration factor they
+# scale with
+RESULT_COLUMNS = {
+    'linear': {'gradient': 1, 'std': 1, 'RMSE': 1, 'rejected_measurements': 0, 'drift_polynomial_degree': 0},
+    'function': {'A': 1, 'B': 1, 'SD_A': 1, 'SD_B': 1, 'cov_A_B': 2, 'RMSE': 1, 'rejected_measurements': 0,
+                 'gradient_polynomial_degree': 0, 'drift_polynomial_degree': 0},
+    'differences': {'reference': 0, 'station': 0, 'difference': 1, 'std': 1, 'RMSE': 1, 'rejected_measurements': 0,
+                    'drift_polynomial_degree': 0},
+}
+
+
+def grid_combinations(grid):
+    # Settings of every point of the grid (dict of setting -> values)
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def result_rows(output, mode):
+    # Result columns of one processed file
+    if mode == 'linear':
+        return [{'gradient': output['gradient']['average_gradient_num'], 'std': output['gradient']['std_num'],
+                 'RMSE': output['processing']['RMSE'],
+                 'rejected_measurements': output['processing']['number_of_rejected_measurements'],
+                 'drift_polynomial_degree': int(output['drift']['polynomial_degree'])}]
+
+    if mode == 'function':
+        gradient = output['gradient']
+        return [{'A': gradient['gradient_param'][0], 'B': gradient['gradient_param'][1],
+                 'SD_A': gradient['std'][0], 'SD_B': gradient['std'][1], 'cov_A_B': gradient['cov'],
+                 'RMSE': output['processing']['RMSE'],
+                 'rejected_measurements': output['processing']['number_of_rejected_measurements'],
+                 'gradient_polynomial_degree': int(gradient['polynomial_degree']), 'drift_polynomial_degree': int(output['drift']['polynomial_degree'])}]
+
+    points = [str(point) for point in output['stationinfo']['points']]
+    return [{'reference': points[0], 'station': station, 'difference': difference, 'std': std,
+             'RMSE': output['processing']['RMSE'], 'rejected_measurements': output['processing']['rejected_measurements'],
+             'drift_polynomial_degree': int(output['drift']['polynomial_degree'])}
+            for station, difference, std in zip(points[1:], output['adjusted']['differences'], output['adjusted']['std'])]
+
+
+def rescaled_rows(rows, mode, factor):
+    # Result rows of a fit with the readings multiplied by factor
+    powers = RESULT_COLUMNS[mode]
+    return [{name: value * factor**powers[name] if powers.get(name) else value for name, value in row.items()} for row in rows]
+
+
+def sweep_file(input_file, mode, settings, fitted, rescaled):
+    # All settings of one file (one worker task): the file is parsed once,
+    # every fitted combination is processed without calibration factor (and
+    # SD00 of the fixed settings), then expanded to the rescaled combinations
+    # and the fixed calibration factor
+    cache = MemoryCache(settings.get('cache'))
+    rows = []
+
+    # Rescaled settings missing from the fixed ones are fitted with their
+    # first grid value (the result does not depend on it)
+    fixed = {**(rescaled[0] if rescaled else {}), **settings}
+
+    for fitted_settings in fitted:
+        run_settings = {**fixed, **fitted_settings, 'cache': cache}
+        if 'calibration_factor' in RESCALED_SETTINGS[mode]:
+            run_settings['calibration_factor'] = None
+        try:
+            results = result_rows(PROCESSING_MODES[mode](input_file, **processing_arguments(mode, run_settings)), mode)
+            error = None
+        except Exception:
+            results = [{}]
+            error = traceback.format_exc().strip().splitlines()[-1]
+
+        for rescaled_settings in rescaled:
+            calibration_factor = rescaled_settings.get('calibration_factor', settings.get('calibration_factor'))
+            if calibration_factor is None or 'calibration_factor' not in RESCALED_SETTINGS[mode]:
+                calibration_factor = 1
+            for result in rescaled_rows(results, mode, calibration_factor):
+                rows.append({'file': input_file, **fitted_settings, **rescaled_settings, **result, 'error': error})
+
+    return rows
+
+
+def parameter_sweep(input_files, mode, grid, settings=None, max_workers=None):
+    # Processes every file with every combination of the grid (dict of
+    # setting -> list of values, settings are the fixed ones) and returns a
+    # tidy DataFrame: one row per file, combination and result row, the
+    # settings of the grid and the result columns of the mode. Files are
+    # processed in a pool; when there are fewer files than workers the
+    # fitted combinations of a file are split over several tasks (each
+    # parses the file once).
+    if mode not in PROCESSING_MODES:
+        raise ValueError(f'Unknown processing mode {mode!r}, use one of {sorted(PROCESSING_MODES)}')
+    settings = dict(settings or {})
+    for drift_degree in grid.get('drift_degree', [settings.get('drift_degree', 2)]):
+        check_drift_degree(drift_degree)
+    file_list = collect_input_files(input_files)
+
+    fitted = grid_combinations({name: values for name, values in grid.items() if name not in RESCALED_SETTINGS[mode]})
+    rescaled = grid_combinations({name: values for name, values in grid.items() if name in RESCALED_SETTINGS[mode]})
+
+    workers = max_workers or os.cpu_count() or 1
+    splits = min(len(fitted), max(1, math.ceil(workers / max(len(file_list), 1))))
+    tasks = [(input_file, fitted[part::splits]) for input_file in file_list for part in range(splits)]
+
+    if workers == 1 or len(tasks) <= 1:
+        blocks = [sweep_file(input_file, mode, settings, part, rescaled) for input_file, part in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(sweep_file, input_file, mode, settings, part, rescaled) for input_file, part in tasks]
+            blocks = [future.result() for future in futures]
+
+    table = pd.DataFrame([row for block in blocks for row in block],
+                         columns=['file'] + list(grid) + list(RESULT_COLUMNS[mode]) + ['error'])
+    order = ['file'] + list(grid)
+    return table.sort_values(order, kind='stable').reset_index(drop=True)
+
+
+def grid_value(text):
+    # Grid values from the command line: None, integers, floats or text
+    if text == 'None':
+        return None
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='gradmap_sweep', description='Processing of files over a grid of settings.')
+    parser.add_argument('input_files', nargs='+', help='input file(s), glob patterns are expanded')
+    parser.add_argument('--mode', choices=sorted(PROCESSING_MODES), default='linear')
+    parser.add_argument('--grid', action='append', default=[], metavar='SETTING=V1,V2,...',
+                        help='values of a setting, e.g. significance=1,2,3 or calibration_factor=1,1.0005 (repeatable)')
+    parser.add_argument('--instrument', choices=['CG5', 'CG6'], default='CG5')
+    parser.add_argument('--header-lines', type=int, default=None)
+    parser.add_argument('--SD-scaling', type=int, choices=[0, 1], default=0)
+    parser.add_argument('--measured-levels', type=int, default=None)
+    parser.add_argument('--units', type=int, choices=[1, 2], default=None, help='height units: 1 cm, 2 m (default: detected from the file)')
+    parser.add_argument('--significance', type=int, choices=[1, 2, 3], default=2)
+    parser.add_argument('--instrument-uncertainty', type=float, default=5)
+    parser.add_argument('--calibration-factor', type=float, default=None)
+    parser.add_argument('--max-iterations', type=int, default=1)
+    parser.add_argument('-o', '--output', default=None, help='CSV file of the results (default: print)')
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    arguments = parser.parse_args(argv)
+
+    settings = {'header_lines': arguments.header_lines, 'instrument_type': arguments.instrument,
+                'SD_scale_information': arguments.SD_scaling, 'number_of_measured_levels': arguments.measured_levels,
+                'input_units_option': arguments.units, 'significance': arguments.significance,
+                'SD00': arguments.instrument_uncertainty, 'calibration_factor': arguments.calibration_factor,
+                'max_iterations': arguments.max_iterations}
+
+    grid = {}
+    for entry in arguments.grid:
+        name, separator, values = entry.partition('=')
+        if not separator or not values:
+            parser.error(f'--grid {entry!r} is not SETTING=V1,V2,...')
+        grid[name.strip()] = [grid_value(value.strip()) for value in values.split(',')]
+
+    file_list = collect_input_files(arguments.input_files)
+    if not file_list:
+        print('input files are missing', file=sys.stderr)
+        return 2
+
+    try:
+        table = parameter_sweep(file_list, arguments.mode, grid, settings, arguments.jobs)
+    except ValueError as error:
+        parser.error(str(error))
+    if arguments.output:
+        table.to_csv(arguments.output, index=False)
+    else:
+        print(table.to_string(index=False))
+    return 1 if table['error'].notna().any() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import numpy as np
+
+# Sensor height above the value in the height column: CG5 readings refer to
+# 21.1 cm below the measured height, CG6 sensors are 6.58 cm above it
+CG5_SENSOR_OFFSET = -0.211
+CG6_SENSOR_OFFSET = 0.0658
+
+CG5_HEADER = """
+/\tCG-5 SOFTWARE VER.:  4.2
+/\tCG-5 SURVEY
+/\tSurvey name:   \tsynthetic
+/\tInstrument S/N:\t{serial_number}
+/\tClient:        \tgradmap
+/\tOperator:      \tgradmap
+/\tDate:          \t{date:%Y/%m/%d}
+/\tTime:          \t{date:%H:%M:%S}
+/\tLONG:        \t17.1000000 E
+/\tLAT:         \t48.4000000 N
+/\tZONE:        \t34
+/\tGMT DIFF.:   \t-2.0
+
+/\tCG-5 SETUP PARAMETERS
+/\tGref:\t\t0.000
+/\tGcal1:\t\t{gcal1}
+/\tTiltxS:\t\t724.726
+/\tTiltyS:\t\t668.686
+/\tTiltxO:\t\t-59.315
+/\tTiltyO:\t\t119.540
+/\tTempco:\t\t-0.140
+/\tDrift:\t\t0.226
+/\tDriftTime Start:\t{date:%H:%M:%S}
+/\tDriftDate Start:\t{date:%Y/%m/%d}
+
+/\tCG-5 OPTIONS
+/\tTide Correction:    YES
+/\tCont. Tilt:         YES
+/\tAuto Rejection:     YES
+/\tTerrain Corr.:       NO
+/\tSeismic Filter:     YES
+/\tRaw Data:            NO
+/------LINE-----STATION-----ALT.------GRAV.---SD.--TILTX--TILTY-TEMP---TIDE---DUR-REJ-----TIME----DEC.TIME+DATE--TERRAIN---DATE
+"""
+
+CG6_HEADER = """/\t\tCG-6 Survey
+/\tSurvey Name:\tsynthetic
+/\tInstrument Serial Number:\t{serial_number}
+/\tCreated:\t{date:%Y-%m-%d %H:%M:%S}
+/\tOperator:\tgradmap
+/\tGcal1 [mGal]:\t{gcal1}
+/\tGoff Factor [mGal]:\t9796.3269
+/\tGcal2 [mGal/V]:\t1.000000
+/\tGoff [ADU]:\t0.000000
+/\tX Scale [arc-sec/V]:\t66.99
+/\tY Scale [arc-sec/V]:\t66.87
+/\tTemperature Coefficient [mGal/mK]:\t0.1308
+/\tDrift Rate [mGal/day]:\t0.1980
+/\tDrift Zero Time:\t{date:%Y-%m-%d %H:%M:%S}
+/\tFirmware Version:\t1.3.0
+
+/Station\tDate\tTime\tCorrGrav\tLine\tStdDev\tStdErr\tRawGrav\tX\tY\tSensorTemp\tTideCorr\tTiltCorr\tTempCorr\tDriftCorr\tMeasurDur\tInstrHeight\tLatUser\tLonUser\tElevUser\tLatGPS\tLonGPS\tElevGPS\tCorrections[drift-temp-na-tide-tilt]
+"""
+
+
+def gradient_setups(level_heights=(0.25, 1.30), visits=8):
+    # Setup sequence of a vertical gradient station: levels (sensor heights
+    # in metres above the mark) measured in turn, visits setups in total.
+    # Returns point names, point index and sensor height of every setup.
+    levels = np.arange(visits) % len(level_heights)
+    names = [str(level + 1) for level in range(len(level_heights))]
+    return names, levels, np.asarray(level_heights, dtype=float)[levels]
+
+
+def line_setups(number_of_points, repeats=2, sensor_height=0.2):
+    # Setup sequence of a gravity line: points measured there and back
+    # repeats times (A B C ... C B A B C ...), names 1001, 1002, ...
+    forth = np.arange(number_of_points)
+    sequence = [forth]
+    for repeat in range(1, repeats):
+        sequence.append(forth[::-1][1:] if repeat % 2 else forth[1:])
+    points = np.concatenate(sequence)
+    names = [str(1001 + point) for point in range(number_of_points)]
+    return names, points, np.full(len(points), sensor_height)
+
+
+def synthetic_survey(names, setup_points, setup_heights, point_gravity=None, gradient=-308.6, gradient_quadratic=0.0,
+                     readings_per_setup=5, reading_interval=70, setup_interval=300, drift=(300.0, -100.0), noise=5.0,
+                     number_of_spikes=0, spike_size=100.0, tares=(), start='2023-07-18T08:00:00', seed=0):
+    # Readings of a survey in μGal, metres and datetime64 with the truth used
+    # to generate them. A reading of point p at sensor height h (m) is
+    #     G_p + gradient h + gradient_quadratic h^2 + drift(t) + tares + noise
+    # with drift(t) = sum(drift[j] t^(j+1)) in days since the first reading
+    # (μGal/day^j), tares as (hours since start, jump in μGal) steps,
+    # normal noise of SD noise and number_of_spikes readings shifted by
+    # +-spike_size.
+    rng = np.random.default_rng(seed)
+    setup_points = np.asarray(setup_points)
+    number_of_setups = len(setup_points)
+    if point_gravity is None:
+        point_gravity = np.zeros(len(names))
+    point_gravity = np.asarray(point_gravity, dtype=float)
+
+    points = np.repeat(setup_points, readings_per_setup)
+    height = np.repeat(np.asarray(setup_heights, dtype=float), readings_per_setup)
+    number_of_readings = len(points)
+
+    seconds = (np.arange(number_of_readings) * reading_interval
+               + np.repeat(np.arange(number_of_setups) * setup_interval, readings_per_setup))
+    datetime = np.datetime64(start, 's') + seconds.astype('timedelta64[s]')
+    days = seconds / 86400
+
+    drift_signal = sum(coefficient * days**(degree + 1) for degree, coefficient in enumerate(drift))
+    tare_signal = np.zeros(number_of_readings)
+    for hours, jump in tares:
+        tare_signal[seconds >= hours * 3600] += jump
+
+    grav = (point_gravity[points] + gradient * height + gradient_quadratic * height**2
+            + drift_signal + tare_signal + rng.normal(0, noise, number_of_readings))
+
+    spikes = rng.choice(number_of_readings, size=min(number_of_spikes, number_of_readings), replace=False)
+    grav[spikes] += spike_size * rng.choice([-1, 1], size=len(spikes))
+
+    return {
+        'points': np.asarray(names)[points],
+        'height': height,
+        'grav': grav,
+        'SD': np.full(number_of_readings, noise) * rng.uniform(0.8, 1.2, number_of_readings),
+        'datetime': datetime,
+        'truth': {
+            'point_gravity': dict(zip(names, point_gravity)),
+            'gradient': gradient,
+            'gradient_quadratic': gradient_quadratic,
+            'drift': tuple(drift),
+            'tares': tuple(tares),
+            'spikes': np.sort(spikes),
+        },
+    }
+
+
+def write_CG5(path, survey, serial_number='40983', gcal1=7953.615):
+    # CG5 text export of a synthetic survey (grav, SD in mGal, height in cm)
+    number_of_readings = len(survey['grav'])
+    datetime = survey['datetime']
+    date = np.datetime_as_string(datetime, unit='D')
+    clock = np.char.partition(np.datetime_as_string(datetime, unit='s'), 'T')[:, 2]
+    height = (survey['height'] - CG5_SENSOR_OFFSET) * 100
+    grav = 5000 + survey['grav'] / 1000
+    decimal_time = datetime.astype(np.int64) / 86400 + 25569
+
+    rows = [f' 0.0000000 {point:>12} {h:9.4f} {g:10.3f} {sd:5.3f}   -1.0    1.2 -2.98 0.119  60   0 {c}     {dt:11.5f}    0.0000  {d.replace("-", "/")}'
+            for point, h, g, sd, c, dt, d in zip(survey['points'], height, grav, survey['SD'] / 1000, clock, decimal_time, date)]
+
+    with open(path, 'w', newline='\r\n') as file:
+        file.write(CG5_HEADER.format(serial_number=serial_number, gcal1=gcal1, date=datetime[0].astype(object)))
+        file.write('\n'.join(rows) + '\n')
+
+    return number_of_readings
+
+
+def write_CG6(path, survey, serial_number='0172', gcal1=8226.1107):
+    # CG6 (CG-6 Survey) export of a synthetic survey, InstrHeight in metres
+    number_of_readings = len(survey['grav'])
+    datetime = survey['datetime']
+    date = np.datetime_as_string(datetime, unit='D')
+    clock = np.char.partition(np.datetime_as_string(datetime, unit='s'), 'T')[:, 2]
+    height = survey['height'] - CG6_SENSOR_OFFSET
+    grav = 5000 + survey['grav'] / 1000
+    SE = survey['SD'] / 1000
+
+    rows = [f'{point}\t{d}\t{c}\t{g:.4f}\t0\t{se * np.sqrt(60):.4f}\t{se:.4f}\t{g + 0.01:.4f}\t-1.0\t1.2\t0.00012\t0.0500\t0.0000\t0.0000'
+            f'\t0.0000\t60\t{h:.4f}\t48.2000\t17.1000\t150.00\t48.2001\t17.1002\t151.2\t11011'
+            for point, d, c, g, se, h in zip(survey['points'], date, clock, grav, SE, height)]
+
+    with open(path, 'w') as file:
+        file.write(CG6_HEADER.format(serial_number=serial_number, gcal1=gcal1, date=datetime[0].astype(object)))
+        file.write('\n'.join(rows) + '\n')
+
+    return number_of_readings
@@ -0,0 +1,131 @@
+from functools import lru_cache
+
+import numpy as np
+
+from gradmap_profile import stage
+
+
+# Longman (1959) constants in cgs units: gravitational constant, masses of
+# the Moon and Sun, eccentricity of the lunar orbit, ratio of mean motions
+# of the Sun and Moon, mean distances of the Moon and Sun, equatorial radius
+# of the Earth, inclination of the lunar orbit to the ecliptic and obliquity
+# of the ecliptic
+MU = 6.670e-8
+MOON_MASS = 7.3537e25
+SUN_MASS = 1.993e33
+MOON_ECCENTRICITY = 0.05490
+MEAN_MOTION_RATIO = 0.074804
+MOON_DISTANCE = 3.84402e10
+SUN_DISTANCE = 1.495e13
+EARTH_RADIUS = 6.378270e8
+MOON_INCLINATION = 0.08979719
+OBLIQUITY = 0.4093146162
+
+# Gravimetric factor 1 + h - 3/2 k of the elastic Earth (Love numbers
+# h = 0.612, k = 0.303)
+GRAVIMETRIC_FACTOR = 1 + 0.612 - 1.5 * 0.303
+
+# Epoch of the astronomical arguments, 1899-12-31 12:00 UT, and the length
+# of a Julian century in seconds
+EPOCH = np.datetime64('1899-12-31T12:00:00', 's')
+CENTURY = 36525 * 86400
+
+# Polynomial coefficients (rad, per Julian century) of the mean longitudes
+# of the Moon (s), lunar perigee (p), Sun (h), lunar ascending node (N) and
+# solar perigee (p1), and of the eccentricity of the Earth's orbit (e1)
+ARGUMENTS = {
+    's': (4.72000889397, 8399.70927456, 3.45575191895e-05, 3.49065850399e-08),
+    'p': (5.83515162814, 71.0180412089, 1.80108282532e-04, 1.74532925199e-07),
+    'h': (4.88162798259, 628.331950894, 5.23598775598e-06, 0.0),
+    'N': (4.52360161181, -33.757146295, 3.6264063347e-05, 3.39369576777e-08),
+    'p1': (4.90822941839, 0.0300025492114, 7.85398163397e-06, 5.3329504922e-08),
+    'e1': (0.01675104, -0.00004180, -0.000000126, 0.0),
+}
+
+
+@lru_cache(maxsize=366)
+def daily_ephemeris(day):
+    # Astronomical arguments at 0 h UT of the day (numpy datetime64[D] as
+    # string) and their rates per second. Within a day the arguments are
+    # linear to better than 1e-13 rad, so readings of all files of the same
+    # day are evaluated from one cached entry.
+    T = (np.datetime64(day, 's') - EPOCH).astype(np.int64) / CENTURY
+    powers = np.array([1, T, T**2, T**3])
+    rates = np.array([0, 1, 2 * T, 3 * T**2]) / CENTURY
+    return {name: (float(np.dot(coefficients, powers)), float(np.dot(coefficients, rates)))
+            for name, coefficients in ARGUMENTS.items()}
+
+
+def ephemeris(datetime):
+    # Astronomical arguments of UTC datetime64 readings as arrays, from the
+    # cached entries of their days
+    datetime = np.asarray(datetime, dtype='datetime64[s]')
+    days = datetime.astype('datetime64[D]')
+    seconds = (datetime - days).astype(np.int64)
+
+    arguments = {name: np.empty(datetime.shape) for name in ARGUMENTS}
+    for day in np.unique(days):
+        rows = days == day
+        for name, (value, rate) in daily_ephemeris(str(day)).items():
+            arguments[name][rows] = value + rate * seconds[rows]
+    return arguments
+
+
+def longman_tide(datetime, latitude, longitude, height=0.0):
+    # Vertical tidal acceleration of the Moon and Sun (Longman 1959) in μGal
+    # at UTC datetime64 readings, latitude and longitude in degrees (east
+    # positive) and height in metres; all arguments broadcast. The value is
+    # the tide correction added to a reading (instrument TIDE columns).
+    with stage('tide', rows=np.size(datetime)):
+        arguments = ephemeris(datetime)
+        s, p, h, N, p1, e1 = (arguments[name] for name in ('s', 'p', 'h', 'N', 'p1', 'e1'))
+        seconds = (np.asarray(datetime, dtype='datetime64[s]') - np.asarray(datetime, dtype='datetime64[D]')).astype(np.int64)
+
+        latitude = np.radians(latitude)
+        e, m, i, omega = MOON_ECCENTRICITY, MEAN_MOTION_RATIO, MOON_INCLINATION, OBLIQUITY
+
+        # Inclination of the lunar orbit to the equator, right ascension of
+        # its intersection A with the equator and longitude of A in the orbit
+        cos_I = np.cos(omega) * np.cos(i) - np.sin(omega) * np.sin(i) * np.cos(N)
+        I = np.arccos(cos_I)
+        sin_I = np.sin(I)
+        nu = np.arcsin(np.sin(i) * np.sin(N) / sin_I)
+        cos_alpha = np.cos(N) * np.cos(nu) + np.sin(N) * np.sin(nu) * np.cos(omega)
+        sin_alpha = np.sin(omega) * np.sin(N) / sin_I
+        xi = N - 2 * np.arctan(sin_alpha / (1 + cos_alpha))
+
+        # Hour angle of the mean Sun at the place, right ascension of the
+        # meridian from A (chi) and from the vernal equinox (chi1)
+        t = np.radians(15 * (seconds / 3600 - 12) + np.asarray(longitude, dtype=float))
+        chi = t + h - nu
+        chi1 = t + h
+
+        # Longitudes of the Moon in its orbit from A and of the Sun in the
+        # ecliptic
+        sigma = s - xi
+        l = (sigma + 2 * e * np.sin(s - p) + 1.25 * e**2 * np.sin(2 * (s - p))
+             + 3.75 * m * e * np.sin(s - 2 * h + p) + 11 / 8 * m**2 * np.sin(2 * (s - h)))
+        l1 = h + 2 * e1 * np.sin(h - p1)
+
+        # Zenith angles of the Moon and Sun
+        cos_theta = (sin_I * np.sin(latitude) * np.sin(l)
+                     + np.cos(latitude) * (np.cos(I / 2)**2 * np.cos(l - chi) + np.sin(I / 2)**2 * np.cos(l + chi)))
+        cos_phi = (np.sin(omega) * np.sin(latitude) * np.sin(l1)
+                   + np.cos(latitude) * (np.cos(omega / 2)**2 * np.cos(l1 - chi1) + np.sin(omega / 2)**2 * np.cos(l1 + chi1)))
+
+        # Inverse distances of the Moon and Sun
+        a = 1 / (MOON_DISTANCE * (1 - e**2))
+        inverse_R = (1 / MOON_DISTANCE + a * e * np.cos(s - p) + a * e**2 * np.cos(2 * (s - p))
+                     + 15 / 8 * a * m * e * np.cos(s - 2 * h + p) + a * m**2 * np.cos(2 * (s - h)))
+        a1 = 1 / (SUN_DISTANCE * (1 - e1**2))
+        inverse_D = 1 / SUN_DISTANCE + a1 * e1 * np.cos(h - p1)
+
+        # Distance of the place from the centre of the Earth (cm)
+        r = EARTH_RADIUS / np.sqrt(1 + 0.006738 * np.sin(latitude)**2) + 100 * np.asarray(height, dtype=float)
+
+        g_moon = (MU * MOON_MASS * r * inverse_R**3 * (3 * cos_theta**2 - 1)
+                  + 1.5 * MU * MOON_MASS * r**2 * inverse_R**4 * (5 * cos_theta**3 - 3 * cos_theta))
+        g_sun = MU * SUN_MASS * r * inverse_D**3 * (3 * cos_phi**2 - 1)
+
+        # Gal to μGal
+        return (g_moon + g_sun) * GRAVIMETRIC_FACTOR * 1e6
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Time-lapse gravity processing of repeated surveys of the same benchmarks.
+
+Every epoch is processed with gravity_differences (one or more files) and
+its gravity differences are kept in a store indexed by station and epoch.
+A new epoch is processed on its own, changes between epochs are computed
+from the store without reprocessing earlier epochs.
+
+Usage: python -m gradmap_timelapse STORE add EPOCH input_file [input_file ...]
+       python -m gradmap_timelapse STORE changes [--baseline EPOCH] [-o changes.csv]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from gradmap_batch import process_files
+
+
+# Columns of the store, one row per station and epoch (gravity difference to
+# the reference point of the survey)
+STORE_COLUMNS = ['epoch', 'epoch_date', 'reference', 'station', 'difference', 'std', 'number_of_files', 'files']
+
+# Columns of the changes between epochs
+CHANGE_COLUMNS = ['reference', 'station', 'from_epoch', 'to_epoch', 'from_date', 'to_date', 'change', 'std', 'days']
+
+# File formats of an epoch in the store; parquet needs pyarrow (or fastparquet)
+STORE_FORMATS = {'csv': '.csv', 'parquet': '.parquet'}
+
+# Index of the store, epoch dates by epoch name (epochs are sorted without
+# loading their tables)
+INDEX_FILE = 'epochs.json'
+
+
+class TimeLapseStore:
+    # Directory with one table per epoch. Epochs are written once and never
+    # rewritten when another epoch is added, the index (station x epoch) is
+    # built when the tables are loaded. The dates of the epochs are kept in
+    # a small index file next to the tables.
+
+    def __init__(self, directory, file_format='csv'):
+        if file_format not in STORE_FORMATS:
+            raise ValueError(f'Unknown store format {file_format!r}, use one of {sorted(STORE_FORMATS)}')
+        self.directory = os.path.abspath(directory)
+        self.file_format = file_format
+        os.makedirs(self.directory, exist_ok=True)
+
+    def epochs(self):
+        # Stored epochs, sorted by their date
+        epochs = []
+        for name in os.listdir(self.directory):
+            root, extension = os.path.splitext(name)
+            if extension in STORE_FORMATS.values() and not name.startswith('.tmp'):
+                epochs.append(root)
+
+        # Epochs missing from the index (stores written without one) are
+        # dated from their table
+        dates = self._read_index()
+        for epoch in epochs:
+            if epoch not in dates:
+                dates[epoch] = self.load_epoch(epoch)['epoch_date'].iloc[0]
+        return sorted(epochs, key=lambda epoch: (pd.Timestamp(dates[epoch]), epoch))
+
+    def __contains__(self, epoch):
+        return any(os.path.exists(self._path(epoch, file_format)) for file_format in STORE_FORMATS)
+
+    def load_epoch(self, epoch):
+        for file_format in STORE_FORMATS:
+            path = self._path(epoch, file_format)
+            if os.path.exists(path):
+                if file_format == 'parquet':
+                    table = pd.read_parquet(path)
+                else:
+                    table = pd.read_csv(path, dtype={'epoch': str, 'reference': str, 'station': str, 'files': str})
+                table['epoch_date'] = pd.to_datetime(table['epoch_date'])
+                return table
+        raise KeyError(f'Epoch {epoch!r} is not in the store')
+
+    def save_epoch(self, table):
+        # Written to a temporary file and renamed, an interrupted run leaves
+        # no partial epoch behind
+        epoch = str(table['epoch'].iloc[0])
+        path = self._path(epoch, self.file_format)
+        temporary = os.path.join(self.directory, '.tmp' + os.path.basename(path))
+        if self.file_format == 'parquet':
+            table.to_parquet(temporary, index=False)
+        else:
+            table.to_csv(temporary, index=False)
+        os.replace(temporary, path)
+
+        dates = self._read_index()
+        dates[epoch] = pd.Timestamp(table['epoch_date'].iloc[0]).isoformat()
+        self._write_index(dates)
+
+    def remove_epoch(self, epoch):
+        for file_format in STORE_FORMATS:
+            path = self._path(epoch, file_format)
+            if os.path.exists(path):
+                os.remove(path)
+
+        dates = self._read_index()
+        if dates.pop(epoch, None) is not None:
+            self._write_index(dates)
+
+    def table(self):
+        # All epochs indexed by (reference, station, epoch)
+        epochs = self.epochs()
+        if not epochs:
+            return pd.DataFrame(columns=STORE_COLUMNS).set_index(['reference', 'station', 'epoch'])
+        table = pd.concat([self.load_epoch(epoch) for epoch in epochs], ignore_index=True)
+        return table.set_index(['reference', 'station', 'epoch']).sort_index()
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE)) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, dates):
+        path = os.path.join(self.directory, INDEX_FILE)
+        temporary = os.path.join(self.directory, '.tmp' + INDEX_FILE)
+        with open(temporary, 'w') as file:
+            json.dump(dates, file, indent=1, sort_keys=True)
+        os.replace(temporary, path)
+
+    def _path(self, epoch, file_format):
+        if not epoch or os.sep in epoch or (os.altsep and os.altsep in epoch):
+            raise ValueError(f'Invalid epoch name {epoch!r}')
+        return os.path.join(self.directory, epoch + STORE_FORMATS[file_format])
+
+
+def epoch_table(epoch, outputs, filenames):
+    # Store rows of one epoch from gravity_differences outputs. Stations
+    # measured against the same reference point in several files are
+    # combined by their inverse variance weighted mean.
+    rows = []
+    dates = []
+    for output, filename in zip(outputs, filenames):
+        # Point IDs as in the file, measuredpoints is rounded for the report
+        measured_points = [str(point) for point in output['stationinfo']['points']]
+        dates.append(output['time']['no_outliers'])
+        for station, difference, std in zip(measured_points[1:], output['adjusted']['differences'], output['adjusted']['std']):
+            rows.append({'reference': measured_points[0], 'station': station,
+                         'difference': difference, 'std': std, 'files': os.path.basename(filename)})
+
+    if not rows:
+        raise ValueError(f'Epoch {epoch!r} has no gravity differences')
+
+    differences = pd.DataFrame(rows)
+    differences['weight'] = 1 / np.square(differences['std'])
+    differences['weighted_difference'] = differences['weight'] * differences['difference']
+
+    grouped = differences.groupby(['reference', 'station'], sort=True)
+    table = grouped[['weight', 'weighted_difference']].sum()
+    table['difference'] = table['weighted_difference'] / table['weight']
+    table['std'] = 1 / np.sqrt(table['weight'])
+    table['number_of_files'] = grouped.size()
+    table['files'] = grouped['files'].agg(';'.join)
+    table = table.reset_index()
+
+    # Epoch date is the mean time of all accepted readings
+    all_dates = np.concatenate(dates).astype('datetime64[s]').astype(np.int64)
+    table['epoch'] = epoch
+    table['epoch_date'] = pd.Timestamp(int(all_dates.mean()), unit='s')
+
+    return table[STORE_COLUMNS]
+
+
+def process_epoch(epoch, input_files, settings=None, max_workers=None):
+    # gravity_differences of all files of one epoch (in parallel), fails if
+    # any file fails so that no incomplete epoch is stored
+    settings = settings or {}
+    results = sorted(process_files(input_files, 'differences', settings, max_workers), key=lambda result: result['index'])
+
+    failed = [result for result in results if result['error'] is not None]
+    if failed:
+        messages = '\n'.join(f"{result['filename']}: {result['error'].strip().splitlines()[-1]}" for result in failed)
+        raise ValueError(f'Processing of epoch {epoch!r} failed:\n{messages}')
+
+    return epoch_table(epoch, [result['output'] for result in results], [result['filename'] for result in results])
+
+
+def add_epoch(store, epoch, input_files, settings=None, max_workers=None, overwrite=False):
+    # Processes a new epoch into the store, stored epochs are not touched
+    if epoch in store and not overwrite:
+        raise ValueError(f'Epoch {epoch!r} is already in the store')
+
+    table = process_epoch(epoch, input_files, settings, max_workers)
+    if overwrite:
+        store.remove_epoch(epoch)
+    store.save_epoch(table)
+    return table
+
+
+def epoch_changes(table, baseline=None):
+    # Gravity changes between epochs of every station (same reference point),
+    # epochs are independent surveys so their variances add. Changes are to
+    # the previous epoch of the station, or to the baseline epoch if given.
+    # An empty store has no changes.
+    if table.empty:
+        return pd.DataFrame(columns=CHANGE_COLUMNS)
+    table = table.reset_index().sort_values(['reference', 'station', 'epoch_date', 'epoch'])
+    keys = ['reference', 'station']
+
+    if baseline is None:
+        previous = table.groupby(keys)[['epoch', 'epoch_date', 'difference', 'std']].shift(1)
+    else:
+        base = table[table['epoch'] == baseline]
+        if base.empty:
+            raise ValueError(f'Baseline epoch {baseline!r} is not in the store')
+        previous = table[keys].merge(base[keys + ['epoch', 'epoch_date', 'difference', 'std']], on=keys, how='left')
+        previous.index = table.index
+        previous.loc[table['epoch'] == baseline, ['epoch', 'epoch_date', 'difference', 'std']] = np.nan
+
+    changes = pd.DataFrame({
+        'reference': table['reference'],
+        'station': table['station'],
+        'from_epoch': previous['epoch'],
+        'to_epoch': table['epoch'],
+        'from_date': pd.to_datetime(previous['epoch_date']),
+        'to_date': table['epoch_date'],
+        'change': table['difference'] - previous['difference'].astype(float),
+        'std': np.sqrt(np.square(table['std']) + np.square(previous['std'].astype(float))),
+    })
+    changes = changes.dropna(subset=['change'])
+    changes['days'] = (changes['to_date'] - changes['from_date']).dt.total_seconds() / 86400
+
+    return changes.reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='gradmap_timelapse', description='Time-lapse processing of gravity differences.')
+    parser.add_argument('store', help='directory of the epoch store')
+    parser.add_argument('--format', choices=sorted(STORE_FORMATS), default='csv', help='file format of new epochs (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='process a new epoch')
+    add.add_argument('epoch', help='name of the epoch, e.g. 2024-05')
+    add.add_argument('input_files', nargs='+', help='input file(s) of the epoch')
+    add.add_argument('--instrument', choices=['CG5', 'CG6'], default='CG5')
+    add.add_argument('--header-lines', type=int, default=None)
+    add.add_argument('--SD-scaling', type=int, choices=[0, 1], default=0)
+    add.add_argument('--significance', type=int, choices=[1, 2, 3], default=2)
+    add.add_argument('--calibration-factor', type=float, default=None)
+    add.add_argument('--max-iterations', type=int, default=1)
+    add.add_argument('--overwrite', action='store_true', help='reprocess an epoch already in the store')
+    add.add_argument('-j', '--jobs', type=int, default=None)
+
+    changes = commands.add_parser('changes', help='gravity changes between stored epochs')
+    changes.add_argument('--baseline', default=None, help='epoch all changes refer to (default: previous epoch)')
+    changes.add_argument('-o', '--output', default=None, help='CSV file of the changes (default: print)')
+
+    arguments = parser.parse_args(argv)
+    store = TimeLapseStore(arguments.store, arguments.format)
+
+    if arguments.command == 'add':
+        settings = {'header_lines': arguments.header_lines, 'instrument_type': arguments.instrument,
+                    'SD_scale_information': arguments.SD_scaling, 'significance': arguments.significance,
+                    'calibration_factor': arguments.calibration_factor, 'max_iterations': arguments.max_iterations}
+        try:
+            table = add_epoch(store, arguments.epoch, arguments.input_files, settings, arguments.jobs, arguments.overwrite)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 1
+        print(table.to_string(index=False))
+        return 0
+
+    try:
+        table = epoch_changes(store.table(), arguments.baseline)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+    if arguments.output:
+        table.to_csv(arguments.output, index=False)
+    else:
+        print(table.to_string(index=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())